@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import counter, gauge, start_http_server_from_env
+
+_DONE = object()
+
+QUEUE_DEPTH = gauge('auth_logs_pipeline_queue_depth', "Chunks waiting in the queue after each stage", ('stage',))
+STAGE_ROWS = counter('auth_logs_pipeline_rows_total', "Rows leaving each pipeline stage", ('stage',))
+
+
+class StageStats:
+    """Counters for one pipeline stage and the queue feeding the next one"""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.busy_time = 0.0
+        self.blocked_time = 0.0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.depth_samples = 0
+        self.depth_total = 0
+
+    def record_depth(self, depth):
+        self.queue_depth = depth
+        QUEUE_DEPTH.set(depth, stage=self.name)
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self.depth_samples += 1
+        self.depth_total += depth
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'busy_s': round(self.busy_time, 3),
+            'blocked_s': round(self.blocked_time, 3),
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'avg_queue_depth': round(self.depth_total / self.depth_samples, 1) if self.depth_samples else 0,
+        }
+
+
+class AsyncIngestPipeline:
+    """source -> parse -> enrich -> batch writer, connected by bounded queues.
+
+    The source is an async iterable yielding lists of items (log lines or
+    ready-made rows). parse and enrich are optional callables applied per
+    item; parse may return None to drop an item. Chunks of rows flow between
+    stages through asyncio queues of at most queue_size chunks, and batches
+    are written by the writers (BatchWriter-like objects with write) on a
+    thread pool. When MySQL stalls the writer stage stops
+    draining its queue, the queues fill and `await put()` blocks the
+    upstream stages, so sources slow down instead of buffering without
+    limit. blocked_s in stats() shows how long each stage waited on a full
+    downstream queue; queue depths are in chunks. A batch whose write()
+    returns False fails run() with RuntimeError and is not counted as written.
+    """
+
+    def __init__(self, source, writers, parse=None, enrich=None, queue_size=64,
+                 batch_size=1000, max_latency=1.0):
+        self.source = source
+        self.writers = writers if isinstance(writers, (list, tuple)) else [writers]
+        self.parse = parse
+        self.enrich = enrich
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.stages = [StageStats('source')]
+        if parse:
+            self.stages.append(StageStats('parse'))
+        if enrich:
+            self.stages.append(StageStats('enrich'))
+        self.stages.append(StageStats('write'))
+        self.started_at = None
+
+    async def _put(self, queue, item, stats):
+        start = time.monotonic()
+        await queue.put(item)
+        stats.blocked_time += time.monotonic() - start
+        stats.record_depth(queue.qsize())
+
+    async def _run_source(self, out_queue, stats):
+        async for chunk in self.source:
+            stats.rows += len(chunk)
+            STAGE_ROWS.inc(len(chunk), stage=stats.name)
+            await self._put(out_queue, chunk, stats)
+        await out_queue.put(_DONE)
+
+    async def _run_transform(self, function, in_queue, out_queue, stats, drop_none):
+        while True:
+            chunk = await in_queue.get()
+            if chunk is _DONE:
+                await out_queue.put(_DONE)
+                return
+            start = time.monotonic()
+            if drop_none:
+                result = [row for row in map(function, chunk) if row is not None]
+            else:
+                result = [function(row) for row in chunk]
+            stats.busy_time += time.monotonic() - start
+            stats.rows += len(result)
+            STAGE_ROWS.inc(len(result), stage=stats.name)
+            if result:
+                await self._put(out_queue, result, stats)
+            # Yield so a CPU-bound transform cannot starve the other stages
+            await asyncio.sleep(0)
+
+    async def _run_writer(self, in_queue, stats):
+        loop = asyncio.get_running_loop()
+        idle_writers = asyncio.Queue()
+        for writer in self.writers:
+            idle_writers.put_nowait(writer)
+        pending = set()
+
+        def write(writer, rows):
+            # write() reports on every batch it flushes; add_many() would swallow a failed full batch
+            if not writer.write(rows):
+                raise RuntimeError(f"Writer failed to store a batch of {len(rows)} rows")
+
+        async def write_batch(rows):
+            writer = await idle_writers.get()
+            start = time.monotonic()
+            try:
+                await loop.run_in_executor(executor, write, writer, rows)
+            finally:
+                stats.busy_time += time.monotonic() - start
+                idle_writers.put_nowait(writer)
+            # Only batches the writer reports as stored count as written
+            stats.rows += len(rows)
+            STAGE_ROWS.inc(len(rows), stage=stats.name)
+
+        with ThreadPoolExecutor(max_workers=len(self.writers)) as executor:
+            try:
+                done = False
+                while not done:
+                    batch = []
+                    deadline = None
+                    while len(batch) < self.batch_size:
+                        timeout = None if deadline is None else max(deadline - loop.time(), 0)
+                        try:
+                            chunk = await asyncio.wait_for(in_queue.get(), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                        if chunk is _DONE:
+                            done = True
+                            break
+                        if deadline is None:
+                            deadline = loop.time() + self.max_latency
+                        batch.extend(chunk)
+                    if batch:
+                        # Holding at most one in-flight batch per writer keeps memory bounded
+                        start = time.monotonic()
+                        while len(pending) >= len(self.writers):
+                            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                            # Retrieve every outcome, then fail run() with the first write failure
+                            errors = [task.exception() for task in finished if not task.cancelled()]
+                            errors = [error for error in errors if error is not None]
+                            if errors:
+                                raise errors[0]
+                        stats.blocked_time += time.monotonic() - start
+                        pending.add(asyncio.ensure_future(write_batch(batch)))
+                if pending:
+                    await asyncio.gather(*pending)
+            except BaseException:
+                for task in pending:
+                    task.cancel()
+                # Retrieve the other outcomes so none is reported as never retrieved
+                await asyncio.gather(*pending, return_exceptions=True)
+                raise
+
+    async def run(self):
+        """Run all stages until the source is exhausted and every batch is written"""
+        self.started_at = time.monotonic()
+        queues = [asyncio.Queue(self.queue_size) for _ in range(len(self.stages) - 1)]
+        tasks = [asyncio.ensure_future(self._run_source(queues[0], self.stages[0]))]
+        position = 1
+        for function, drop_none in ((self.parse, True), (self.enrich, False)):
+            if function:
+                tasks.append(asyncio.ensure_future(self._run_transform(
+                    function, queues[position - 1], queues[position], self.stages[position], drop_none)))
+                position += 1
+        tasks.append(asyncio.ensure_future(self._run_writer(queues[-1], self.stages[-1])))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        """Return per-stage counters and overall throughput"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        written = self.stages[-1].rows
+        return {
+            'elapsed_s': round(elapsed, 3),
+            'rows_per_second': round(written / elapsed, 1) if elapsed else 0.0,
+            'stages': {stage.name: stage.as_dict() for stage in self.stages},
+        }
+
+
+async def simulated_source(simulator, rate, duration_seconds=None, chunk_size=100):
+    """Yield chunks of simulator rows paced to `rate` rows/s against absolute deadlines"""
+    start = time.monotonic()
+    produced = 0
+    while duration_seconds is None or time.monotonic() - start < duration_seconds:
+        chunk = [simulator.build_log_row() for _ in range(chunk_size)]
+        produced += chunk_size
+        yield chunk
+        # Sleeping until the ideal time of the next chunk avoids accumulating drift
+        delay = start + produced / rate - time.monotonic()
+        await asyncio.sleep(max(delay, 0))
+
+
+async def file_source(path, chunk_lines=1000, follow_file=False):
+    """Yield chunks of lines from a log file, reading on a worker thread"""
+    from auth_log_ingest import follow
+
+    lines = follow(path, stop_at_eof=not follow_file)
+
+    def read_chunk():
+        chunk = []
+        for line, _, _ in lines:
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                break
+        return chunk
+
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, read_chunk)
+        if not chunk:
+            return
+        yield chunk
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the asyncio ingest pipeline")
+    parser.add_argument('--simulate', type=float, metavar='RATE', help="simulated rows per second")
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--file', help="auth.log to ingest instead of simulating")
+    parser.add_argument('--writers', type=int, default=1, help="concurrent writer connections")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    start_http_server_from_env()
+
+    from batch_writer import BatchWriter
+    from database import create_connection
+    from rollups import RollupMaintainer
+
+    writers = []
+    for _ in range(args.writers):
+        writer = BatchWriter(create_connection(), batch_size=args.batch_size, max_latency=None)
+        writer.before_commit.append(RollupMaintainer())
+        writers.append(writer)
+
+    if args.file:
+        from auth_log_parser import AuthLogParser
+        pipeline = AsyncIngestPipeline(file_source(args.file), writers,
+                                       parse=AuthLogParser().parse_line, batch_size=args.batch_size)
+    else:
+        from ssh_log_simulator import SSHLogSimulator
+        simulator = SSHLogSimulator(rollups=False)
+        pipeline = AsyncIngestPipeline(simulated_source(simulator, args.simulate or 1000, args.duration),
+                                       writers, batch_size=args.batch_size)
+
+    try:
+        asyncio.run(pipeline.run())
+    finally:
+        for writer in writers:
+            writer.close()
+            writer.connection.close()
+        if not args.file:
+            simulator.cleanup()
+    print(pipeline.stats())
@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import time
+from auth_log_parser import AuthLogParser
+from batch_writer import BatchWriter
+from dedup import Deduplicator, event_hash
+from metrics import counter
+from profiling import NULL_PROFILER
+from rollups import RollupMaintainer
+
+READ_CHUNK_SIZE = 1 << 20
+
+LINES_READ = counter('auth_logs_ingest_lines_total', "auth.log lines read, by whether they held an sshd event",
+                     ('result',))
+
+
+def load_checkpoint(path):
+    """Load a saved {inode, offset} checkpoint, or None if there is none"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_checkpoint(path, inode, offset):
+    """Atomically persist the read position"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'inode': inode, 'offset': offset}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def follow(path, inode=None, offset=0, poll_interval=0.5, stop=None, stop_at_eof=False):
+    """Generator with `tail -F` semantics yielding (line, inode, offset_after_line).
+
+    Only complete lines are yielded. When the file is rotated (its inode
+    changes) the old file is drained to EOF before switching to the new one;
+    a truncated file is re-read from the start. A stored offset is only
+    honoured when the inode still matches. With stop_at_eof the generator
+    ends at the first EOF instead of waiting for more data.
+    """
+    f = None
+    current_inode = None
+    position = 0
+    pending = b''
+
+    while stop is None or not stop():
+        if f is None:
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                time.sleep(poll_interval)
+                continue
+            current_inode = os.fstat(f.fileno()).st_ino
+            position = offset if current_inode == inode else 0
+            f.seek(position)
+            pending = b''
+
+        chunk = f.read(READ_CHUNK_SIZE)
+        if chunk:
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for raw in lines:
+                position += len(raw) + 1
+                yield raw.decode('utf-8', 'replace'), current_inode, position
+            continue
+
+        # At EOF: check for rotation or truncation before waiting
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        if stat is not None and stat.st_ino != current_inode:
+            f.close()
+            f = None
+            inode = None
+            continue
+        if stat is not None and stat.st_size < position + len(pending):
+            f.seek(0)
+            position = 0
+            pending = b''
+            continue
+        if stop_at_eof:
+            break
+        time.sleep(poll_interval)
+
+    if f is not None:
+        f.close()
+
+
+class AuthLogIngester:
+    """Follow an auth.log and write parsed sshd events to auth_logs.
+
+    The checkpoint is saved after every committed batch and records the byte
+    offset just past the last line in that batch, so a restart resumes
+    exactly where committed data ends.
+    """
+
+    def __init__(self, log_path='/var/log/auth.log', checkpoint_path='auth_log.checkpoint',
+                 connection=None, batch_size=1000, max_latency=1.0, year=None, rollups=True,
+                 detector=None, profiler=None, dedup=True, spool_dir=None):
+        self.log_path = log_path
+        self.checkpoint_path = checkpoint_path
+        # Imported here so the command line starts without loading mysql.connector
+        from database import create_connection
+        self.connection = connection or create_connection()
+        # Lines re-read after a crash or a bad checkpoint are dropped by their hash, which includes
+        # the line's inode and offset so identical lines logged in the same second are all kept
+        self.deduplicator = Deduplicator() if dedup else None
+        # A spooled batch is durable, so the checkpoint moves past it and the replayer stores it later
+        self.spool = None
+        self.replayer = None
+        if spool_dir:
+            from spool import Spool, start_replayer
+            self.spool = Spool(spool_dir)
+            self.replayer = start_replayer(self.spool, create_connection, rollups=rollups, detector=detector)
+        self.writer = BatchWriter(self.connection, batch_size=batch_size, max_latency=max_latency,
+                                  deduplicator=self.deduplicator, spool=self.spool,
+                                  connect=None if connection else create_connection)
+        # A spooled batch is as durable as a committed one, so both move the checkpoint
+        self.writer.after_commit.append(self._save_position)
+        self.writer.after_spool.append(self._save_position)
+        self.profiler = profiler or NULL_PROFILER
+        self.writer.profiler = self.profiler
+        if rollups:
+            self.writer.before_commit.append(RollupMaintainer())
+        if detector:
+            detector.attach(self.writer)
+        self.parser = AuthLogParser(year)
+        self.inode = None
+        self.offset = 0
+        self.lines_read = 0
+        self.rows_parsed = 0
+        self._running = False
+
+    def _save_position(self, rows):
+        """Persist the read position once a batch is committed"""
+        if self.inode is not None:
+            save_checkpoint(self.checkpoint_path, self.inode, self.offset)
+
+    def run(self, poll_interval=0.5, follow_file=True):
+        """Ingest until interrupted (or until EOF when follow_file is False)"""
+        checkpoint = load_checkpoint(self.checkpoint_path) or {}
+        self._running = True
+        parse_line = self.parser.parse_line
+        writer = self.writer
+        deduplicator = self.deduplicator
+        parse_stage = self.profiler.stage('parse')
+        self.profiler.start()
+        start = time.monotonic()
+
+        def should_stop():
+            return not self._running
+
+        print(f"Ingesting {self.log_path} from offset {checkpoint.get('offset', 0)}...")
+        lines = follow(self.log_path, checkpoint.get('inode'), checkpoint.get('offset', 0),
+                       poll_interval=poll_interval, stop=should_stop,
+                       stop_at_eof=not follow_file)
+        # 'read' includes waiting for new lines when following the file
+        lines = self.profiler.iterate('read', lines)
+        try:
+            for line, inode, offset in lines:
+                self.lines_read += 1
+                with parse_stage:
+                    row = parse_line(line)
+                LINES_READ.inc(result='skipped' if row is None else 'parsed')
+                if row is not None and deduplicator:
+                    row = row + (event_hash(row, f"{inode}:{offset}"),)
+                # Advancing the position and buffering the row must not be split by a timer flush
+                with writer.lock:
+                    self.inode = inode
+                    self.offset = offset
+                    if row is not None:
+                        writer.add(row)
+                        self.rows_parsed += 1
+        except KeyboardInterrupt:
+            print("\nIngestion stopped by user")
+        finally:
+            self.close()
+            elapsed = time.monotonic() - start
+            print(f"Read {self.lines_read} lines, stored {self.rows_parsed} events "
+                  f"({self.lines_read / elapsed if elapsed else 0:.0f} lines/s)")
+            if self.deduplicator:
+                print(f"Dedup: {self.deduplicator.stats()}")
+            if self.profiler.enabled:
+                self.profiler.stop()
+                print(self.profiler.report())
+
+    def stop(self):
+        """Ask a running ingester to stop after the current line"""
+        self._running = False
+
+    def close(self):
+        """Flush pending rows, save the checkpoint and release the connection"""
+        # Only record trailing unparsed lines if the final batch made it in
+        if self.writer.close():
+            self._save_position(None)
+        if self.replayer:
+            self.replayer.stop()
+            self.replayer.writer.close()
+            print(f"Spool: {self.spool.stats()}, replayed {self.replayer.replayed_rows} events")
+            self.spool.close()
+        if self.connection:
+            self.connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tail an auth.log into the auth_logs table")
+    parser.add_argument('log_path', nargs='?', default='/var/log/auth.log')
+    parser.add_argument('--checkpoint', default='auth_log.checkpoint')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--once', action='store_true', help="stop at end of file instead of following")
+    parser.add_argument('--detect', nargs=2, type=int, metavar=('FAILURES', 'SECONDS'),
+                        help="alert on FAILURES failed logins per IP or username within SECONDS")
+    parser.add_argument('--no-dedup', action='store_true', help="skip content-hash deduplication")
+    parser.add_argument('--spool', default=os.getenv('SPOOL_DIR'), metavar='DIR',
+                        help="keep batches on disk while MySQL is down and replay them (default $SPOOL_DIR)")
+    parser.add_argument('--profile', action='store_true', help="print a per-stage time breakdown at exit")
+    parser.add_argument('--profile-output', help="also write a profile: *.prof for cProfile, "
+                                                 "anything else for collapsed stacks")
+    args = parser.parse_args()
+
+    from metrics import start_http_server_from_env
+    from profiling import get_profiler
+    start_http_server_from_env()
+    detector = None
+    if args.detect:
+        from brute_force_detector import BruteForceDetector
+        detector = BruteForceDetector(failures=args.detect[0], window_seconds=args.detect[1],
+                                      callback=lambda alert: print(f"ALERT: {alert}"))
+    profiler = get_profiler(args.profile, args.profile_output)
+    ingester = AuthLogIngester(args.log_path, args.checkpoint, batch_size=args.batch_size,
+                               detector=detector, profiler=profiler, dedup=not args.no_dedup,
+                               spool_dir=args.spool)
+    ingester.run(follow_file=not args.once)
@@ -0,0 +1,130 @@
+import datetime
+import re
+
+# Classic syslog prefix: "Jun 18 06:40:40 host sshd[1234]: message"
+SYSLOG_LINE = re.compile(
+    r'^(?P<month>[A-Z][a-z]{2}) +(?P<day>\d{1,2}) (?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2}) '
+    r'\S+ sshd\[\d+\]: (?P<message>.*)$'
+)
+# RFC 3339 prefix used by newer rsyslog defaults: "2025-06-18T06:40:40.123456+00:00 host sshd[1234]: message"
+ISO_LINE = re.compile(
+    r'^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})T(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})'
+    r'\S* \S+ sshd\[\d+\]: (?P<message>.*)$'
+)
+
+ACCEPTED = re.compile(r'^Accepted (?P<method>\S+) for (?P<username>\S+) from (?P<ip>\S+) port \d+')
+FAILED = re.compile(
+    r'^Failed (?P<method>\S+) for (?:invalid user )?(?P<username>\S*) from (?P<ip>\S+) port \d+'
+)
+INVALID_USER = re.compile(r'^Invalid user (?P<username>\S*) from (?P<ip>\S+)')
+
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+
+# Syslog stamps are in the logging host's local time, which may be ahead of ours
+FUTURE_SLACK = datetime.timedelta(days=1)
+
+
+class AuthLogParser:
+    """Turn sshd auth.log lines into auth_logs rows.
+
+    Rows are tuples in batch_writer.AUTH_LOG_COLUMNS order. Real logs carry
+    no password, so encrypted_password is always None. Classic syslog lines
+    have no year, so it is inferred per line: it starts at year (default:
+    the year of latest, itself defaulting to now), moves to the next year
+    when the month goes backwards, as at New Year, and a line that would be
+    later than latest is dated a year earlier instead. Without an explicit
+    latest, it follows the clock for files being followed live.
+    """
+
+    def __init__(self, year=None, latest=None):
+        self.follow_clock = latest is None
+        self.latest = latest or datetime.datetime.now()
+        self.year = year or self.latest.year
+        self._last_month = None
+        # Consecutive lines usually share a timestamp, so remember the last one
+        self._last_stamp = None
+        self._last_datetime = None
+
+    def _syslog_datetime(self, match):
+        """Date a classic syslog line, inferring its year"""
+        month = MONTHS[match.group('month')]
+        if self._last_month is not None and month < self._last_month:
+            self.year += 1
+        self._last_month = month
+        fields = (month, int(match.group('day')),
+                  int(match.group('hour')), int(match.group('minute')), int(match.group('second')))
+        try:
+            timestamp = datetime.datetime(self.year, *fields)
+            if timestamp > self.latest + FUTURE_SLACK:
+                if self.follow_clock:
+                    self.latest = datetime.datetime.now()
+                if timestamp > self.latest + FUTURE_SLACK:
+                    self.year -= 1
+                    timestamp = datetime.datetime(self.year, *fields)
+        except ValueError:
+            # Feb 29 dated to a year that is not a leap year
+            return None
+        return timestamp
+
+    def parse_line(self, line):
+        """Parse one line, returning a row or None if it is not an sshd login event"""
+        if 'sshd[' not in line:
+            return None
+
+        match = SYSLOG_LINE.match(line)
+        if match:
+            stamp = line[:15]
+            if stamp != self._last_stamp:
+                self._last_stamp = stamp
+                self._last_datetime = self._syslog_datetime(match)
+            timestamp = self._last_datetime
+            if timestamp is None:
+                return None
+        else:
+            match = ISO_LINE.match(line)
+            if not match:
+                return None
+            stamp = line[:19]
+            if stamp != self._last_stamp:
+                self._last_stamp = stamp
+                self._last_datetime = datetime.datetime(
+                    int(match.group('year')), int(match.group('month')), int(match.group('day')),
+                    int(match.group('hour')), int(match.group('minute')), int(match.group('second'))
+                )
+            timestamp = self._last_datetime
+
+        message = match.group('message')
+        first = message[:1]
+        if first == 'A':
+            event = ACCEPTED.match(message)
+            status = 'success'
+        elif first == 'F':
+            event = FAILED.match(message)
+            status = 'failed'
+        elif first == 'I':
+            event = INVALID_USER.match(message)
+            status = 'failed'
+        else:
+            return None
+        if not event:
+            return None
+
+        return (timestamp, event.group('ip'), event.group('username'), None, status, message)
+
+    def parse_lines(self, lines):
+        """Generator yielding a row for every sshd login event in lines"""
+        parse_line = self.parse_line
+        for line in lines:
+            row = parse_line(line)
+            if row is not None:
+                yield row
+
+
+def parse_file(path, year=None, latest=None):
+    """Generator yielding rows parsed from an auth.log file"""
+    parser = AuthLogParser(year, latest)
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        yield from parser.parse_lines(f)
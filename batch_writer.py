@@ -0,0 +1,328 @@
+import threading
+import time
+from metrics import counter, histogram
+from profiling import NULL_PROFILER
+
+AUTH_LOG_COLUMNS = (
+    'timestamp', 'source_ip', 'username', 'encrypted_password', 'status', 'attempt_details'
+)
+
+INSERT_AUTH_LOG_QUERY = """
+INSERT INTO auth_logs
+(timestamp, source_ip, username, encrypted_password, status, attempt_details)
+VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+ROWS_WRITTEN = counter('auth_logs_rows_written_total', "Rows committed by batch writers", ('table',))
+WRITE_ERRORS = counter('auth_logs_write_errors_total', "Batches that failed and were rolled back", ('table',))
+EXECUTE_SECONDS = histogram('auth_logs_execute_seconds', "Time to send a batch INSERT", ('table',))
+COMMIT_SECONDS = histogram('auth_logs_commit_seconds', "Time to commit a batch", ('table',))
+FLUSH_SECONDS = histogram('auth_logs_flush_seconds',
+                          "Whole batch flush: encryption, INSERT, hooks and commit", ('table',))
+
+
+# DB-API and socket errors meaning the server is unreachable, restarting or timing out, as opposed
+# to errors in the batch itself (DataError, IntegrityError, ProgrammingError)
+CONNECTION_ERRORS = ('OperationalError', 'InterfaceError', 'PoolError', 'OSError')
+
+
+def is_connection_error(error):
+    """Whether error means the database is unavailable rather than the batch being bad"""
+    return any(cls.__name__ in CONNECTION_ERRORS for cls in type(error).__mro__)
+
+
+# Rows written with a deduplicator carry their event hash as an extra last column
+DEDUP_COLUMNS = AUTH_LOG_COLUMNS + ('event_hash',)
+
+
+def build_multi_row_insert(row_count, table='auth_logs', columns=AUTH_LOG_COLUMNS, ignore=False):
+    """Build a single INSERT statement with row_count value groups.
+
+    With ignore, rows that would duplicate a unique key are skipped.
+    """
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    return (
+        f"INSERT {'IGNORE ' if ignore else ''}INTO {table} ({', '.join(columns)}) VALUES "
+        + ', '.join([placeholders] * row_count)
+    )
+
+
+class BatchWriter:
+    """Buffer auth_logs rows and write them in batches, one commit per batch.
+
+    Rows are tuples in AUTH_LOG_COLUMNS order. A batch is flushed when it
+    reaches batch_size rows or when the oldest buffered row is older than
+    max_latency seconds, whichever comes first. Callables in before_commit
+    are called with (cursor, rows) inside the batch transaction; callables in
+    after_commit are called with the rows once each batch is committed, and
+    callables in after_spool once a batch is durable in the spool instead. With
+    an encryptor (encryption.EnvelopeEncryptor) the encrypted_password column
+    is encrypted for the whole batch just before it is written. With a
+    deduplicator (dedup.Deduplicator) rows already stored are dropped, the
+    rest are written with their event_hash, and hooks only see new rows.
+    With a spool (spool.Spool) a batch the database rejects is appended to
+    local disk instead of being dropped, and later batches go straight to
+    the spool until the connection is back; connection may then be None, and
+    connect() is used to open a new one. Setting
+    profiler to a profiling.StageProfiler times the encrypt, execute, hooks
+    and commit stages of every flush.
+    """
+
+    def __init__(self, connection, batch_size=500, max_latency=1.0, use_executemany=False,
+                 table='auth_logs', encryptor=None, deduplicator=None, spool=None, connect=None,
+                 reconnect_interval=5.0):
+        self.connection = connection
+        self.table = table
+        self.encryptor = encryptor
+        self.deduplicator = deduplicator
+        self.spool = spool
+        self.connect = connect
+        self.reconnect_interval = reconnect_interval
+        self.columns = DEDUP_COLUMNS if deduplicator else AUTH_LOG_COLUMNS
+        self.cursor = connection.cursor() if connection is not None else None
+        # Set after a failed batch: the connection is reopened before the next write
+        self.broken = connection is None
+        self.last_reconnect = None
+        self.owns_connection = False
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.use_executemany = use_executemany
+        self.buffer = []
+        self.oldest_row_time = None
+        self.lock = threading.RLock()
+        self.before_commit = []
+        self.after_commit = []
+        self.after_spool = []
+        self.profiler = NULL_PROFILER
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.errors = 0
+        self.spooled_rows = 0
+        self.flush_time_total = 0.0
+        self.flush_time_max = 0.0
+        self.last_flush_time = 0.0
+        self.started_at = time.monotonic()
+
+        self._closed = threading.Event()
+        self._timer = None
+        if max_latency:
+            self._timer = threading.Thread(target=self._flush_timer, daemon=True)
+            self._timer.start()
+
+    def add(self, row):
+        """Buffer a single row, flushing if the batch is full"""
+        with self.lock:
+            if not self.buffer:
+                self.oldest_row_time = time.monotonic()
+            self.buffer.append(row)
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+
+    def add_many(self, rows):
+        """Buffer several rows, flushing full batches as they fill"""
+        with self.lock:
+            for row in rows:
+                self.add(row)
+
+    def flush(self):
+        """Write all buffered rows in one transaction"""
+        with self.lock:
+            if not self.buffer:
+                return True
+            rows = self.buffer
+            self.buffer = []
+            self.oldest_row_time = None
+
+            if self.broken and not self._reconnect():
+                if self.spool is None:
+                    print(f"Error writing batch of {len(rows)} log entries: no database connection")
+                    self.errors += 1
+                    WRITE_ERRORS.inc(table=self.table)
+                return self._spool(rows, encrypted=False)
+
+            profiler = self.profiler
+            deduplicator = self.deduplicator
+            encrypted = False
+            start = time.monotonic()
+            try:
+                if deduplicator:
+                    with profiler.stage('dedup'):
+                        rows = deduplicator.filter(rows, self._existing_hashes)
+                if rows and self.encryptor:
+                    with profiler.stage('encrypt'):
+                        rows = self.encryptor.encrypt_rows(rows)
+                    encrypted = True
+                if rows:
+                    execute_start = time.monotonic()
+                    with profiler.stage('execute'):
+                        inserted = self._write(rows)
+                    while deduplicator and rows and inserted < len(rows):
+                        # Stored duplicates got past the prefilter (e.g. after a restart): the unique
+                        # index skipped them, but the hooks must not count them, so redo the batch.
+                        # Another writer may store more of them meanwhile, hence the loop.
+                        self.connection.rollback()
+                        remaining = deduplicator.recheck(rows, self._existing_hashes)
+                        if len(remaining) == len(rows):
+                            raise RuntimeError(f"{len(rows) - inserted} rows were skipped "
+                                               f"but are not stored duplicates")
+                        rows = remaining
+                        if rows:
+                            with profiler.stage('execute'):
+                                inserted = self._write(rows)
+                    EXECUTE_SECONDS.observe(time.monotonic() - execute_start, table=self.table)
+                if rows and self.before_commit:
+                    with profiler.stage('hooks'):
+                        for callback in self.before_commit:
+                            callback(self.cursor, rows)
+                commit_start = time.monotonic()
+                with profiler.stage('commit'):
+                    self.connection.commit()
+                COMMIT_SECONDS.observe(time.monotonic() - commit_start, table=self.table)
+                if deduplicator:
+                    deduplicator.committed(rows)
+            except Exception as e:
+                print(f"Error writing batch of {len(rows)} log entries: {e}")
+                self.errors += 1
+                WRITE_ERRORS.inc(table=self.table)
+                try:
+                    self.connection.rollback()
+                except Exception:
+                    pass
+                if not is_connection_error(e):
+                    return False
+                self.broken = True
+                return self._spool(rows, encrypted)
+
+            elapsed = time.monotonic() - start
+            self.rows_written += len(rows)
+            self.batches_written += 1
+            self.flush_time_total += elapsed
+            self.flush_time_max = max(self.flush_time_max, elapsed)
+            self.last_flush_time = elapsed
+            ROWS_WRITTEN.inc(len(rows), table=self.table)
+            FLUSH_SECONDS.observe(elapsed, table=self.table)
+            for callback in self.after_commit:
+                callback(rows)
+            return True
+
+    def write(self, rows):
+        """Write rows as one transaction now, returning whether it succeeded"""
+        with self.lock:
+            if not self.flush():
+                return False
+            self.buffer = list(rows)
+            self.oldest_row_time = time.monotonic()
+            return self.flush()
+
+    def _reconnect(self):
+        """Reopen the connection after a failure; with a spool, try at most every reconnect_interval"""
+        now = time.monotonic()
+        if (self.spool is not None and self.last_reconnect is not None
+                and now - self.last_reconnect < self.reconnect_interval):
+            return False
+        self.last_reconnect = now
+        try:
+            if self.cursor is not None:
+                try:
+                    self.cursor.close()
+                except Exception:
+                    pass
+                self.cursor = None
+            if self.connect:
+                if self.connection is not None and self.owns_connection:
+                    try:
+                        self.connection.close()
+                    except Exception:
+                        pass
+                self.connection = self.connect()
+                self.owns_connection = True
+            elif hasattr(self.connection, 'reconnect'):
+                self.connection.reconnect(attempts=1, delay=0)
+            if self.connection is None:
+                return False
+            self.cursor = self.connection.cursor()
+        except Exception as e:
+            print(f"Error reconnecting to the database: {e}")
+            return False
+        self.broken = False
+        return True
+
+    def _spool(self, rows, encrypted):
+        """Append a batch the database could not take to the spool, returning whether it is durable"""
+        if self.spool is None or not rows:
+            return False
+        try:
+            if self.encryptor and not encrypted:
+                rows = self.encryptor.encrypt_rows(rows)
+            # Rows keep their event_hash, if they have one, so the replayer drops the same duplicates
+            if not self.spool.append([row[:len(DEDUP_COLUMNS)] for row in rows]):
+                return False
+        except Exception as e:
+            print(f"Error spooling batch of {len(rows)} log entries: {e}")
+            return False
+        self.spooled_rows += len(rows)
+        for callback in self.after_spool:
+            callback(rows)
+        return True
+
+    def _write(self, rows):
+        """Send rows to the database without committing and return how many were inserted"""
+        if self.deduplicator:
+            # rowcount of INSERT IGNORE counts only the rows actually inserted
+            if self.use_executemany:
+                self.cursor.executemany(build_multi_row_insert(1, self.table, self.columns, ignore=True),
+                                        rows)
+            else:
+                values = [value for row in rows for value in row]
+                self.cursor.execute(build_multi_row_insert(len(rows), self.table, self.columns, ignore=True),
+                                    values)
+        elif self.use_executemany:
+            self.cursor.executemany(INSERT_AUTH_LOG_QUERY.replace('auth_logs', self.table), rows)
+        else:
+            values = [value for row in rows for value in row]
+            self.cursor.execute(build_multi_row_insert(len(rows), self.table), values)
+        return self.cursor.rowcount
+
+    def _existing_hashes(self, hashes):
+        """Return the subset of event hashes already stored in the table"""
+        self.cursor.execute(f"SELECT event_hash FROM {self.table} WHERE event_hash IN "
+                            f"({', '.join(['%s'] * len(hashes))})", list(hashes))
+        return {bytes(row[0]) for row in self.cursor.fetchall()}
+
+    def _flush_timer(self):
+        """Flush partially filled batches once they exceed max_latency"""
+        interval = min(self.max_latency / 4, 0.25)
+        while not self._closed.wait(interval):
+            with self.lock:
+                if (self.oldest_row_time is not None
+                        and time.monotonic() - self.oldest_row_time >= self.max_latency):
+                    self.flush()
+
+    def stats(self):
+        """Return throughput and flush latency statistics"""
+        elapsed = time.monotonic() - self.started_at
+        return {
+            'rows_written': self.rows_written,
+            'batches_written': self.batches_written,
+            'errors': self.errors,
+            'spooled_rows': self.spooled_rows,
+            'buffered_rows': len(self.buffer),
+            'rows_per_second': self.rows_written / elapsed if elapsed > 0 else 0.0,
+            'avg_flush_ms': (self.flush_time_total / self.batches_written * 1000
+                             if self.batches_written else 0.0),
+            'max_flush_ms': self.flush_time_max * 1000,
+            'last_flush_ms': self.last_flush_time * 1000,
+        }
+
+    def close(self):
+        """Flush remaining rows and stop the flush timer, returning whether the flush succeeded"""
+        self._closed.set()
+        if self._timer:
+            self._timer.join()
+        flushed = self.flush()
+        if self.cursor is not None:
+            self.cursor.close()
+        if self.owns_connection and self.connection is not None:
+            self.connection.close()
+        return flushed
@@ -0,0 +1,242 @@
+import argparse
+import datetime
+import json
+import subprocess
+import sys
+import time
+from load_generator import percentile
+
+DATASET_TABLE = 'auth_logs_bench_data'
+WRITE_TABLE = 'auth_logs_bench_write'
+
+# The README's dashboard queries; the %s in failed_last_hour is one hour before the newest row
+QUERIES = {
+    'total_count': "SELECT COUNT(*) FROM {table}",
+    'status_counts': "SELECT status, COUNT(*) FROM {table} GROUP BY status",
+    'recent_entries': ("SELECT id, timestamp, source_ip, username, status FROM {table} "
+                       "ORDER BY timestamp DESC LIMIT 10"),
+    'failed_last_hour': ("SELECT timestamp, source_ip, username FROM {table} "
+                         "WHERE status = 'failed' AND timestamp > %s ORDER BY timestamp DESC"),
+    'top_source_ips': ("SELECT source_ip, COUNT(*) AS attempts FROM {table} "
+                       "GROUP BY source_ip ORDER BY attempts DESC LIMIT 5"),
+    'attempts_by_username': ("SELECT username, COUNT(*) AS attempts FROM {table} "
+                             "GROUP BY username ORDER BY attempts DESC"),
+}
+
+
+def generate_rows(count, span_seconds, seed, end=None):
+    """Yield reproducible batches of rows spread evenly over the span_seconds before end"""
+    from event_generator import EventGenerator
+    from ssh_log_simulator import PASSWORDS, USERNAMES
+
+    generator = EventGenerator(USERNAMES, PASSWORDS, attacker_share=0.3, burst_share=0.02, seed=seed)
+    end = end or datetime.datetime.now()
+    start = end - datetime.timedelta(seconds=span_seconds)
+    remaining = count
+    while remaining > 0:
+        batch = min(remaining, 100000)
+        yield generator.generate_batch(batch, start=start if remaining == count else None,
+                                       rate=count / span_seconds)
+        remaining -= batch
+
+
+def table_rows(backend, table):
+    """Exact row count of a table, or None if it does not exist"""
+    try:
+        return backend.total_count(table)
+    except Exception:
+        return None
+
+
+def seed_dataset(backend, rows, span_days=30, seed=1, reuse=True):
+    """Fill the dataset table with rows simulated events, reusing it if it already has that many"""
+    if reuse and table_rows(backend, DATASET_TABLE) == rows:
+        print(f"Reusing {DATASET_TABLE} with {rows} rows")
+        return 0.0
+
+    backend.drop_table(DATASET_TABLE)
+    backend.create_table(DATASET_TABLE)
+    print(f"Seeding {DATASET_TABLE} with {rows} rows...")
+    start = time.monotonic()
+    if backend.name == 'mysql':
+        from bulk_load import BulkLoader, local_infile_enabled
+        writer = BulkLoader(backend.connection, table=DATASET_TABLE,
+                            manage_indexes=local_infile_enabled(backend.connection), rollups=False)
+    else:
+        writer = backend.writer(DATASET_TABLE, batch_size=50000, max_latency=None)
+    for batch in generate_rows(rows, span_days * 86400, seed):
+        writer.add_many(batch)
+    writer.close()
+    backend.analyze(DATASET_TABLE)
+    elapsed = time.monotonic() - start
+    print(f"Seeded {rows} rows in {elapsed:.1f}s")
+    return elapsed
+
+
+def measure_inserts(backend, rows, seed=2, per_row_limit=5000):
+    """Return rows/s for each write path, inserting into a scratch table"""
+    from encryption import EnvelopeEncryptor
+
+    data = [row for batch in generate_rows(rows, 3600, seed) for row in batch]
+    backend.drop_table(WRITE_TABLE)
+    backend.create_table(WRITE_TABLE)
+    results = {}
+
+    def batched(subset, batch_size=5000, **options):
+        writer = backend.writer(WRITE_TABLE, batch_size=batch_size, max_latency=None, **options)
+        writer.add_many(subset)
+        writer.close()
+
+    paths = [
+        ('per_row_commit', data[:per_row_limit], lambda subset: batched(subset, batch_size=1)),
+        ('batched_insert', data, batched),
+        ('batched_insert_encrypted', data, lambda subset: batched(subset, encryptor=EnvelopeEncryptor())),
+    ]
+    if backend.name == 'mysql':
+        from batch_writer import BatchWriter
+        from bulk_load import BulkLoader, local_infile_enabled
+
+        def executemany(subset):
+            writer = BatchWriter(backend.connection, batch_size=5000, max_latency=None,
+                                 use_executemany=True, table=WRITE_TABLE)
+            writer.add_many(subset)
+            writer.close()
+
+        def bulk_loaded(subset):
+            loader = BulkLoader(backend.connection, table=WRITE_TABLE, rollups=False)
+            loader.add_many(subset)
+            loader.close()
+
+        paths.append(('executemany', data, executemany))
+        if local_infile_enabled(backend.connection):
+            paths.append(('load_data_infile', data, bulk_loaded))
+
+    try:
+        for name, subset, load in paths:
+            backend.truncate(WRITE_TABLE)
+            start = time.monotonic()
+            load(subset)
+            elapsed = time.monotonic() - start
+            results[name] = round(len(subset) / elapsed, 1)
+            print(f"insert {name:<28} {results[name]:>12,.0f} rows/s")
+    finally:
+        backend.drop_table(WRITE_TABLE)
+    return results
+
+
+def measure_queries(backend, repeat=20, warmup=2):
+    """Return p50/p99 latency in ms for each README query against the dataset table"""
+    newest = backend.execute(f"SELECT MAX(timestamp) FROM {DATASET_TABLE}")[0][0]
+    if isinstance(newest, str):
+        newest = datetime.datetime.fromisoformat(newest)
+    since = backend.adapt_timestamp((newest or datetime.datetime.now()) - datetime.timedelta(hours=1))
+    results = {}
+    for name, template in QUERIES.items():
+        query = template.format(table=DATASET_TABLE)
+        params = (since,) if '%s' in query else None
+        latencies = []
+        for i in range(warmup + repeat):
+            start = time.perf_counter()
+            backend.execute(query, params)
+            if i >= warmup:
+                latencies.append((time.perf_counter() - start) * 1000)
+        results[name] = {
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+        }
+        print(f"query  {name:<28} p50 {results[name]['p50_ms']:>10.2f} ms  p99 {results[name]['p99_ms']:>10.2f} ms")
+    return results
+
+
+def git_commit():
+    """Current git commit of the working tree, if any"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(backend, dataset_rows, insert_rows=100000, repeat=20, span_days=30, reuse=True):
+    """Seed the dataset, measure write paths and queries, and return a results dict"""
+    seed_seconds = seed_dataset(backend, dataset_rows, span_days, reuse=reuse)
+    return {
+        'meta': {
+            'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'backend': backend.name,
+            'server_version': backend.version(),
+            'dataset_rows': dataset_rows,
+            'insert_rows': insert_rows,
+            'query_repeat': repeat,
+            'seed_seconds': round(seed_seconds, 1),
+        },
+        'insert_rows_per_second': measure_inserts(backend, insert_rows),
+        'queries': measure_queries(backend, repeat),
+    }
+
+
+def compare(baseline, current, threshold=0.10):
+    """Return regressions of current against baseline beyond threshold (0.10 = 10%).
+
+    Insert paths regress when rows/s drops, queries when p50 or p99 grows.
+    Only metrics present in both runs are compared.
+    """
+    regressions = []
+    base_inserts = baseline.get('insert_rows_per_second', {})
+    for name, rate in current.get('insert_rows_per_second', {}).items():
+        before = base_inserts.get(name)
+        if before and rate < before * (1 - threshold):
+            regressions.append(f"insert {name}: {before:,.0f} -> {rate:,.0f} rows/s "
+                               f"({(rate / before - 1) * 100:+.1f}%)")
+    base_queries = baseline.get('queries', {})
+    for name, latencies in current.get('queries', {}).items():
+        for metric in ('p50_ms', 'p99_ms'):
+            before = base_queries.get(name, {}).get(metric)
+            after = latencies.get(metric)
+            if before and after is not None and after > before * (1 + threshold):
+                regressions.append(f"query {name} {metric}: {before:.2f} -> {after:.2f} ms "
+                                   f"({(after / before - 1) * 100:+.1f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark auth_logs ingest throughput and query latency")
+    parser.add_argument('--rows', type=int, default=1000000, help="dataset size for the query benchmarks")
+    parser.add_argument('--insert-rows', type=int, default=100000, help="rows per write path")
+    parser.add_argument('--repeat', type=int, default=20, help="runs per query")
+    parser.add_argument('--span-days', type=float, default=30, help="time range the dataset covers")
+    parser.add_argument('--reseed', action='store_true', help="rebuild the dataset even if it exists")
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='mysql',
+                        help="benchmark MySQL or an embedded SQLite stand-in")
+    parser.add_argument('--sqlite-path', default='benchmark.db', help="database file for --backend sqlite")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="compare two result files instead of running")
+    parser.add_argument('--threshold', type=float, default=0.10, help="regression threshold, 0.10 = 10%%")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regressions beyond {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    from storage import get_backend
+
+    if args.backend == 'sqlite':
+        backend = get_backend('sqlite', path=args.sqlite_path)
+    else:
+        backend = get_backend(args.backend, allow_local_infile=True)
+    results = run_benchmarks(backend, args.rows, args.insert_rows, args.repeat, args.span_days,
+                             reuse=not args.reseed)
+    backend.close()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
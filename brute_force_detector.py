@@ -0,0 +1,133 @@
+import bisect
+import datetime
+import threading
+from collections import OrderedDict
+
+KEY_COLUMNS = {'source_ip': 1, 'username': 2}
+
+
+class BruteForceDetector:
+    """Flag source IPs and usernames with `failures` failed logins within `window_seconds`.
+
+    Each tracked key keeps its last `failures` failure times in time order,
+    so a key alerts exactly when the oldest of those is inside the window of
+    the newest. A failure older than the newest one seen, e.g. from a batch
+    retried late, is inserted in order rather than appended. Keys are kept
+    in LRU order and the least recently seen ones are evicted beyond
+    max_keys, which caps memory at roughly max_keys * failures timestamps.
+    Event timestamps are used rather than the wall clock so replays and
+    backfills alert the same way.
+
+    Use it directly with observe()/observe_many() or attach() it to a
+    BatchWriter, where it sees each batch once it is committed, so a batch
+    that fails and is retried or spooled is only counted once. Alerts are
+    then stored in brute_force_alerts just after the batch. A detector can be
+    attached to several writers, e.g. a live writer and a spool replayer;
+    each source keeps its own windows, so old replayed rows are not mixed
+    with live ones.
+    """
+
+    def __init__(self, failures=5, window_seconds=60, max_keys=100000,
+                 keys=('source_ip', 'username'), callback=None, store_alerts=True):
+        self.failures = failures
+        self.window = datetime.timedelta(seconds=window_seconds)
+        self.max_keys = max_keys
+        self.key_columns = [(name, KEY_COLUMNS[name]) for name in keys]
+        self.callback = callback
+        self.store_alerts = store_alerts
+        self.windows = OrderedDict()
+        self.last_alert = {}
+        self.events_seen = 0
+        self.out_of_order = 0
+        self.alerts_raised = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def observe(self, row, source=None):
+        """Feed one auth_logs row from source, returning any alerts it triggers"""
+        self.events_seen += 1
+        if row[4] != 'failed':
+            return []
+        timestamp = row[0]
+        windows = self.windows
+        alerts = []
+        for key_type, column in self.key_columns:
+            key = (key_type, row[column])
+            window_key = (source, key)
+            times = windows.get(window_key)
+            if times is None:
+                times = windows[window_key] = []
+                if len(windows) > self.max_keys:
+                    (_, evicted), _ = windows.popitem(last=False)
+                    self.last_alert.pop(evicted, None)
+                    self.evictions += 1
+            else:
+                windows.move_to_end(window_key)
+            if not times or timestamp >= times[-1]:
+                times.append(timestamp)
+            else:
+                bisect.insort(times, timestamp)
+                self.out_of_order += 1
+            if len(times) > self.failures:
+                del times[0]
+
+            if len(times) == self.failures and times[-1] - times[0] <= self.window:
+                # One alert per key per window, not one per further failure; the alert may be
+                # older than the last one when its events arrived late
+                previous = self.last_alert.get(key)
+                if previous is None or abs(times[-1] - previous) > self.window:
+                    self.last_alert[key] = times[-1]
+                    alert = {
+                        'key_type': key_type,
+                        'key_value': key[1],
+                        'failures': len(times),
+                        'window_start': times[0],
+                        'window_end': times[-1],
+                    }
+                    alerts.append(alert)
+                    self.alerts_raised += 1
+                    if self.callback:
+                        self.callback(alert)
+        return alerts
+
+    def observe_many(self, rows, source=None):
+        """Feed several rows from source, returning all alerts they trigger"""
+        alerts = []
+        with self.lock:
+            for row in rows:
+                alerts.extend(self.observe(row, source))
+        return alerts
+
+    def attach(self, writer, source=None):
+        """Observe every batch writer commits, as rows from source"""
+        writer.after_commit.append(lambda rows: self.committed(writer, rows, source))
+
+    def committed(self, writer, rows, source=None):
+        """BatchWriter after_commit hook: observe rows and store their alerts"""
+        alerts = self.observe_many(rows, source)
+        if not alerts or not self.store_alerts:
+            return
+        try:
+            writer.cursor.executemany("""
+                INSERT INTO brute_force_alerts
+                (detected_at, key_type, key_value, failures, window_start, window_end)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, [(datetime.datetime.now(), alert['key_type'], alert['key_value'], alert['failures'],
+                   alert['window_start'], alert['window_end']) for alert in alerts])
+            writer.connection.commit()
+        except Exception as e:
+            print(f"Error storing {len(alerts)} brute-force alerts: {e}")
+            try:
+                writer.connection.rollback()
+            except Exception:
+                pass
+
+    def stats(self):
+        """Return detector counters"""
+        return {
+            'events_seen': self.events_seen,
+            'out_of_order': self.out_of_order,
+            'alerts_raised': self.alerts_raised,
+            'tracked_keys': len(self.windows),
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,174 @@
+import argparse
+import datetime
+import functools
+import glob
+import gzip
+import heapq
+import io
+import multiprocessing
+import os
+import re
+import time
+from auth_log_parser import AuthLogParser
+from dedup import event_hash
+
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+
+ROTATION_SUFFIX = re.compile(r'\.(\d+)(?:\.gz)?$')
+
+
+def rotation_order(path):
+    """Sort key putting the oldest rotation first: auth.log.3.gz, auth.log.2.gz, auth.log.1, auth.log"""
+    match = ROTATION_SUFFIX.search(path)
+    generation = int(match.group(1)) if match else 0
+    return (os.path.dirname(path), -generation, path)
+
+
+def expand_paths(paths):
+    """Expand directories and globs into a list of log files, oldest rotation first"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, 'auth.log*')))
+        else:
+            files.extend(glob.glob(path) or [path])
+    return sorted(set(f for f in files if os.path.isfile(f)), key=rotation_order)
+
+
+def file_latest(path):
+    """Syslog lines carry no year; none can be later than when the file was last written"""
+    return datetime.datetime.fromtimestamp(os.path.getmtime(path))
+
+
+def plan_tasks(files, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Split plain files into byte ranges; each gzip file is a single task"""
+    tasks = []
+    for path in files:
+        size = os.path.getsize(path)
+        latest = file_latest(path)
+        if path.endswith('.gz'):
+            tasks.append((path, 0, None, latest, size))
+            continue
+        for start in range(0, max(size, 1), chunk_size):
+            end = min(start + chunk_size, size)
+            tasks.append((path, start, end, latest, end - start))
+    return tasks
+
+
+def parse_range(task, hashes=False):
+    """Worker: parse one task and return (path, rows sorted by timestamp, bytes).
+
+    A line belongs to the range its first byte falls in, so each range skips
+    the partial line at its start and reads past its end to finish the last one.
+    With hashes each row gets its event hash as a seventh column, with the
+    same inode:offset source as auth_log_ingest, so a deduplicating writer
+    drops lines that were already ingested live or imported before. Offsets
+    in .gz files count decompressed bytes.
+    """
+    path, start, end, latest, size = task
+    parser = AuthLogParser(latest=latest)
+    parse_line = parser.parse_line
+    inode = os.stat(path).st_ino
+    rows = []
+
+    if end is None:
+        f = gzip.open(path, 'rb')
+        position = 0
+    else:
+        with open(path, 'rb') as raw_file:
+            if start > 0:
+                raw_file.seek(start - 1)
+                raw_file.readline()
+            position = raw_file.tell()
+            data = raw_file.read(max(end - position, 0))
+            if data and not data.endswith(b'\n'):
+                data += raw_file.readline()
+        f = io.BytesIO(data)
+    with f:
+        for raw in f:
+            position += len(raw)
+            row = parse_line(raw.rstrip(b'\n').decode('utf-8', 'replace'))
+            if row is None:
+                continue
+            if hashes:
+                row = row + (event_hash(row, f"{inode}:{position}"),)
+            rows.append(row)
+
+    # sort() is stable, so lines with equal timestamps keep their file order
+    rows.sort(key=lambda row: row[0])
+    return path, rows, size
+
+
+def bulk_import(paths, writer, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, report_interval=5.0):
+    """Parse rotated auth.log files in parallel and write them through one writer.
+
+    Results are consumed in task order and the sorted ranges of each file are
+    merged before writing, so rows reach the writer in the same order on every
+    run regardless of worker count or chunk size: oldest file first, then by
+    timestamp (ties in file order). A file's rows are held in memory until its
+    last range finishes. Rows carry event hashes when the writer has a
+    deduplicator, so re-importing a file stores nothing twice.
+    """
+    hashes = getattr(writer, 'deduplicator', None) is not None
+    files = expand_paths(paths)
+    tasks = plan_tasks(files, chunk_size)
+    total_bytes = sum(task[4] for task in tasks)
+    workers = workers or os.cpu_count()
+    print(f"Importing {len(files)} files ({total_bytes / 1e6:.1f} MB, {len(tasks)} tasks) "
+          f"with {workers} workers...")
+
+    done_bytes = 0
+    row_count = 0
+    start = time.monotonic()
+    last_report = start
+    current_path = None
+    file_ranges = []
+    with multiprocessing.Pool(workers) as pool:
+        for path, rows, size in pool.imap(functools.partial(parse_range, hashes=hashes), tasks):
+            if path != current_path:
+                writer.add_many(heapq.merge(*file_ranges, key=lambda row: row[0]))
+                current_path = path
+                file_ranges = []
+            file_ranges.append(rows)
+            done_bytes += size
+            row_count += len(rows)
+            now = time.monotonic()
+            if now - last_report >= report_interval:
+                last_report = now
+                elapsed = now - start
+                print(f"  {done_bytes / total_bytes * 100 if total_bytes else 100:5.1f}% "
+                      f"{done_bytes / elapsed / 1e6:.1f} MB/s, {row_count / elapsed:.0f} rows/s")
+    writer.add_many(heapq.merge(*file_ranges, key=lambda row: row[0]))
+    writer.flush()
+
+    elapsed = time.monotonic() - start
+    print(f"Imported {row_count} events in {elapsed:.1f}s "
+          f"({row_count / elapsed if elapsed else 0:.0f} rows/s, "
+          f"{done_bytes / elapsed / 1e6 if elapsed else 0:.1f} MB/s)")
+    return row_count
+
+
+if __name__ == "__main__":
+    from batch_writer import BatchWriter
+    from database import create_connection
+    from dedup import Deduplicator
+    from rollups import RollupMaintainer
+
+    parser = argparse.ArgumentParser(description="Bulk import rotated auth.log archives")
+    parser.add_argument('paths', nargs='+', help="files, globs or directories containing auth.log*")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size-mb', type=int, default=DEFAULT_CHUNK_SIZE // (1024 * 1024))
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--no-dedup', action='store_true', help="store rows without event hashes")
+    args = parser.parse_args()
+
+    connection = create_connection()
+    writer = BatchWriter(connection, batch_size=args.batch_size, max_latency=None,
+                         deduplicator=None if args.no_dedup else Deduplicator())
+    writer.before_commit.append(RollupMaintainer())
+    try:
+        bulk_import(args.paths, writer, workers=args.workers,
+                    chunk_size=args.chunk_size_mb * 1024 * 1024)
+    finally:
+        writer.close()
+        connection.close()
@@ -0,0 +1,266 @@
+import argparse
+import datetime
+import os
+import re
+import tempfile
+import time
+from mysql.connector import Error
+from batch_writer import AUTH_LOG_COLUMNS, BatchWriter
+from database import create_indexes, drop_indexes
+
+# Client or server refused LOAD DATA LOCAL INFILE
+LOCAL_INFILE_DISABLED_ERRORS = (1148, 2068, 3948)
+
+ESCAPED = re.compile(rb'\\(.)', re.S)
+UNESCAPE = {b'0': b'\0', b't': b'\t', b'n': b'\n', b'r': b'\r', b'\\': b'\\'}
+
+
+def escape_field(value):
+    """Encode one value in MySQL's default LOAD DATA text format"""
+    if value is None:
+        return b'\\N'
+    if isinstance(value, bytes):
+        data = value
+    elif isinstance(value, datetime.datetime):
+        data = value.isoformat(' ').encode()
+    else:
+        data = str(value).encode('utf-8')
+    if b'\\' in data:
+        data = data.replace(b'\\', b'\\\\')
+    return (data.replace(b'\t', b'\\t').replace(b'\n', b'\\n')
+            .replace(b'\r', b'\\r').replace(b'\0', b'\\0'))
+
+
+def unescape_field(data):
+    """Reverse escape_field, returning None for NULL"""
+    if data == b'\\N':
+        return None
+    return ESCAPED.sub(lambda m: UNESCAPE.get(m.group(1), m.group(1)), data)
+
+
+def local_infile_enabled(connection):
+    """Check whether the server accepts LOAD DATA LOCAL INFILE"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT @@GLOBAL.local_infile")
+        return bool(cursor.fetchone()[0])
+    except Error:
+        return False
+    finally:
+        cursor.close()
+
+
+class BulkLoader:
+    """Stream rows into a TSV spool file and load it with LOAD DATA LOCAL INFILE.
+
+    The connection must be opened with allow_local_infile=True. When the
+    server or client refuses local infile, rows go through a multi-row INSERT
+    BatchWriter instead. With manage_indexes the auth_logs secondary indexes
+    are dropped before the first load and rebuilt from database.AUTH_LOGS_INDEXES
+    on close, which is much faster than maintaining them row by row for very
+    large backfills. Neither path runs a RollupMaintainer, so with rollups
+    the rollup tables are rebuilt for the loaded time range on close.
+    """
+
+    def __init__(self, connection, spool_rows=500000, spool_dir=None, table='auth_logs',
+                 manage_indexes=False, rollups=True):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.spool_rows = spool_rows
+        self.spool_dir = spool_dir
+        self.table = table
+        self.manage_indexes = manage_indexes
+        self.indexes_dropped = False
+        self.rollups = rollups
+        self.oldest = None
+        self.newest = None
+        self.spool = None
+        self.spooled = 0
+        self.rows_loaded = 0
+        self.load_time_total = 0.0
+        self.fallback = None
+        if not local_infile_enabled(connection):
+            self._use_fallback("local_infile is disabled on the server")
+
+    def _use_fallback(self, reason):
+        print(f"LOAD DATA LOCAL INFILE unavailable ({reason}), falling back to multi-row INSERT")
+        self.fallback = BatchWriter(self.connection, batch_size=5000, max_latency=None,
+                                    table=self.table)
+
+    def add(self, row):
+        """Append a row to the spool, loading it once it is full"""
+        timestamp = row[0]
+        if self.oldest is None or timestamp < self.oldest:
+            self.oldest = timestamp
+        if self.newest is None or timestamp > self.newest:
+            self.newest = timestamp
+        if self.fallback:
+            self.fallback.add(row)
+            return
+        if self.spool is None:
+            self.spool = tempfile.NamedTemporaryFile(
+                mode='wb', prefix='auth_logs_', suffix='.tsv', dir=self.spool_dir, delete=False)
+        self.spool.write(b'\t'.join([escape_field(value) for value in row]) + b'\n')
+        self.spooled += 1
+        if self.spooled >= self.spool_rows:
+            self.flush()
+
+    def add_many(self, rows):
+        """Append several rows to the spool"""
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        """Load the current spool file in one statement and commit"""
+        if self.fallback:
+            return self.fallback.flush()
+        if self.spool is None:
+            return True
+        path = self.spool.name
+        self.spool.close()
+        self.spool = None
+        count = self.spooled
+        self.spooled = 0
+
+        try:
+            if self.manage_indexes and not self.indexes_dropped:
+                self.cursor.execute("SET SESSION unique_checks = 0")
+                drop_indexes(self.cursor, self.table)
+                self.indexes_dropped = True
+
+            start = time.monotonic()
+            self.cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {self.table} CHARACTER SET binary "
+                f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                f"({', '.join(AUTH_LOG_COLUMNS)})",
+                (path,)
+            )
+            self.connection.commit()
+            self.load_time_total += time.monotonic() - start
+            self.rows_loaded += count
+            return True
+        except Error as e:
+            self.connection.rollback()
+            if e.errno not in LOCAL_INFILE_DISABLED_ERRORS:
+                print(f"Error loading {count} log entries from {path}: {e}")
+                return False
+            self._use_fallback(e.msg)
+            self._replay_spool(path)
+            return self.fallback.flush()
+        finally:
+            os.unlink(path)
+
+    def _replay_spool(self, path):
+        """Feed an already written spool file through the fallback writer"""
+        with open(path, 'rb') as f:
+            for line in f:
+                fields = [unescape_field(field) for field in line.rstrip(b'\n').split(b'\t')]
+                # Text columns were encoded as UTF-8; only encrypted_password is binary
+                self.fallback.add(tuple(
+                    value.decode('utf-8') if value is not None and i != 3 else value
+                    for i, value in enumerate(fields)
+                ))
+
+    def close(self):
+        """Load remaining rows and rebuild any dropped indexes and the rollups"""
+        self.flush()
+        if self.fallback:
+            self.fallback.close()
+        if self.indexes_dropped:
+            print("Rebuilding auth_logs indexes...")
+            create_indexes(self.cursor, self.table)
+            self.cursor.execute("SET SESSION unique_checks = 1")
+            self.indexes_dropped = False
+        if self.rollups and self.oldest is not None:
+            from rollups import rebuild_rollups
+            print(f"Rebuilding rollups from {self.oldest} to {self.newest}...")
+            rebuild_rollups(self.connection, self.oldest, self.newest + datetime.timedelta(minutes=1))
+        self.cursor.close()
+
+    def stats(self):
+        """Return load throughput statistics"""
+        if self.fallback:
+            return self.fallback.stats()
+        return {
+            'rows_loaded': self.rows_loaded,
+            'rows_per_second': (self.rows_loaded / self.load_time_total
+                                if self.load_time_total else 0.0),
+        }
+
+
+def benchmark(row_count=100000, per_row_limit=5000):
+    """Compare per-row INSERT, batched INSERT and LOAD DATA on a scratch copy of auth_logs"""
+    from database import create_connection
+    from ssh_log_simulator import build_log_row
+
+    rows = [build_log_row() for _ in range(row_count)]
+
+    connection = create_connection(allow_local_infile=True)
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS auth_logs_bench")
+    cursor.execute("CREATE TABLE auth_logs_bench LIKE auth_logs")
+    results = {}
+
+    def timed(name, count, load):
+        cursor.execute("TRUNCATE TABLE auth_logs_bench")
+        start = time.monotonic()
+        load()
+        elapsed = time.monotonic() - start
+        results[name] = count / elapsed
+        print(f"{name:<28} {count:>9} rows {elapsed:8.2f}s {results[name]:>12.0f} rows/s")
+
+    def per_row():
+        for row in rows[:per_row_limit]:
+            cursor.execute(f"INSERT INTO auth_logs_bench ({', '.join(AUTH_LOG_COLUMNS)}) "
+                           f"VALUES (%s, %s, %s, %s, %s, %s)", row)
+            connection.commit()
+
+    def batched():
+        writer = BatchWriter(connection, batch_size=5000, max_latency=None, table='auth_logs_bench')
+        writer.add_many(rows)
+        writer.close()
+
+    def bulk_loaded(manage_indexes):
+        loader = BulkLoader(connection, table='auth_logs_bench', manage_indexes=manage_indexes, rollups=False)
+        loader.add_many(rows)
+        loader.close()
+
+    try:
+        timed('per-row INSERT + COMMIT', min(per_row_limit, row_count), per_row)
+        timed('batched multi-row INSERT', row_count, batched)
+        timed('LOAD DATA LOCAL INFILE', row_count, lambda: bulk_loaded(False))
+        timed('LOAD DATA, indexes rebuilt', row_count, lambda: bulk_loaded(True))
+    finally:
+        cursor.execute("DROP TABLE IF EXISTS auth_logs_bench")
+        cursor.close()
+        connection.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load auth_logs rows with LOAD DATA LOCAL INFILE")
+    parser.add_argument('--benchmark', type=int, metavar='ROWS',
+                        help="compare write paths on ROWS simulated rows")
+    parser.add_argument('--import', dest='import_paths', nargs='+', metavar='PATH',
+                        help="backfill rotated auth.log files through the bulk loader")
+    parser.add_argument('--manage-indexes', action='store_true',
+                        help="drop secondary indexes during the load and rebuild them after")
+    parser.add_argument('--no-rollups', action='store_true',
+                        help="skip rebuilding rollups for the imported range (rebuild them yourself)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    elif args.import_paths:
+        from bulk_import import bulk_import
+        from database import create_connection
+
+        connection = create_connection(allow_local_infile=True)
+        loader = BulkLoader(connection, manage_indexes=args.manage_indexes, rollups=not args.no_rollups)
+        try:
+            bulk_import(args.import_paths, loader)
+        finally:
+            loader.close()
+            connection.close()
+    else:
+        parser.print_help()
@@ -0,0 +1,133 @@
+# Single entry point for the auth_logs tools:
+#
+#   python cli.py simulate --duration 600 --rate 50
+#   python cli.py ingest /var/log/auth.log --once
+#   python cli.py query summary
+#   python cli.py bench --rows 100000
+#   python cli.py maintenance partitions --retention-days 30
+#
+# Only argparse is loaded up front; each subcommand imports its dependencies (mysql.connector,
+# NumPy, cryptography, pyarrow) once chosen, so --help, healthchecks and cron queries start fast.
+import argparse
+import os
+import sys
+
+# Subcommands handled by an existing module's command line, which gets the remaining arguments:
+# (module, help)
+MODULE_COMMANDS = {
+    'simulate': ('ssh_log_simulator', "simulate SSH login attempts into auth_logs"),
+    'ingest': ('auth_log_ingest', "tail an auth.log into auth_logs"),
+    'bench': ('benchmark', "benchmark ingest throughput and query latency"),
+}
+
+MAINTENANCE_TASKS = {
+    'schema': ('database', "create the database, auth_logs and rollup tables"),
+    'partitions': ('partition_maintenance', "pre-create partitions and drop expired ones"),
+    'rollups': ('rollups', "rebuild per-minute rollups and print the dashboard"),
+    'archive': ('parquet_archive', "archive aged rows to Parquet and query the archive"),
+    'compact': ('compact_schema', "migrate auth_logs to the compact layout"),
+    'forward': ('storage', "forward rows buffered in SQLite to MySQL"),
+    'spool': ('spool', "inspect or drain the on-disk spool"),
+}
+
+QUERIES = ('ping', 'count', 'summary', 'recent', 'failed')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Simulate, ingest, query and maintain auth_logs")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    for name, (module, help_text) in MODULE_COMMANDS.items():
+        # No -h here: --help is passed on to the module's own parser
+        commands.add_parser(name, help=help_text, add_help=False)
+
+    query = commands.add_parser('query', help="run a dashboard query, or ping the database")
+    query.add_argument('query', choices=QUERIES)
+    query.add_argument('--backend', choices=['mysql', 'sqlite'], default=os.getenv('STORAGE_BACKEND', 'mysql'))
+    query.add_argument('--sqlite-path', help="database file for --backend sqlite")
+    query.add_argument('--limit', type=int, default=10, help="rows for recent, IPs for summary")
+    query.add_argument('--since-minutes', type=float, default=60, help="window for failed")
+    query.add_argument('--json', action='store_true', help="print JSON, for scripts")
+
+    maintenance = commands.add_parser('maintenance', help="schema, partition, rollup, archive and spool upkeep")
+    tasks = maintenance.add_subparsers(dest='task', metavar='task')
+    tasks.required = True
+    for name, (module, help_text) in MAINTENANCE_TASKS.items():
+        tasks.add_parser(name, help=help_text, add_help=False)
+    return parser
+
+
+def run_module(module, command, argv):
+    """Run module's `__main__` block as if it had been started with argv"""
+    import runpy
+
+    sys.argv = [f"cli.py {command}"] + argv
+    runpy.run_module(module, run_name='__main__')
+    return 0
+
+
+def run_query(args):
+    """Run one query against the configured backend and print the result"""
+    import datetime
+    import json
+    from storage import get_backend
+
+    options = {'path': args.sqlite_path} if args.backend == 'sqlite' else {}
+    try:
+        backend = get_backend(args.backend, **options)
+    except Exception as e:
+        print(f"Error opening {args.backend} backend: {e}")
+        return 1
+    if backend.connection is None:
+        # create_connection() already printed why
+        return 1
+    try:
+        if args.query == 'ping':
+            result = {'backend': args.backend, 'version': backend.version()}
+        elif args.query == 'count':
+            result = {'total': backend.total_count()}
+        elif args.query == 'summary':
+            result = {
+                'total': backend.total_count(),
+                'by_status': backend.counts_by_status(),
+                'top_source_ips': backend.top_source_ips(args.limit),
+                'by_username': backend.attempts_by_username(),
+            }
+        elif args.query == 'recent':
+            result = {'recent': backend.recent_entries(args.limit)}
+        else:
+            since = datetime.datetime.now() - datetime.timedelta(minutes=args.since_minutes)
+            result = {'failed': backend.failed_since(since)}
+    except Exception as e:
+        print(f"Error running {args.query} query: {e}")
+        return 1
+    finally:
+        backend.close()
+
+    if args.json:
+        print(json.dumps(result, default=str))
+    else:
+        for name, value in result.items():
+            if isinstance(value, list) and args.query in ('recent', 'failed'):
+                for row in value:
+                    print(' | '.join(str(column) for column in row))
+            else:
+                print(f"{name}: {value}")
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, rest = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    if args.command in MODULE_COMMANDS:
+        return run_module(MODULE_COMMANDS[args.command][0], args.command, rest)
+    if args.command == 'maintenance':
+        return run_module(MAINTENANCE_TASKS[args.task][0], f"maintenance {args.task}", rest)
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    return run_query(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
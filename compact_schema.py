@@ -0,0 +1,244 @@
+import argparse
+import socket
+import time
+from batch_writer import BatchWriter, build_multi_row_insert
+
+STATUS_CODES = {'failed': 0, 'success': 1}
+
+COMPACT_COLUMNS = (
+    'timestamp', 'source_ip', 'username_id', 'encrypted_password', 'status', 'attempt_details'
+)
+
+
+def pack_ip(address):
+    """Pack a dotted IPv4 or IPv6 address into 4 or 16 bytes, as INET6_ATON does.
+
+    Raises ValueError for anything that is not an IP address.
+    """
+    try:
+        return socket.inet_pton(socket.AF_INET, address)
+    except OSError:
+        try:
+            return socket.inet_pton(socket.AF_INET6, address)
+        except OSError:
+            raise ValueError(f"Not an IP address: {address!r}") from None
+
+
+def unpack_ip(packed):
+    """Reverse pack_ip"""
+    if len(packed) == 4:
+        return socket.inet_ntop(socket.AF_INET, packed)
+    if len(packed) == 16:
+        return socket.inet_ntop(socket.AF_INET6, packed)
+    return ''
+
+
+class UsernameDictionary:
+    """In-process cache of username -> usernames.id.
+
+    Misses are inserted with INSERT IGNORE and committed straight away, so an
+    id in the cache always refers to a durable usernames row even if the
+    batch that needed it is later rolled back.
+    """
+
+    def __init__(self, connection, max_size=100000):
+        self.connection = connection
+        self.max_size = max_size
+        self.ids = {}
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, cursor, usernames):
+        """Return {username: id} for every name, touching the database only for misses"""
+        ids = self.ids
+        if len(ids) + len(usernames) > self.max_size:
+            ids.clear()
+        missing = {name for name in usernames if name not in ids}
+        self.misses += len(missing)
+        self.hits += len(usernames) - len(missing)
+        if missing:
+            missing = list(missing)
+            cursor.execute(
+                "INSERT IGNORE INTO usernames (username) VALUES " + ', '.join(['(%s)'] * len(missing)),
+                missing
+            )
+            self.connection.commit()
+            cursor.execute(
+                "SELECT username, id FROM usernames WHERE username IN ("
+                + ', '.join(['%s'] * len(missing)) + ")",
+                missing
+            )
+            ids.update(cursor.fetchall())
+        return ids
+
+
+class CompactBatchWriter(BatchWriter):
+    """BatchWriter that stores legacy-format rows in the compact layout.
+
+    Accepts the same AUTH_LOG_COLUMNS tuples as BatchWriter and converts them
+    on flush: packed IPs, dictionary-encoded usernames and integer status.
+    A source_ip that is not an IP address is stored as NULL and counted in
+    invalid_ips. The compact table has no event_hash, so a deduplicator is
+    not supported.
+    """
+
+    def __init__(self, connection, table='auth_logs_compact', **options):
+        if options.get('deduplicator'):
+            raise ValueError("CompactBatchWriter does not support deduplication")
+        super().__init__(connection, table=table, **options)
+        self.usernames = UsernameDictionary(connection)
+        self.invalid_ips = 0
+
+    def _write(self, rows):
+        ids = self.usernames.resolve(self.cursor, {row[2] for row in rows})
+        values = []
+        for timestamp, source_ip, username, password, status, details in rows:
+            try:
+                packed = pack_ip(source_ip)
+            except ValueError:
+                packed = None
+                self.invalid_ips += 1
+            values.extend((timestamp, packed, ids[username], password,
+                           STATUS_CODES[status], details))
+        self.cursor.execute(build_multi_row_insert(len(rows), self.table, COMPACT_COLUMNS), values)
+        return self.cursor.rowcount
+
+
+def _copy_range(cursor, lower, upper, missing_only=False):
+    """Copy auth_logs ids in (lower, upper] to auth_logs_compact and return the row count.
+
+    missing_only adds an anti-join so ids already copied are skipped.
+    """
+    cursor.execute(
+        "INSERT IGNORE INTO usernames (username) "
+        "SELECT DISTINCT username FROM auth_logs WHERE id > %s AND id <= %s",
+        (lower, upper)
+    )
+    cursor.execute(
+        """
+        INSERT INTO auth_logs_compact
+        (id, timestamp, source_ip, username_id, encrypted_password, status, attempt_details, created_at)
+        SELECT a.id, a.timestamp, INET6_ATON(a.source_ip), u.id,
+               a.encrypted_password, IF(a.status = 'success', 1, 0), a.attempt_details, a.created_at
+        FROM auth_logs a JOIN usernames u ON u.username = a.username
+        WHERE a.id > %s AND a.id <= %s
+        """ + ("AND NOT EXISTS (SELECT 1 FROM auth_logs_compact c WHERE c.id = a.id)" if missing_only else ""),
+        (lower, upper)
+    )
+    return cursor.rowcount
+
+
+def migrate(connection, chunk_size=50000, pause=0.0, recheck=None):
+    """Copy auth_logs into auth_logs_compact in id-ranged chunks.
+
+    Each chunk is its own short transaction so the source table stays
+    writable. Rows keep their ids, which makes the copy resumable: it starts
+    after the highest id already copied and repeats catch-up passes until no
+    new rows appear.
+
+    Ids are assigned at insert but become visible at commit, so a writer can
+    commit an id below one already copied. A final pass therefore re-copies
+    every range this run covered, plus the recheck ids (default chunk_size)
+    before where it resumed, with an anti-join on ids already present. Cut
+    writers over to CompactBatchWriter, then run the migration once more so
+    its final pass picks up rows committed during the cutover. Source IPs
+    that INET6_ATON rejects are stored as NULL and counted.
+    """
+    if recheck is None:
+        recheck = chunk_size
+    cursor = connection.cursor()
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM auth_logs_compact")
+    copied_up_to = cursor.fetchone()[0]
+    resumed_at = copied_up_to
+    total = 0
+    start = time.monotonic()
+
+    while True:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM auth_logs")
+        target = cursor.fetchone()[0]
+        if target <= copied_up_to:
+            break
+        print(f"Copying ids {copied_up_to + 1}..{target}")
+
+        while copied_up_to < target:
+            upper = min(copied_up_to + chunk_size, target)
+            total += _copy_range(cursor, copied_up_to, upper)
+            connection.commit()
+            copied_up_to = upper
+            if pause:
+                time.sleep(pause)
+
+    lower = max(resumed_at - recheck, 0)
+    print(f"Re-checking ids {lower + 1}..{copied_up_to} for late commits")
+    late = 0
+    while lower < copied_up_to:
+        upper = min(lower + chunk_size, copied_up_to)
+        late += _copy_range(cursor, lower, upper, missing_only=True)
+        connection.commit()
+        lower = upper
+        if pause:
+            time.sleep(pause)
+    total += late
+
+    cursor.execute("SELECT COUNT(*) FROM auth_logs_compact WHERE source_ip IS NULL")
+    invalid = cursor.fetchone()[0]
+    elapsed = time.monotonic() - start
+    print(f"Migrated {total} rows ({late} committed late) in {elapsed:.1f}s; "
+          f"auth_logs_compact is caught up to id {copied_up_to}")
+    if invalid:
+        print(f"Warning: {invalid} rows have a source_ip that is not an IP address and were stored as NULL")
+    cursor.close()
+    return total
+
+
+def compare_layouts(connection, repeat=5):
+    """Print table/index size, GROUP BY source_ip latency and buffer-pool hit rate for both layouts"""
+    cursor = connection.cursor()
+    cursor.execute("ANALYZE TABLE auth_logs, auth_logs_compact")
+    cursor.fetchall()
+
+    def buffer_pool_counters():
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_buffer_pool_read%'")
+        status = dict(cursor.fetchall())
+        return int(status['Innodb_buffer_pool_read_requests']), int(status['Innodb_buffer_pool_reads'])
+
+    print(f"{'table':<20} {'rows':>10} {'data MB':>9} {'index MB':>9} {'group by ms':>12} {'bp hit %':>9}")
+    for table, column in (('auth_logs', 'source_ip'), ('auth_logs_compact', 'source_ip')):
+        cursor.execute("""
+            SELECT table_rows, data_length, index_length FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = %s
+        """, (table,))
+        rows, data_length, index_length = cursor.fetchone()
+
+        requests_before, reads_before = buffer_pool_counters()
+        start = time.monotonic()
+        for _ in range(repeat):
+            cursor.execute(f"SELECT {column}, COUNT(*) FROM {table} GROUP BY {column} "
+                           f"ORDER BY COUNT(*) DESC LIMIT 5")
+            cursor.fetchall()
+        latency = (time.monotonic() - start) / repeat * 1000
+        requests_after, reads_after = buffer_pool_counters()
+        requests = requests_after - requests_before
+        hit_rate = 100.0 * (1 - (reads_after - reads_before) / requests) if requests else 100.0
+
+        print(f"{table:<20} {rows:>10} {data_length / 1e6:>9.1f} {index_length / 1e6:>9.1f} "
+              f"{latency:>12.1f} {hit_rate:>9.2f}")
+    cursor.close()
+
+
+if __name__ == "__main__":
+    from database import create_connection
+
+    parser = argparse.ArgumentParser(description="Migrate auth_logs to the compact layout")
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--pause', type=float, default=0.0, help="seconds to sleep between chunks")
+    parser.add_argument('--recheck', type=int, help="ids before the resume point to re-check for late commits "
+                                                    "(default: chunk size)")
+    parser.add_argument('--compare', action='store_true', help="only compare the two layouts")
+    args = parser.parse_args()
+
+    connection = create_connection()
+    if not args.compare:
+        migrate(connection, chunk_size=args.chunk_size, pause=args.pause, recheck=args.recheck)
+    compare_layouts(connection)
+    connection.close()
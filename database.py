@@ -1,30 +1,391 @@
+import argparse
 import mysql.connector
 from mysql.connector import Error
 import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from metrics import gauge, histogram
+from partition_maintenance import partition_clause
 
 load_dotenv()
 
-def create_connection():
+def get_connection_config():
+    """Return connection parameters from the environment"""
+    config = {
+        'host': os.getenv('MYSQL_HOST', 'localhost'),
+        'user': os.getenv('MYSQL_USER', 'root'),
+        'password': os.getenv('MYSQL_PASSWORD', 'your_password'),
+        'database': os.getenv('MYSQL_DATABASE', 'ssh_logs'),
+    }
+    if os.getenv('MYSQL_TIMEOUT'):
+        # Also bounds every read, so a stalled server fails the batch (and spools it) instead of hanging
+        config['connection_timeout'] = int(os.getenv('MYSQL_TIMEOUT'))
+    return config
+
+# Secondary indexes on auth_logs; create_database and bulk loads both build them from here.
+# InnoDB appends the primary key to each one, so (status, timestamp) is really
+# (status, timestamp, id): it serves keyset pages ordered by (timestamp, id)
+# without a filesort, and GROUP BY on its leading column as a covering scan.
+AUTH_LOGS_INDEXES = {
+    'idx_timestamp': '(timestamp)',
+    'idx_status_timestamp': '(status, timestamp)',
+    'idx_source_ip_timestamp': '(source_ip, timestamp)',
+    'idx_username_timestamp': '(username, timestamp)',
+}
+
+COMPACT_INDEXES = {
+    'idx_timestamp': '(timestamp)',
+    'idx_status_timestamp': '(status, timestamp)',
+    'idx_source_ip_timestamp': '(source_ip, timestamp)',
+    'idx_username_timestamp': '(username_id, timestamp)',
+}
+
+# Single-column indexes made redundant by a composite one with the same leading column
+REPLACED_INDEXES = {
+    'idx_status': 'idx_status_timestamp',
+    'idx_source_ip': 'idx_source_ip_timestamp',
+}
+
+POOL_CONNECTIONS = gauge('auth_logs_pool_connections', "Connections in the shared pool by state", ('state',))
+POOL_WAIT_SECONDS = histogram('auth_logs_pool_wait_seconds', "Time spent waiting to check out a connection")
+
+def create_connection(**options):
+    # options override the environment, e.g. host and port for one shard
+    config = get_connection_config()
+    config.update(options)
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST', 'localhost'),
-            user=os.getenv('MYSQL_USER', 'root'),
-            password=os.getenv('MYSQL_PASSWORD', 'your_password'),
-            database=os.getenv('MYSQL_DATABASE', 'ssh_logs')
-        )
+        connection = mysql.connector.connect(**config)
         return connection
     except Error as e:
         print(f"Error connecting to MySQL Database: {e}")
         return None
 
-def create_database():
+def connect_with_backoff(attempts=5, initial_delay=0.1, max_delay=5.0):
+    """Open a connection, retrying with exponential backoff"""
+    delay = initial_delay
+    for attempt in range(1, attempts + 1):
+        try:
+            return mysql.connector.connect(**get_connection_config())
+        except Error as e:
+            if attempt == attempts:
+                raise
+            print(f"Error connecting to MySQL Database (attempt {attempt}/{attempts}): {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections with liveness checks on checkout.
+
+    Connections are opened lazily up to max_size. A checked-out connection is
+    pinged first and transparently replaced (with backoff) if it went away.
+    """
+
+    def __init__(self, max_size=5, checkout_timeout=30.0, ping_interval=1.0):
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.in_use = 0
+        self.last_used = {}
+
+        self.checkouts = 0
+        self.reconnects = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def checkout(self, timeout=None):
+        """Take a live connection from the pool, opening one if allowed"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        connection = None
+        fresh = False
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_open = self.opened < self.max_size
+                if can_open:
+                    self.opened += 1
+            if can_open:
+                try:
+                    connection = connect_with_backoff()
+                    fresh = True
+                except Error:
+                    with self.lock:
+                        self.opened -= 1
+                    raise
+            else:
+                try:
+                    connection = self.idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No database connection available after {timeout}s")
+
+        waited = time.monotonic() - start
+        POOL_WAIT_SECONDS.observe(waited)
+        if not fresh:
+            connection = self._ensure_alive(connection)
+        with self.lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+        return connection
+
+    def checkin(self, connection):
+        """Return a connection to the pool"""
+        with self.lock:
+            self.in_use -= 1
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except Error:
+            pass
+        self.last_used[id(connection)] = time.monotonic()
+        self.idle.put(connection)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that checks a connection out and back in"""
+        connection = self.checkout(timeout)
+        try:
+            yield connection
+        finally:
+            self.checkin(connection)
+
+    def _ensure_alive(self, connection):
+        """Ping a connection that has been idle and reconnect if needed"""
+        idle_since = self.last_used.get(id(connection))
+        if idle_since is not None and time.monotonic() - idle_since < self.ping_interval:
+            return connection
+        try:
+            connection.ping(reconnect=False)
+            return connection
+        except Error:
+            pass
+        self.last_used.pop(id(connection), None)
+        try:
+            connection.close()
+        except Error:
+            pass
+        with self.lock:
+            self.reconnects += 1
+        try:
+            return connect_with_backoff()
+        except Error:
+            with self.lock:
+                self.opened -= 1
+            raise
+
+    def stats(self):
+        """Return pool usage and wait-time metrics"""
+        with self.lock:
+            return {
+                'max_size': self.max_size,
+                'opened': self.opened,
+                'in_use': self.in_use,
+                'idle': self.idle.qsize(),
+                'checkouts': self.checkouts,
+                'reconnects': self.reconnects,
+                'avg_wait_ms': (self.wait_time_total / self.checkouts * 1000
+                                if self.checkouts else 0.0),
+                'max_wait_ms': self.wait_time_max * 1000,
+            }
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.close()
+            except Error:
+                pass
+            with self.lock:
+                self.opened -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(max_size=None):
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            size = max_size or int(os.getenv('MYSQL_POOL_SIZE', '5'))
+            _pool = ConnectionPool(max_size=size)
+            POOL_CONNECTIONS.set_function(lambda: _pool.in_use, state='in_use')
+            POOL_CONNECTIONS.set_function(lambda: _pool.idle.qsize(), state='idle')
+            POOL_CONNECTIONS.set_function(lambda: _pool.max_size, state='max')
+        return _pool
+
+def existing_indexes(cursor, table='auth_logs'):
+    """Return the names of the secondary indexes present on a table"""
+    cursor.execute("""
+        SELECT DISTINCT index_name FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name != 'PRIMARY'
+    """, (table,))
+    return {row[0] for row in cursor.fetchall()}
+
+def create_indexes(cursor, table='auth_logs', indexes=AUTH_LOGS_INDEXES):
+    """Create any missing secondary indexes in a single ALTER TABLE.
+
+    Older single-column indexes replaced by a composite one are dropped in
+    the same statement.
+    """
+    present = existing_indexes(cursor, table)
+    changes = [f"ADD INDEX {name} {columns}"
+               for name, columns in indexes.items() if name not in present]
+    changes += [f"DROP INDEX {name}" for name, replacement in REPLACED_INDEXES.items()
+                if name in present and replacement in indexes]
+    if changes:
+        cursor.execute(f"ALTER TABLE {table} {', '.join(changes)}")
+
+def drop_indexes(cursor, table='auth_logs', indexes=AUTH_LOGS_INDEXES):
+    """Drop the secondary indexes so a large load skips per-row index maintenance"""
+    present = existing_indexes(cursor, table)
+    dropped = [f"DROP INDEX {name}" for name in indexes if name in present]
+    if dropped:
+        cursor.execute(f"ALTER TABLE {table} {', '.join(dropped)}")
+
+def create_compact_tables(cursor):
+    """Create the compact auth_logs layout and a view that decodes it"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS usernames (
+        id INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        username VARCHAR(255) COLLATE utf8mb4_0900_bin NOT NULL,
+        UNIQUE KEY uk_username (username)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS auth_logs_compact (
+        id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        timestamp DATETIME NOT NULL,
+        source_ip VARBINARY(16) NULL,
+        username_id INT UNSIGNED NOT NULL,
+        encrypted_password BLOB,
+        status TINYINT UNSIGNED NOT NULL,
+        attempt_details TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    create_indexes(cursor, 'auth_logs_compact', COMPACT_INDEXES)
+    cursor.execute("""
+    CREATE OR REPLACE VIEW auth_logs_compact_view AS
+    SELECT c.id, c.timestamp, INET6_NTOA(c.source_ip) AS source_ip, u.username,
+           c.encrypted_password, ELT(c.status + 1, 'failed', 'success') AS status,
+           c.attempt_details, c.created_at
+    FROM auth_logs_compact c JOIN usernames u ON u.id = c.username_id
+    """)
+
+def create_rollup_tables(cursor):
+    """Create per-minute rollups of auth_logs and their high-water mark"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS auth_logs_rollup_ip (
+        minute DATETIME NOT NULL,
+        status ENUM('success', 'failed') NOT NULL,
+        source_ip VARCHAR(255) NOT NULL,
+        attempts INT UNSIGNED NOT NULL,
+        PRIMARY KEY (minute, status, source_ip)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS auth_logs_rollup_user (
+        minute DATETIME NOT NULL,
+        status ENUM('success', 'failed') NOT NULL,
+        username VARCHAR(255) NOT NULL,
+        attempts INT UNSIGNED NOT NULL,
+        PRIMARY KEY (minute, status, username)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        id TINYINT UNSIGNED PRIMARY KEY,
+        covered_until DATETIME NOT NULL
+    )
+    """)
+
+def is_partitioned(cursor, table='auth_logs'):
+    """True if the table is partitioned"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL
+    """, (table,))
+    return cursor.fetchone()[0] > 0
+
+def event_hash_key(partitioned):
+    """Unique key on event_hash; a partitioned table must include timestamp in it"""
+    columns = "(event_hash, timestamp)" if partitioned else "(event_hash)"
+    return f"UNIQUE KEY uk_event_hash {columns}"
+
+def add_event_hash_column(cursor, table='auth_logs'):
+    """Add event_hash and its unique key to a table created before deduplication"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = 'event_hash'
+    """, (table,))
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN event_hash BINARY(16) NULL AFTER attempt_details, "
+                   f"ADD {event_hash_key(is_partitioned(cursor, table))}")
+
+def create_auth_logs_table(cursor, table='auth_logs', partitioning=None):
+    """Create auth_logs and its indexes, optionally RANGE partitioned by timestamp.
+
+    partitioning is None, 'daily' or 'hourly'. MySQL requires the partitioning
+    column in every unique key, so a partitioned table uses (id, timestamp)
+    as its primary key and (event_hash, timestamp) as its dedup key.
+    event_hash (dedup.event_hash) is NULL for rows written without a
+    deduplicator, which the unique key allows any number of.
+    """
+    if partitioning:
+        primary_key = "PRIMARY KEY (id, timestamp)"
+        partitions = partition_clause(partitioning)
+    else:
+        primary_key = "PRIMARY KEY (id)"
+        partitions = ""
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INT AUTO_INCREMENT,
+        timestamp DATETIME NOT NULL,
+        source_ip VARCHAR(255) NOT NULL,
+        username VARCHAR(255) NOT NULL,
+        encrypted_password BLOB,
+        status ENUM('success', 'failed') NOT NULL,
+        attempt_details TEXT,
+        event_hash BINARY(16) NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        {primary_key},
+        {event_hash_key(bool(partitioning))}
+    ) {partitions}
+    """)
+    add_event_hash_column(cursor, table)
+    
+    # Create indexes
+    create_indexes(cursor, table)
+
+def create_database(partitioning=None, **options):
+    """Create the ssh_logs schema; partitioning defaults to $AUTH_LOGS_PARTITIONING.
+
+    options override the connection settings, e.g. host and port for one shard.
+    Returns True once the schema exists, False if creating it failed.
+    """
+    partitioning = partitioning or os.getenv('AUTH_LOGS_PARTITIONING') or None
+    connection = None
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST', 'localhost'),
-            user=os.getenv('MYSQL_USER', 'root'),
-            password=os.getenv('MYSQL_PASSWORD', 'your_password')
-        )
+        config = get_connection_config()
+        config.update(options)
+        config.pop('database')
+        connection = mysql.connector.connect(**config)
         cursor = connection.cursor()
         
         # Create database if it doesn't exist
@@ -34,40 +395,43 @@ def create_database():
         cursor.execute("USE ssh_logs")
         
         # Create auth_logs table with encryption support
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS auth_logs (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            timestamp DATETIME NOT NULL,
-            source_ip VARCHAR(255) NOT NULL,
-            username VARCHAR(255) NOT NULL,
-            encrypted_password BLOB,
-            status ENUM('success', 'failed') NOT NULL,
-            attempt_details TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """
-        cursor.execute(create_table_query)
+        create_auth_logs_table(cursor, partitioning=partitioning)
         
-        # Create indexes
-        cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_timestamp ON auth_logs(timestamp)
-        """)
-        cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_status ON auth_logs(status)
-        """)
+        # Compact layout: binary IPs, dictionary-encoded usernames, BIGINT ids
+        create_compact_tables(cursor)
+        
+        # Per-minute rollups for the dashboard queries
+        create_rollup_tables(cursor)
+        
+        # Alerts raised by the streaming brute-force detector
         cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_source_ip ON auth_logs(source_ip)
+        CREATE TABLE IF NOT EXISTS brute_force_alerts (
+            id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+            detected_at DATETIME NOT NULL,
+            key_type ENUM('source_ip', 'username') NOT NULL,
+            key_value VARCHAR(255) NOT NULL,
+            failures INT UNSIGNED NOT NULL,
+            window_start DATETIME NOT NULL,
+            window_end DATETIME NOT NULL,
+            INDEX idx_detected_at (detected_at)
+        )
         """)
         
         connection.commit()
         print("Database and tables created successfully!")
+        return True
         
     except Error as e:
         print(f"Error creating database: {e}")
+        return False
     finally:
-        if connection.is_connected():
+        if connection is not None and connection.is_connected():
             cursor.close()
             connection.close()
 
 if __name__ == "__main__":
-    create_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create the database, auth_logs and rollup tables")
+    parser.add_argument('--partitioning', choices=['daily', 'hourly'],
+                        help="RANGE partition a new auth_logs on timestamp (default $AUTH_LOGS_PARTITIONING)")
+    args = parser.parse_args()
+    sys.exit(0 if create_database(partitioning=args.partitioning) else 1)
@@ -0,0 +1,165 @@
+import hashlib
+import math
+from collections import OrderedDict
+from metrics import counter
+
+# result is dropped (by the prefilter), passed (sent to the database) or rejected (by the unique index)
+DEDUP_ROWS = counter('auth_logs_dedup_rows_total', "Rows checked for duplicates, by outcome", ('result',))
+
+
+def event_hash(row, source=None):
+    """16-byte content hash of an auth_logs row.
+
+    Covers timestamp, source_ip, username, status and attempt_details, the
+    fields that identify an event. The password is left out: it is encrypted
+    with a random nonce, and a plain hash of it could be brute-forced.
+    source, e.g. a log line's inode and byte offset, tells apart events whose
+    content is identical, such as two syslog lines in the same second.
+    """
+    timestamp, source_ip, username, _, status, details = row[:6]
+    fields = (timestamp.isoformat(), source_ip, username, status, details or '')
+    if source is not None:
+        fields += (source,)
+    content = '\x1f'.join(fields)
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over event hashes.
+
+    The event hash is already uniformly distributed, so the bit positions
+    are derived from it directly (double hashing) instead of hashing again.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest):
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+        size = self.size
+        return [(first + i * second) % size for i in range(self.hash_count)]
+
+    def add(self, digest):
+        bits = self.bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+
+class Deduplicator:
+    """Drop rows already stored before they reach the database, and hash the rest.
+
+    Used by BatchWriter(deduplicator=...), which writes the hash to the
+    event_hash column under a unique index, so the database itself rejects
+    any duplicate that gets past this prefilter. Two in-memory structures,
+    both bounded, save the round trips:
+
+    - an exact set of the last recent_size committed hashes: a hit is a
+      certain duplicate and is dropped without asking the database
+    - two generations of Bloom filters of roughly the last 2 * capacity
+      hashes: a miss is certainly new and is inserted directly, a hit may be
+      a false positive and is confirmed with one indexed lookup per batch
+
+    Hashes are only remembered once their batch commits, so a batch that
+    fails and is retried is not mistaken for a duplicate. A row that already
+    ends with its event hash (7 columns) keeps it instead of being hashed.
+    """
+
+    def __init__(self, recent_size=100000, capacity=1000000, error_rate=0.001):
+        self.recent_size = recent_size
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.recent = OrderedDict()
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.previous_bloom = None
+
+        self.rows_seen = 0
+        self.recent_duplicates = 0
+        self.confirmed_duplicates = 0
+        self.late_duplicates = 0
+        self.lookups = 0
+        self.false_positives = 0
+
+    def _maybe_seen(self, digest):
+        return digest in self.bloom or (self.previous_bloom is not None and digest in self.previous_bloom)
+
+    def filter(self, rows, existing_hashes):
+        """Return the rows not seen before, each with its event hash appended.
+
+        existing_hashes(hashes) returns the subset already stored; it is only
+        called for Bloom filter hits, and at most once per call.
+        """
+        self.rows_seen += len(rows)
+        recent = self.recent
+        kept = []
+        batch = set()
+        suspects = []
+        for row in rows:
+            if len(row) > 6:
+                digest = row[6]
+            else:
+                digest = event_hash(row)
+                row = row + (digest,)
+            if digest in recent or digest in batch:
+                self.recent_duplicates += 1
+                continue
+            batch.add(digest)
+            kept.append(row)
+            if self._maybe_seen(digest):
+                suspects.append(digest)
+        if suspects:
+            self.lookups += 1
+            stored = existing_hashes(suspects)
+            self.false_positives += len(suspects) - len(stored)
+            if stored:
+                self.confirmed_duplicates += len(stored)
+                kept = [row for row in kept if row[-1] not in stored]
+
+        DEDUP_ROWS.inc(len(rows) - len(kept), result='dropped')
+        DEDUP_ROWS.inc(len(kept), result='passed')
+        return kept
+
+    def recheck(self, rows, existing_hashes):
+        """Drop hashed rows the database already has, after the unique index rejected some of them"""
+        self.lookups += 1
+        stored = existing_hashes([row[-1] for row in rows])
+        self.late_duplicates += len(stored)
+        DEDUP_ROWS.inc(len(stored), result='rejected')
+        return [row for row in rows if row[-1] not in stored]
+
+    def committed(self, rows):
+        """Remember the hashes of a committed batch (rows as returned by filter)"""
+        recent = self.recent
+        for row in rows:
+            digest = row[-1]
+            recent[digest] = None
+            if self.bloom.count >= self.capacity:
+                # Age out the oldest generation so memory and false positives stay bounded
+                self.previous_bloom = self.bloom
+                self.bloom = BloomFilter(self.capacity, self.error_rate)
+            self.bloom.add(digest)
+        while len(recent) > self.recent_size:
+            recent.popitem(last=False)
+
+    def stats(self):
+        """Return duplicate counts and the share of rows that were duplicates"""
+        duplicates = self.recent_duplicates + self.confirmed_duplicates + self.late_duplicates
+        return {
+            'rows_seen': self.rows_seen,
+            'duplicates': duplicates,
+            'duplicate_rate': round(duplicates / self.rows_seen, 4) if self.rows_seen else 0.0,
+            'recent_duplicates': self.recent_duplicates,
+            'confirmed_duplicates': self.confirmed_duplicates,
+            'late_duplicates': self.late_duplicates,
+            'lookups': self.lookups,
+            'bloom_false_positives': self.false_positives,
+        }
@@ -0,0 +1,378 @@
+import argparse
+import functools
+import glob
+import hashlib
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+KEYS_DIR = os.getenv('ENCRYPTION_KEYS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keys'))
+PUBLIC_KEY_PATH = os.getenv('ENCRYPTION_PUBLIC_KEY', os.path.join(KEYS_DIR, 'public_key.pem'))
+
+# Blob layout: magic | RSA key id | wrapped data key length | wrapped data key | nonce | AES-GCM ciphertext+tag
+MAGIC = b'E1'
+KEY_ID_SIZE = 8
+NONCE_SIZE = 12
+HEADER = struct.Struct('>2s8sH')
+
+OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+
+def key_id(public_key):
+    """Short fingerprint of an RSA public key, stored in every blob it protects"""
+    der = public_key.public_bytes(serialization.Encoding.DER,
+                                  serialization.PublicFormat.SubjectPublicKeyInfo)
+    return hashlib.sha256(der).digest()[:KEY_ID_SIZE]
+
+
+@functools.lru_cache(maxsize=None)
+def load_public_key(path=PUBLIC_KEY_PATH):
+    """Load and parse a PEM public key once per process"""
+    with open(path, 'rb') as f:
+        return serialization.load_pem_public_key(f.read())
+
+
+@functools.lru_cache(maxsize=None)
+def load_private_keys(keys_dir=KEYS_DIR):
+    """Load every private_key*.pem in keys_dir, keyed by the id of its public half.
+
+    Keeping retired private keys next to the current one is what makes RSA
+    key rotation work: old blobs name the key that wrapped their data key.
+    """
+    keys = {}
+    for path in sorted(glob.glob(os.path.join(keys_dir, 'private_key*.pem'))):
+        with open(path, 'rb') as f:
+            private_key = serialization.load_pem_private_key(f.read(), password=None)
+        keys[key_id(private_key.public_key())] = private_key
+    return keys
+
+
+def is_envelope(blob):
+    """Whether blob has the envelope layout, rather than a plaintext or pre-envelope value"""
+    if len(blob) < HEADER.size or not blob.startswith(MAGIC):
+        return False
+    wrapped_length = HEADER.unpack_from(blob)[2]
+    return len(blob) >= HEADER.size + wrapped_length + NONCE_SIZE
+
+
+def split_blob(blob):
+    """Return (key id, wrapped data key, nonce, ciphertext, header) for an encrypted blob"""
+    magic, blob_key_id, wrapped_length = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not an envelope-encrypted value")
+    header_end = HEADER.size + wrapped_length
+    wrapped = blob[HEADER.size:header_end]
+    nonce = blob[header_end:header_end + NONCE_SIZE]
+    return blob_key_id, wrapped, nonce, blob[header_end + NONCE_SIZE:], blob[:header_end]
+
+
+class EnvelopeEncryptor:
+    """Encrypt values with AES-GCM under a data key that is RSA-wrapped once per epoch.
+
+    A fresh 256-bit data key is generated and wrapped with the RSA public
+    key at the start of each epoch; an epoch ends after rotate_rows values or
+    rotate_seconds, whichever comes first. RSA work is therefore paid once
+    per epoch rather than per row. Nonces are a random per-epoch prefix plus
+    a counter, so they never repeat under one data key.
+    """
+
+    def __init__(self, public_key=None, rotate_rows=100000, rotate_seconds=3600):
+        self.public_key = public_key or load_public_key()
+        self.key_id = key_id(self.public_key)
+        self.rotate_rows = rotate_rows
+        self.rotate_seconds = rotate_seconds
+        self.lock = threading.Lock()
+        self.epochs = 0
+        self._new_epoch()
+
+    def _new_epoch(self):
+        data_key = AESGCM.generate_key(bit_length=256)
+        wrapped = self.public_key.encrypt(data_key, OAEP)
+        self.aead = AESGCM(data_key)
+        self.header = HEADER.pack(MAGIC, self.key_id, len(wrapped)) + wrapped
+        self.nonce_prefix = os.urandom(4)
+        self.counter = 0
+        self.epoch_started = time.monotonic()
+        self.epochs += 1
+
+    def rotate(self):
+        """Start a new epoch with a new data key"""
+        with self.lock:
+            self._new_epoch()
+
+    def encrypt_batch(self, values):
+        """Encrypt a list of str/bytes values; None stays None"""
+        with self.lock:
+            if (self.counter + len(values) > self.rotate_rows
+                    or time.monotonic() - self.epoch_started > self.rotate_seconds):
+                self._new_epoch()
+            header = self.header
+            aead = self.aead
+            prefix = self.nonce_prefix
+            counter = self.counter
+            encrypted = []
+            for value in values:
+                if value is None:
+                    encrypted.append(None)
+                    continue
+                if isinstance(value, str):
+                    value = value.encode('utf-8')
+                nonce = prefix + counter.to_bytes(8, 'big')
+                counter += 1
+                encrypted.append(header + nonce + aead.encrypt(nonce, value, header))
+            self.counter = counter
+            return encrypted
+
+    def encrypt(self, value):
+        """Encrypt a single value"""
+        return self.encrypt_batch([value])[0]
+
+    def encrypt_rows(self, rows, column=3):
+        """Return auth_logs rows with the password column encrypted, for BatchWriter"""
+        encrypted = self.encrypt_batch([row[column] for row in rows])
+        return [row[:column] + (value,) + row[column + 1:] for row, value in zip(rows, encrypted)]
+
+
+class EnvelopeDecryptor:
+    """Decrypt envelope blobs, unwrapping each distinct data key only once.
+
+    Unwrapped data keys are kept in an LRU cache bounded by max_keys and
+    expiring after ttl_seconds, so long-running analyst sessions neither
+    repeat RSA work nor keep every key they have ever seen in memory.
+    Values that are not envelopes (rows written with encryption off, or
+    before the envelope format) are returned unchanged and counted in
+    stats()['plaintext']; an envelope wrapped by a key not in private_keys
+    raises KeyError.
+    """
+
+    def __init__(self, private_keys=None, max_keys=1024, ttl_seconds=900):
+        self.private_keys = private_keys or load_private_keys()
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self.data_keys = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.plaintext = 0
+
+    def _split(self, blob):
+        """split_blob() for envelopes, None for any other value"""
+        # An envelope from a key we do not hold fails in data_key(), rather than passing as plaintext
+        return split_blob(blob) if is_envelope(blob) else None
+
+    def data_key(self, blob_key_id, wrapped):
+        """Return (raw data key, AESGCM) for a wrapped data key, unwrapping on a cache miss"""
+        now = time.monotonic()
+        with self.lock:
+            cached = self.data_keys.get(wrapped)
+            if cached is not None and cached[2] > now:
+                self.data_keys.move_to_end(wrapped)
+                self.hits += 1
+                return cached[0], cached[1]
+        private_key = self.private_keys.get(blob_key_id)
+        if private_key is None:
+            raise KeyError(f"No private key with id {blob_key_id.hex()}")
+        raw_key = private_key.decrypt(wrapped, OAEP)
+        aead = AESGCM(raw_key)
+        with self.lock:
+            self.misses += 1
+            self.data_keys[wrapped] = (raw_key, aead, now + self.ttl_seconds)
+            self.data_keys.move_to_end(wrapped)
+            while len(self.data_keys) > self.max_keys:
+                self.data_keys.popitem(last=False)
+        return raw_key, aead
+
+    def unwrap(self, blob_key_id, wrapped):
+        """Return an AESGCM for a wrapped data key"""
+        return self.data_key(blob_key_id, wrapped)[1]
+
+    def decrypt(self, blob):
+        """Decrypt a single blob to bytes"""
+        if blob is None:
+            return None
+        blob = bytes(blob)
+        parts = self._split(blob)
+        if parts is None:
+            self.plaintext += 1
+            return blob
+        blob_key_id, wrapped, nonce, ciphertext, header = parts
+        return self.unwrap(blob_key_id, wrapped).decrypt(nonce, ciphertext, header)
+
+    def decrypt_batch(self, blobs):
+        """Decrypt a list of blobs to bytes"""
+        return [self.decrypt(blob) for blob in blobs]
+
+    def _group_by_data_key(self, blobs):
+        """Map each wrapped data key to [(index, nonce, ciphertext, header)] for its blobs.
+
+        Values that are not envelopes are returned separately as {index: value}.
+        """
+        groups = {}
+        plaintexts = {}
+        for index, blob in enumerate(blobs):
+            if blob is None:
+                continue
+            blob = bytes(blob)
+            parts = self._split(blob)
+            if parts is None:
+                plaintexts[index] = blob
+                continue
+            blob_key_id, wrapped, nonce, ciphertext, header = parts
+            group = groups.get(wrapped)
+            if group is None:
+                group = groups[wrapped] = (blob_key_id, [])
+            group[1].append((index, nonce, ciphertext, header))
+        self.plaintext += len(plaintexts)
+        return groups, plaintexts
+
+    def decrypt_rows(self, rows, column=3, decode=True, processes=None, chunk_size=10000):
+        """Decrypt one column of a result set, returning new rows.
+
+        Rows are grouped by wrapped data key so each key is unwrapped (or
+        fetched from the cache) once per call. With processes, the AES work
+        for very large exports is spread over a process pool; data keys are
+        still unwrapped here, once, and handed to the workers.
+        """
+        rows = list(rows)
+        groups, unencrypted = self._group_by_data_key([row[column] for row in rows])
+        plaintexts = [None] * len(rows)
+        for index, value in unencrypted.items():
+            plaintexts[index] = value
+
+        if processes:
+            tasks = []
+            for wrapped, (blob_key_id, items) in groups.items():
+                raw_key, _ = self.data_key(blob_key_id, wrapped)
+                for start in range(0, len(items), chunk_size):
+                    tasks.append((raw_key, items[start:start + chunk_size]))
+            with multiprocessing.Pool(processes) as pool:
+                for results in pool.imap_unordered(_decrypt_chunk, tasks):
+                    for index, plaintext in results:
+                        plaintexts[index] = plaintext
+        else:
+            for wrapped, (blob_key_id, items) in groups.items():
+                aead = self.unwrap(blob_key_id, wrapped)
+                for index, nonce, ciphertext, header in items:
+                    plaintexts[index] = aead.decrypt(nonce, ciphertext, header)
+
+        if decode:
+            plaintexts = [value.decode('utf-8', 'replace') if value is not None else None
+                          for value in plaintexts]
+        return [tuple(row[:column]) + (value,) + tuple(row[column + 1:])
+                for row, value in zip(rows, plaintexts)]
+
+    def stats(self):
+        """Return data-key cache counters"""
+        return {'cached_keys': len(self.data_keys), 'hits': self.hits, 'misses': self.misses,
+                'plaintext': self.plaintext}
+
+
+def _decrypt_chunk(task):
+    """Process-pool worker: AES-GCM decrypt blobs that share one data key"""
+    raw_key, items = task
+    aead = AESGCM(raw_key)
+    return [(index, aead.decrypt(nonce, ciphertext, header)) for index, nonce, ciphertext, header in items]
+
+
+def fetch_decrypted(cursor, query, params=None, column=None, decryptor=None, processes=None):
+    """Run a query and return its rows with encrypted_password decrypted"""
+    cursor.execute(query, params)
+    if column is None:
+        column = [description[0] for description in cursor.description].index('encrypted_password')
+    decryptor = decryptor or _get_default_decryptor()
+    return decryptor.decrypt_rows(cursor.fetchall(), column, processes=processes)
+
+
+_default_encryptor = None
+_default_decryptor = None
+
+
+def encrypt_data(value):
+    """Encrypt a string or bytes with the default keys"""
+    global _default_encryptor
+    if _default_encryptor is None:
+        _default_encryptor = EnvelopeEncryptor()
+    return _default_encryptor.encrypt(value)
+
+
+def _get_default_decryptor():
+    global _default_decryptor
+    if _default_decryptor is None:
+        _default_decryptor = EnvelopeDecryptor()
+    return _default_decryptor
+
+
+def decrypt_data(blob):
+    """Decrypt a blob produced by encrypt_data back to a string"""
+    return _get_default_decryptor().decrypt(blob).decode('utf-8')
+
+
+def benchmark(row_count=100000, batch_size=1000, with_db=False):
+    """Measure what envelope encryption adds per row, optionally against real batched writes"""
+    import datetime
+    import random
+
+    passwords = ['password123', 'admin123', 'root123', '123456', 'qwerty']
+    encryptor = EnvelopeEncryptor()
+    batches = row_count // batch_size
+    now = datetime.datetime.now()
+    rows = [(now, f"10.0.{i % 256}.{i // 256 % 256}", 'root', random.choice(passwords).encode('utf-8'),
+             'failed', "SSH login attempt") for i in range(batch_size)]
+
+    start = time.monotonic()
+    for _ in range(batches):
+        encryptor.encrypt_rows(rows)
+    per_row_us = (time.monotonic() - start) / (batches * batch_size) * 1e6
+    print(f"Envelope encryption: {per_row_us:.2f} us/row ({encryptor.epochs} data keys wrapped)")
+
+    if with_db:
+        from batch_writer import BatchWriter
+        from database import create_connection
+
+        connection = create_connection()
+        cursor = connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS auth_logs_bench")
+        cursor.execute("CREATE TABLE auth_logs_bench LIKE auth_logs")
+        timings = {}
+        for name, row_encryptor in (('plain', None), ('encrypted', encryptor)):
+            writer = BatchWriter(connection, batch_size=batch_size, max_latency=None,
+                                 table='auth_logs_bench', encryptor=row_encryptor)
+            start = time.monotonic()
+            for _ in range(batches):
+                writer.add_many(rows)
+            writer.close()
+            timings[name] = time.monotonic() - start
+            print(f"Batched writes, {name}: {batches * batch_size / timings[name]:.0f} rows/s")
+        cursor.execute("DROP TABLE auth_logs_bench")
+        cursor.close()
+        connection.close()
+        overhead = (timings['encrypted'] - timings['plain']) / timings['plain'] * 100
+        print(f"Encryption adds {overhead:.1f}% to batched ingest")
+    return per_row_us
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Envelope encryption for auth_logs.encrypted_password")
+    parser.add_argument('--benchmark', type=int, metavar='ROWS', default=100000)
+    parser.add_argument('--with-db', action='store_true', help="also compare batched writes to MySQL")
+    parser.add_argument('--decrypt', metavar='QUERY',
+                        help="run a SELECT including encrypted_password and print rows decrypted")
+    parser.add_argument('--processes', type=int, help="decrypt on a process pool of this size")
+    args = parser.parse_args()
+
+    if args.decrypt:
+        from database import create_connection
+        connection = create_connection()
+        cursor = connection.cursor()
+        for row in fetch_decrypted(cursor, args.decrypt, processes=args.processes):
+            print(row)
+        cursor.close()
+        connection.close()
+    else:
+        benchmark(args.benchmark, with_db=args.with_db)
@@ -0,0 +1,136 @@
+import argparse
+import datetime
+import time
+import numpy as np
+
+
+def zipf_weights(count, exponent):
+    """Probabilities proportional to 1 / rank**exponent for ranks 1..count"""
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+# Octet strings for building dotted quads with object-array concatenation
+OCTETS = np.array([str(i) for i in range(256)], dtype=object)
+OCTETS_DOT = np.array([f"{i}." for i in range(256)], dtype=object)
+
+
+def ips_to_strings(ips):
+    """Convert a uint32 array of IPv4 addresses to an object array of dotted-quad strings"""
+    return (OCTETS_DOT[ips >> 24] + OCTETS_DOT[(ips >> 16) & 255]
+            + OCTETS_DOT[(ips >> 8) & 255] + OCTETS[ips & 255])
+
+
+class EventGenerator:
+    """Generate whole batches of auth_logs rows column by column with NumPy.
+
+    Every column is drawn as an array: source IPs as uint32, usernames and
+    passwords as indices into the simulator's lists, statuses from a single
+    uniform draw against success_rate, and timestamps as a cumulative sum of
+    inter-arrival gaps so they are monotonic. Python objects are only built
+    once, when the columns are zipped into row tuples.
+
+    By default IPs are uniform over the IPv4 space like build_log_row. With
+    attacker_share, that fraction of events instead comes from a pool of
+    attacker_count IPs ranked by a Zipf distribution, so a few attackers
+    dominate. With burst_share, that fraction of events is replaced by bursts
+    of burst_size consecutive failed logins from one IP against one username.
+    """
+
+    def __init__(self, usernames, passwords, success_rate=0.7, attacker_share=0.0,
+                 attacker_count=1000, zipf_exponent=1.2, burst_share=0.0, burst_size=20,
+                 seed=None):
+        self.usernames = np.array(usernames, dtype=object)
+        self.passwords = np.array([password.encode('utf-8') for password in passwords], dtype=object)
+        self.success_rate = success_rate
+        self.attacker_share = attacker_share
+        self.burst_share = burst_share
+        self.burst_size = burst_size
+        self.rng = np.random.default_rng(seed)
+        self.attackers = self.rng.integers(0, 2**32, attacker_count, dtype=np.uint32)
+        self.attacker_weights = zipf_weights(attacker_count, zipf_exponent)
+        self.statuses = np.array(['failed', 'success'], dtype=object)
+        self.next_timestamp = None
+
+    def timestamps(self, count, start=None, rate=None):
+        """Monotonic timestamps with exponential gaps averaging 1 / rate seconds.
+
+        Without a rate every row gets start. Consecutive calls continue from
+        the last timestamp handed out unless a start is given.
+        """
+        if start is None:
+            start = self.next_timestamp or datetime.datetime.now()
+        base = np.datetime64(start, 'us')
+        if not rate:
+            stamps = np.full(count, base)
+        else:
+            gaps = self.rng.exponential(1e6 / rate, count).astype(np.int64)
+            stamps = base + np.cumsum(gaps).astype('timedelta64[us]')
+        self.next_timestamp = stamps[-1].astype(datetime.datetime) if count else start
+        return stamps
+
+    def columns(self, count, start=None, rate=None):
+        """Return a dict of column arrays for count events"""
+        rng = self.rng
+        ips = rng.integers(0, 2**32, count, dtype=np.uint32)
+        if self.attacker_share:
+            from_attackers = rng.random(count) < self.attacker_share
+            picks = rng.choice(len(self.attackers), int(from_attackers.sum()), p=self.attacker_weights)
+            ips[from_attackers] = self.attackers[picks]
+        username_index = rng.integers(0, len(self.usernames), count)
+        password_index = rng.integers(0, len(self.passwords), count)
+        success = rng.random(count) < self.success_rate
+
+        if self.burst_share and count >= self.burst_size:
+            bursts = int(count * self.burst_share / self.burst_size)
+            starts = rng.choice(count - self.burst_size + 1, bursts, replace=False) if bursts else []
+            burst_ips = rng.choice(len(self.attackers), len(starts), p=self.attacker_weights)
+            burst_users = rng.integers(0, len(self.usernames), len(starts))
+            for begin, attacker, user in zip(starts, burst_ips, burst_users):
+                end = begin + self.burst_size
+                ips[begin:end] = self.attackers[attacker]
+                username_index[begin:end] = user
+                success[begin:end] = False
+
+        return {
+            'timestamp': self.timestamps(count, start, rate),
+            'source_ip': ips,
+            'username': username_index,
+            'password': password_index,
+            'success': success,
+        }
+
+    def generate_batch(self, count, start=None, rate=None):
+        """Return count rows in AUTH_LOG_COLUMNS order, ready for BatchWriter.add_many"""
+        columns = self.columns(count, start, rate)
+        timestamps = columns['timestamp'].tolist()
+        ips = ips_to_strings(columns['source_ip'])
+        usernames = self.usernames[columns['username']].tolist()
+        passwords = self.passwords[columns['password']].tolist()
+        statuses = self.statuses[columns['success'].astype(np.int8)].tolist()
+        details = ("SSH login attempt from " + ips).tolist()
+        return list(zip(timestamps, ips.tolist(), usernames, passwords, statuses, details))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-row and vectorized event generation")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--attacker-share', type=float, default=0.3)
+    parser.add_argument('--burst-share', type=float, default=0.05)
+    args = parser.parse_args()
+
+    from ssh_log_simulator import PASSWORDS, USERNAMES, build_log_row
+
+    start = time.perf_counter()
+    for _ in range(args.rows):
+        build_log_row(USERNAMES, PASSWORDS)
+    per_row = time.perf_counter() - start
+
+    generator = EventGenerator(USERNAMES, PASSWORDS,
+                               attacker_share=args.attacker_share, burst_share=args.burst_share)
+    start = time.perf_counter()
+    generator.generate_batch(args.rows, rate=10000)
+    vectorized = time.perf_counter() - start
+
+    print(f"build_log_row:  {args.rows / per_row:,.0f} rows/s")
+    print(f"generate_batch: {args.rows / vectorized:,.0f} rows/s ({per_row / vectorized:.1f}x)")
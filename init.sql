@@ -1,6 +1,9 @@
 CREATE DATABASE IF NOT EXISTS ssh_logs;
 USE ssh_logs;
 
+-- For daily or hourly RANGE partitioning on timestamp, create the schema with
+-- AUTH_LOGS_PARTITIONING=daily python database.py instead of this script and
+-- schedule python partition_maintenance.py to pre-create and drop partitions.
 DROP TABLE IF EXISTS auth_logs;
 CREATE TABLE auth_logs (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -10,8 +13,74 @@ CREATE TABLE auth_logs (
     encrypted_password BLOB,
     status ENUM('success', 'failed') NOT NULL,
     attempt_details TEXT,
+    -- Content hash written by deduplicating writers; NULL for other rows
+    event_hash BINARY(16) NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uk_event_hash (event_hash),
     INDEX idx_timestamp (timestamp),
-    INDEX idx_status (status),
-    INDEX idx_source_ip (source_ip)
-); 
\ No newline at end of file
+    INDEX idx_status_timestamp (status, timestamp),
+    INDEX idx_source_ip_timestamp (source_ip, timestamp),
+    INDEX idx_username_timestamp (username, timestamp)
+);
+
+-- Compact layout: binary IPs, dictionary-encoded usernames, BIGINT ids
+CREATE TABLE IF NOT EXISTS usernames (
+    id INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(255) COLLATE utf8mb4_0900_bin NOT NULL,
+    UNIQUE KEY uk_username (username)
+);
+
+CREATE TABLE IF NOT EXISTS auth_logs_compact (
+    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    timestamp DATETIME NOT NULL,
+    source_ip VARBINARY(16) NULL,
+    username_id INT UNSIGNED NOT NULL,
+    encrypted_password BLOB,
+    status TINYINT UNSIGNED NOT NULL,
+    attempt_details TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_timestamp (timestamp),
+    INDEX idx_status_timestamp (status, timestamp),
+    INDEX idx_source_ip_timestamp (source_ip, timestamp),
+    INDEX idx_username_timestamp (username_id, timestamp)
+);
+
+CREATE OR REPLACE VIEW auth_logs_compact_view AS
+SELECT c.id, c.timestamp, INET6_NTOA(c.source_ip) AS source_ip, u.username,
+       c.encrypted_password, ELT(c.status + 1, 'failed', 'success') AS status,
+       c.attempt_details, c.created_at
+FROM auth_logs_compact c JOIN usernames u ON u.id = c.username_id;
+
+-- Per-minute rollups for the dashboard queries, maintained by the batch writers
+CREATE TABLE IF NOT EXISTS auth_logs_rollup_ip (
+    minute DATETIME NOT NULL,
+    status ENUM('success', 'failed') NOT NULL,
+    source_ip VARCHAR(255) NOT NULL,
+    attempts INT UNSIGNED NOT NULL,
+    PRIMARY KEY (minute, status, source_ip)
+);
+
+CREATE TABLE IF NOT EXISTS auth_logs_rollup_user (
+    minute DATETIME NOT NULL,
+    status ENUM('success', 'failed') NOT NULL,
+    username VARCHAR(255) NOT NULL,
+    attempts INT UNSIGNED NOT NULL,
+    PRIMARY KEY (minute, status, username)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_state (
+    id TINYINT UNSIGNED PRIMARY KEY,
+    covered_until DATETIME NOT NULL
+);
+
+-- Alerts raised by the streaming brute-force detector
+CREATE TABLE IF NOT EXISTS brute_force_alerts (
+    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    detected_at DATETIME NOT NULL,
+    key_type ENUM('source_ip', 'username') NOT NULL,
+    key_value VARCHAR(255) NOT NULL,
+    failures INT UNSIGNED NOT NULL,
+    window_start DATETIME NOT NULL,
+    window_end DATETIME NOT NULL,
+    INDEX idx_detected_at (detected_at)
+);
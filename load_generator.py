@@ -0,0 +1,210 @@
+import argparse
+import datetime
+import multiprocessing
+import queue
+import time
+
+# Seconds a worker may take beyond the run's duration to connect, flush and report
+WORKER_GRACE = 30.0
+
+
+class DeadlinePacer:
+    """Schedule events against absolute deadlines instead of sleeping after each one.
+
+    Event n is due at start + n / rate, so time spent generating and writing
+    is not added to the schedule and the achieved rate does not drift. When
+    the generator falls behind, due() hands out the backlog in bursts of at
+    most max_burst events so it can catch up.
+    """
+
+    def __init__(self, rate, max_burst=1000, start=None):
+        self.rate = float(rate)
+        self.max_burst = max_burst
+        self.start = time.monotonic() if start is None else start
+        self.sent = 0
+
+    def due(self, now=None):
+        """Return how many events are due now, marking them as sent"""
+        now = time.monotonic() if now is None else now
+        count = min(int((now - self.start) * self.rate) + 1 - self.sent, self.max_burst)
+        if count <= 0:
+            return 0
+        self.sent += count
+        return count
+
+    def lag(self, now=None):
+        """Seconds the oldest unsent due event has been waiting"""
+        now = time.monotonic() if now is None else now
+        return max(now - (self.start + self.sent / self.rate), 0.0)
+
+    def wait(self):
+        """Sleep until the next event is due"""
+        delay = self.start + self.sent / self.rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_worker(worker_id, rate, duration_seconds, batch_size, max_latency, rollups,
+               encrypt_passwords, results):
+    """Generate rows at `rate` rows/s over one connection and report timings to results"""
+    from ssh_log_simulator import SSHLogSimulator
+
+    # Each process opens its own connection and writer; nothing is shared across workers
+    try:
+        simulator = SSHLogSimulator(batch_size=batch_size, max_latency=None, rollups=rollups,
+                                    encrypt_passwords=encrypt_passwords)
+    except Exception as e:
+        print(f"Worker {worker_id} could not start: {e}")
+        results.put(failed_report(worker_id))
+        return
+    writer = simulator.writer
+    pacer = DeadlinePacer(rate, max_burst=batch_size)
+    latencies = []
+    max_lag = 0.0
+    batch = []
+    batch_started = None
+    started = time.monotonic()
+    deadline = started + duration_seconds
+
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            count = pacer.due(now)
+            if count:
+                if not batch:
+                    batch_started = now
+                # Spread a burst over the time it covers instead of stamping every row alike
+                batch.extend(simulator.generate_batch(count, start=datetime.datetime.now(), rate=pacer.rate))
+            if batch and (len(batch) >= batch_size or now - batch_started >= max_latency):
+                flush_start = time.monotonic()
+                writer.write(batch)
+                latencies.append(time.monotonic() - flush_start)
+                batch = []
+                max_lag = max(max_lag, pacer.lag())
+            elif not count:
+                pacer.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if batch:
+            flush_start = time.monotonic()
+            writer.write(batch)
+            latencies.append(time.monotonic() - flush_start)
+        elapsed = time.monotonic() - started
+        stats = writer.stats()
+        simulator.cleanup()
+        results.put({
+            'worker': worker_id,
+            'rows': stats['rows_written'],
+            'errors': stats['errors'],
+            'elapsed': elapsed,
+            'max_lag': max_lag,
+            'latencies': latencies,
+        })
+
+
+def failed_report(worker_id):
+    return {'worker': worker_id, 'rows': 0, 'errors': 1, 'elapsed': 0.0, 'max_lag': 0.0, 'latencies': []}
+
+
+def collect_reports(processes, results, timeout):
+    """Wait up to timeout seconds for each worker's report, returning (reports, failed worker ids).
+
+    A worker that exits without reporting (a crash, or killed for running
+    out of memory) or is still running at the deadline counts as failed and
+    gets an empty report with one error, so the run finishes either way.
+    """
+    deadline = time.monotonic() + timeout
+    reports = {}
+    while len(reports) < len(processes):
+        try:
+            report = results.get(timeout=min(1.0, max(deadline - time.monotonic(), 0.01)))
+            reports[report['worker']] = report
+            continue
+        except queue.Empty:
+            pass
+        running = [i for i, process in enumerate(processes) if i not in reports and process.is_alive()]
+        if not running or time.monotonic() >= deadline:
+            break
+    # A worker may have reported just before exiting
+    while len(reports) < len(processes):
+        try:
+            report = results.get(timeout=0.1)
+        except queue.Empty:
+            break
+        reports[report['worker']] = report
+
+    failed = []
+    for i, process in enumerate(processes):
+        if i not in reports and process.is_alive():
+            process.terminate()
+        process.join()
+        if i not in reports or process.exitcode != 0:
+            print(f"Worker {i} failed (exit code {process.exitcode}"
+                  f"{', no report' if i not in reports else ''})")
+            failed.append(i)
+            reports.setdefault(i, failed_report(i))
+    return [reports[i] for i in range(len(processes))], failed
+
+
+def run_load(rate, workers=1, duration_seconds=10, batch_size=1000, max_latency=0.1,
+             rollups=False, encrypt_passwords=True):
+    """Drive `rate` rows/s into MySQL from `workers` processes and return a report"""
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(
+            i, rate / workers, duration_seconds, batch_size, max_latency, rollups,
+            encrypt_passwords, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports, failed = collect_reports(processes, results, duration_seconds + WORKER_GRACE)
+
+    rows = sum(report['rows'] for report in reports)
+    elapsed = max(report['elapsed'] for report in reports)
+    latencies = [latency for report in reports for latency in report['latencies']]
+    return {
+        'workers': workers,
+        'target_rate': rate,
+        'achieved_rate': round(rows / elapsed, 1) if elapsed else 0.0,
+        'rows': rows,
+        'errors': sum(report['errors'] for report in reports),
+        'failed_workers': failed,
+        'batches': len(latencies),
+        'insert_p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'insert_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_lag_s': round(max(report['max_lag'] for report in reports), 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stress-test MySQL with paced simulated SSH logins")
+    parser.add_argument('--rate', type=float, default=10000, help="target rows per second across all workers")
+    parser.add_argument('--workers', type=int, default=4, help="worker processes, one connection each")
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--max-latency', type=float, default=0.1, help="seconds before a partial batch is written")
+    parser.add_argument('--rollups', action='store_true', help="maintain rollups while loading")
+    parser.add_argument('--no-encrypt', action='store_true', help="store passwords unencrypted")
+    args = parser.parse_args()
+
+    report = run_load(args.rate, args.workers, args.duration, args.batch_size, args.max_latency,
+                      args.rollups, not args.no_encrypt)
+    print(f"Target {report['target_rate']:.0f} rows/s, achieved {report['achieved_rate']:.0f} rows/s "
+          f"with {report['workers']} workers ({report['rows']} rows, {report['errors']} failed batches)")
+    if report['failed_workers']:
+        print(f"Failed workers: {report['failed_workers']}")
+    print(f"Insert latency p50 {report['insert_p50_ms']} ms, p99 {report['insert_p99_ms']} ms; "
+          f"max scheduler lag {report['max_lag_s']} s")
@@ -0,0 +1,126 @@
+import argparse
+import datetime
+from rollups import QUERY_SECONDS
+
+BROWSE_COLUMNS = 'id, timestamp, source_ip, username, status'
+
+
+def encode_token(row):
+    """Page token for the row a page ended on: '<timestamp>_<id>'"""
+    return f"{row[1].isoformat()}_{row[0]}"
+
+
+def decode_token(token):
+    """Return (timestamp, id) from a page token"""
+    timestamp, row_id = token.rsplit('_', 1)
+    return datetime.datetime.fromisoformat(timestamp), int(row_id)
+
+
+def _seek_page(name, cursor, where, params, limit, after, table):
+    """Fetch one page ordered newest first, continuing after the (timestamp, id) in `after`.
+
+    The seek predicate is spelled out as an OR rather than a row comparison
+    so MySQL turns it into index ranges on (..., timestamp, id). Every page
+    costs the same however deep it is, unlike OFFSET, which reads and throws
+    away all earlier rows. Returns (rows, token for the next page or None).
+    """
+    conditions = list(where)
+    params = list(params)
+    if after:
+        timestamp, row_id = decode_token(after) if isinstance(after, str) else after
+        conditions.append("(timestamp < %s OR (timestamp = %s AND id < %s))")
+        params.extend([timestamp, timestamp, row_id])
+    query = f"SELECT {BROWSE_COLUMNS} FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY timestamp DESC, id DESC LIMIT {int(limit)}"
+    with QUERY_SECONDS.time(query=name):
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    token = encode_token(rows[-1]) if len(rows) == limit else None
+    return rows, token
+
+
+def recent_entries(cursor, limit=50, after=None, table='auth_logs'):
+    """Browse all attempts newest first (idx_timestamp)"""
+    return _seek_page('recent_entries', cursor, [], [], limit, after, table)
+
+
+def failed_attempts(cursor, since=None, limit=50, after=None, table='auth_logs'):
+    """Browse failed attempts newest first, optionally only those after since (idx_status_timestamp)"""
+    where = ["status = 'failed'"]
+    params = []
+    if since:
+        where.append("timestamp > %s")
+        params.append(since)
+    return _seek_page('failed_attempts', cursor, where, params, limit, after, table)
+
+
+def attempts_from_ip(cursor, source_ip, limit=50, after=None, table='auth_logs'):
+    """Browse one source IP's attempts newest first (idx_source_ip_timestamp)"""
+    return _seek_page('attempts_from_ip', cursor, ["source_ip = %s"], [source_ip], limit, after, table)
+
+
+def attempts_for_username(cursor, username, limit=50, after=None, table='auth_logs'):
+    """Browse one username's attempts newest first (idx_username_timestamp)"""
+    return _seek_page('attempts_for_username', cursor, ["username = %s"], [username], limit, after, table)
+
+
+def source_ip_counts(cursor, limit=100, after_ip=None, table='auth_logs'):
+    """Page through per-IP attempt counts in IP order.
+
+    Grouping on the leading column of idx_source_ip_timestamp is a covering
+    index scan without a temporary table, and the next page seeks past the
+    last IP. Returns (rows, last IP for the next page or None).
+    """
+    query = f"SELECT source_ip, COUNT(*) FROM {table}"
+    params = []
+    if after_ip is not None:
+        query += " WHERE source_ip > %s"
+        params.append(after_ip)
+    query += f" GROUP BY source_ip ORDER BY source_ip LIMIT {int(limit)}"
+    with QUERY_SECONDS.time(query='source_ip_counts'):
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    return rows, rows[-1][0] if len(rows) == limit else None
+
+
+def explain(cursor, query, params=None):
+    """Return EXPLAIN output as a list of dicts"""
+    cursor.execute("EXPLAIN " + query, params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+if __name__ == "__main__":
+    from database import create_connection
+
+    parser = argparse.ArgumentParser(description="Browse auth_logs with keyset pagination")
+    parser.add_argument('view', choices=['recent', 'failed', 'ip', 'user', 'ips'])
+    parser.add_argument('value', nargs='?', help="source IP for 'ip', username for 'user'")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--after', help="page token printed by the previous page")
+    parser.add_argument('--since-hours', type=float, help="only failures in the last N hours")
+    args = parser.parse_args()
+
+    connection = create_connection()
+    cursor = connection.cursor()
+    if args.view == 'ips':
+        rows, token = source_ip_counts(cursor, args.limit, args.after)
+    elif args.view == 'recent':
+        rows, token = recent_entries(cursor, args.limit, args.after)
+    elif args.view == 'failed':
+        since = None
+        if args.since_hours:
+            since = datetime.datetime.now() - datetime.timedelta(hours=args.since_hours)
+        rows, token = failed_attempts(cursor, since, args.limit, args.after)
+    elif args.view == 'ip':
+        rows, token = attempts_from_ip(cursor, args.value, args.limit, args.after)
+    else:
+        rows, token = attempts_for_username(cursor, args.value, args.limit, args.after)
+    for row in rows:
+        print(row)
+    if token:
+        print(f"Next page: --after {token}")
+    cursor.close()
+    connection.close()
@@ -0,0 +1,199 @@
+import argparse
+import datetime
+import os
+import time
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+
+ARCHIVE_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('timestamp', pa.timestamp('us')),
+    ('source_ip', pa.string()),
+    ('username', pa.string()),
+    ('encrypted_password', pa.binary()),
+    ('status', pa.string()),
+    ('attempt_details', pa.string()),
+])
+
+# Hive-style date=YYYY-MM-DD directories, so date filters skip whole directories
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.date32())]), flavor='hive')
+DICTIONARY_COLUMNS = ['source_ip', 'username', 'status']
+# Ids per DELETE, below SQLite's limit on bound parameters
+DELETE_BATCH = 900
+
+
+def write_day(rows, day, archive_dir=ARCHIVE_DIR, row_group_size=65536):
+    """Write one day's rows to date=<day>/part-<first id>.parquet and return its path.
+
+    Rows are sorted by source_ip then timestamp, so row-group statistics let
+    source IP lookups skip most row groups. The file is written under
+    a temporary name and renamed, so readers never see a partial file and a
+    rerun after a crash replaces it instead of duplicating rows.
+    """
+    rows.sort(key=lambda row: (row[2], row[1]))
+    columns = list(zip(*rows))
+    table = pa.Table.from_arrays([pa.array(column, type=field.type)
+                                  for column, field in zip(columns, ARCHIVE_SCHEMA)],
+                                 schema=ARCHIVE_SCHEMA)
+    directory = os.path.join(archive_dir, f"date={day.isoformat()}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{min(columns[0]):012d}.parquet")
+    pq.write_table(table, path + '.tmp', compression='zstd', use_dictionary=DICTIONARY_COLUMNS,
+                   row_group_size=row_group_size, write_statistics=True)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def archive(backend, cutoff, archive_dir=ARCHIVE_DIR, chunk_size=50000, pause=0.0, table='auth_logs',
+            rollups=True):
+    """Move rows older than cutoff from table into daily Parquet files.
+
+    Works through the table in id order, one chunk at a time: the chunk is
+    written to Parquet first and only then deleted from the database in its
+    own short transaction, so the database never holds long locks and no row
+    is deleted before it is on disk. Rerunning with the same chunk_size
+    after a crash rewrites the same files. With rollups, the source IP
+    rollup is pruned before the cutoff afterwards, since IP history is
+    queried from the archive; the username rollup is kept, so dashboard
+    totals still include archived rows. Returns (rows archived, files written).
+    """
+    columns = 'id, timestamp, source_ip, username, encrypted_password, status, attempt_details'
+    cutoff_param = backend.adapt_timestamp(cutoff)
+    last_id = 0
+    archived = 0
+    files = set()
+    while True:
+        rows = backend.execute(f"SELECT {columns} FROM {table} WHERE id > %s AND timestamp < %s "
+                               f"ORDER BY id LIMIT {int(chunk_size)}", (last_id, cutoff_param))
+        if not rows:
+            break
+        by_day = {}
+        for row in rows:
+            timestamp = row[1]
+            if isinstance(timestamp, str):
+                timestamp = datetime.datetime.fromisoformat(timestamp)
+            row = (row[0], timestamp) + tuple(row[2:])
+            by_day.setdefault(timestamp.date(), []).append(row)
+        for day, day_rows in by_day.items():
+            files.add(write_day(day_rows, day, archive_dir))
+
+        # Delete exactly the archived ids: a row inserted into the range meanwhile was never archived
+        ids = [row[0] for row in rows]
+        last_id = ids[-1]
+        for start in range(0, len(ids), DELETE_BATCH):
+            batch = ids[start:start + DELETE_BATCH]
+            backend.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(batch))})", batch)
+        backend.connection.commit()
+        archived += len(rows)
+        print(f"Archived {archived} rows (through id {last_id})")
+        if pause:
+            time.sleep(pause)
+    if rollups and archived and backend.supports_rollups and table == 'auth_logs':
+        from rollups import minute_floor, prune_rollups
+        before = minute_floor(cutoff)
+        pruned = prune_rollups(backend.connection, before, columns=('source_ip',))
+        print(f"Pruned {pruned} source IP rollup rows before {before}")
+    return archived, len(files)
+
+
+def archive_filter(start=None, end=None, status=None, source_ip=None, username=None):
+    """Build a dataset filter; the date bounds prune directories, the rest row groups and rows"""
+    conditions = []
+    if start:
+        conditions.append(ds.field('date') >= start.date())
+        conditions.append(ds.field('timestamp') >= pa.scalar(start, pa.timestamp('us')))
+    if end:
+        conditions.append(ds.field('date') <= end.date())
+        conditions.append(ds.field('timestamp') < pa.scalar(end, pa.timestamp('us')))
+    for name, value in (('status', status), ('source_ip', source_ip), ('username', username)):
+        if value is not None:
+            conditions.append(ds.field(name) == value)
+    combined = None
+    for condition in conditions:
+        combined = condition if combined is None else combined & condition
+    return combined
+
+
+def query_archive(columns, archive_dir=ARCHIVE_DIR, **filters):
+    """Read only the given columns of matching archived rows as a pyarrow Table"""
+    if not os.path.isdir(archive_dir):
+        return pa.table({name: pa.array([], type=ARCHIVE_SCHEMA.field(name).type) for name in columns})
+    dataset = ds.dataset(archive_dir, format='parquet', partitioning=PARTITIONING)
+    return dataset.to_table(columns=columns, filter=archive_filter(**filters))
+
+
+def _grouped_counts(column, limit=None, archive_dir=ARCHIVE_DIR, **filters):
+    table = query_archive([column], archive_dir, **filters)
+    counts = table.group_by(column).aggregate([([], 'count_all')])
+    counts = counts.sort_by([('count_all', 'descending'), (column, 'ascending')])
+    if limit:
+        counts = counts.slice(0, limit)
+    return list(zip(counts[column].to_pylist(), counts['count_all'].to_pylist()))
+
+
+def archived_counts_by_status(archive_dir=ARCHIVE_DIR, **filters):
+    """Return {'success': n, 'failed': n} over archived rows"""
+    counts = {'success': 0, 'failed': 0}
+    counts.update(_grouped_counts('status', archive_dir=archive_dir, **filters))
+    return counts
+
+
+def archived_failed_count(archive_dir=ARCHIVE_DIR, **filters):
+    """Number of archived failed attempts; only row groups holding failures are read"""
+    filters['status'] = 'failed'
+    return query_archive(['status'], archive_dir, **filters).num_rows
+
+
+def archived_top_source_ips(limit=5, archive_dir=ARCHIVE_DIR, **filters):
+    """Return [(source_ip, attempts)] for the most active archived IPs"""
+    return _grouped_counts('source_ip', limit, archive_dir, **filters)
+
+
+def archived_attempts_by_username(archive_dir=ARCHIVE_DIR, **filters):
+    """Return [(username, attempts)] over archived rows"""
+    return _grouped_counts('username', archive_dir=archive_dir, **filters)
+
+
+def archive_size(archive_dir=ARCHIVE_DIR):
+    """Return (file count, total bytes) of the archive"""
+    files = 0
+    size = 0
+    for directory, _, names in os.walk(archive_dir):
+        for name in names:
+            if name.endswith('.parquet'):
+                files += 1
+                size += os.path.getsize(os.path.join(directory, name))
+    return files, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive aged auth_logs rows to Parquet and query the archive")
+    parser.add_argument('--archive-days', type=float, help="move rows older than N days to Parquet")
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--pause', type=float, default=0.0, help="seconds to sleep between chunks")
+    parser.add_argument('--dir', default=ARCHIVE_DIR, help="archive directory")
+    parser.add_argument('--since-days', type=float, help="restrict archive queries to the last N days")
+    parser.add_argument('--keep-rollups', action='store_true', help="do not prune the source IP rollup")
+    args = parser.parse_args()
+
+    if args.archive_days:
+        from storage import get_backend
+        backend = get_backend()
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=args.archive_days)
+        rows, files = archive(backend, cutoff, args.dir, args.chunk_size, args.pause,
+                              rollups=not args.keep_rollups)
+        print(f"Archived {rows} rows into {files} files")
+        backend.close()
+
+    filters = {}
+    if args.since_days:
+        filters['start'] = datetime.datetime.now() - datetime.timedelta(days=args.since_days)
+    files, size = archive_size(args.dir)
+    print(f"Archive: {files} files, {size / 1e6:.1f} MB")
+    print(f"By status: {archived_counts_by_status(args.dir, **filters)}")
+    print(f"Top source IPs: {archived_top_source_ips(5, args.dir, **filters)}")
+    print(f"By username: {archived_attempts_by_username(args.dir, **filters)}")
@@ -0,0 +1,150 @@
+import argparse
+import datetime
+
+GRANULARITIES = {
+    'daily': (datetime.timedelta(days=1), 'p%Y%m%d'),
+    'hourly': (datetime.timedelta(hours=1), 'p%Y%m%d%H'),
+}
+
+HISTORY_PARTITION = 'p_history'
+CATCH_ALL_PARTITION = 'p_future'
+
+
+def period_start(moment, granularity):
+    """Truncate a datetime to the start of its partition period"""
+    if granularity == 'hourly':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_definition(start, granularity):
+    """Return the PARTITION clause for the period starting at start"""
+    step, name_format = GRANULARITIES[granularity]
+    return (f"PARTITION {start.strftime(name_format)} "
+            f"VALUES LESS THAN ('{(start + step).isoformat(' ')}')")
+
+
+def partition_clause(granularity, ahead=7, now=None):
+    """Build PARTITION BY RANGE COLUMNS(timestamp) for a new auth_logs table.
+
+    Rows older than the current period go to p_history, the current and next
+    `ahead` periods get their own partitions, and p_future catches anything
+    beyond so inserts never fail when maintenance runs late.
+    """
+    step, _ = GRANULARITIES[granularity]
+    start = period_start(now or datetime.datetime.now(), granularity)
+    partitions = [f"PARTITION {HISTORY_PARTITION} VALUES LESS THAN ('{start.isoformat(' ')}')"]
+    for i in range(ahead + 1):
+        partitions.append(partition_definition(start + step * i, granularity))
+    partitions.append(f"PARTITION {CATCH_ALL_PARTITION} VALUES LESS THAN (MAXVALUE)")
+    return "PARTITION BY RANGE COLUMNS(timestamp) (\n    " + ",\n    ".join(partitions) + "\n)"
+
+
+def list_partitions(cursor, table='auth_logs'):
+    """Return [(name, upper_bound datetime or None for MAXVALUE)] in partition order"""
+    cursor.execute("""
+        SELECT partition_name, partition_description FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL
+        ORDER BY partition_ordinal_position
+    """, (table,))
+    partitions = []
+    for name, description in cursor.fetchall():
+        bound = None
+        if description != 'MAXVALUE':
+            bound = datetime.datetime.fromisoformat(description.strip("'"))
+        partitions.append((name, bound))
+    return partitions
+
+
+def create_future_partitions(cursor, granularity, ahead=7, table='auth_logs', now=None):
+    """Split p_future so every period up to `ahead` periods from now has a partition.
+
+    Reorganizing p_future is cheap as long as it is empty, which it is while
+    maintenance keeps ahead of the clock.
+    """
+    step, _ = GRANULARITIES[granularity]
+    partitions = list_partitions(cursor, table)
+    bounds = [bound for _, bound in partitions if bound is not None]
+    if not bounds:
+        raise ValueError(f"{table} is not partitioned by timestamp")
+
+    start = max(bounds)
+    target = period_start(now or datetime.datetime.now(), granularity) + step * (ahead + 1)
+    new_partitions = []
+    while start < target:
+        new_partitions.append(partition_definition(start, granularity))
+        start += step
+    if new_partitions:
+        new_partitions.append(f"PARTITION {CATCH_ALL_PARTITION} VALUES LESS THAN (MAXVALUE)")
+        cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION {CATCH_ALL_PARTITION} INTO "
+                       f"({', '.join(new_partitions)})")
+    return len(new_partitions) - 1 if new_partitions else 0
+
+
+def drop_expired_partitions(cursor, retention, table='auth_logs', now=None):
+    """Drop every partition whose rows are all older than now - retention.
+
+    Dropping a partition removes its tablespace file instead of deleting rows
+    one by one, so the cost does not depend on how many rows it holds.
+    """
+    cutoff = (now or datetime.datetime.now()) - retention
+    expired = [name for name, bound in list_partitions(cursor, table)
+               if bound is not None and bound <= cutoff]
+    if expired:
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+    return expired
+
+
+def pruned_partitions(cursor, query, params=None):
+    """Return the partitions EXPLAIN says a query will read"""
+    cursor.execute("EXPLAIN " + query, params)
+    columns = [column[0] for column in cursor.description]
+    partitions = set()
+    for row in cursor.fetchall():
+        value = row[columns.index('partitions')]
+        if value:
+            partitions.update(value.split(','))
+    return partitions
+
+
+def run_maintenance(connection, granularity, retention, ahead=7, table='auth_logs', rollups=True):
+    """Pre-create upcoming partitions and drop expired ones.
+
+    With rollups, the rollup buckets of the dropped rows are deleted too, so
+    dashboards stop counting data that no longer exists.
+    """
+    cursor = connection.cursor()
+    try:
+        created = create_future_partitions(cursor, granularity, ahead, table)
+        bounds = dict(list_partitions(cursor, table))
+        dropped = drop_expired_partitions(cursor, retention, table)
+        print(f"Created {created} partitions, dropped {len(dropped)} expired partitions"
+              + (f": {', '.join(dropped)}" if dropped else ""))
+    finally:
+        cursor.close()
+    if rollups and dropped:
+        from rollups import prune_rollups
+        # Every row before the newest dropped bound is gone
+        before = max(bounds[name] for name in dropped)
+        pruned = prune_rollups(connection, before)
+        print(f"Pruned {pruned} rollup rows before {before}")
+    return created, dropped
+
+
+if __name__ == "__main__":
+    from database import create_connection
+
+    parser = argparse.ArgumentParser(description="Maintain time-range partitions of auth_logs")
+    parser.add_argument('--granularity', choices=sorted(GRANULARITIES), default='daily')
+    parser.add_argument('--retention-days', type=float, default=30)
+    parser.add_argument('--ahead', type=int, default=7, help="periods to pre-create")
+    parser.add_argument('--table', default='auth_logs')
+    parser.add_argument('--keep-rollups', action='store_true',
+                        help="keep rollup buckets of dropped partitions")
+    args = parser.parse_args()
+
+    connection = create_connection()
+    # Rollups summarize auth_logs only
+    run_maintenance(connection, args.granularity, datetime.timedelta(days=args.retention_days),
+                    args.ahead, args.table, rollups=args.table == 'auth_logs' and not args.keep_rollups)
+    connection.close()
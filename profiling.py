@@ -0,0 +1,207 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class _Stage:
+    """Accumulated time and call count for one named stage, used as a with block.
+
+    Not reentrant: each stage is timed by one thread at a time, as the
+    simulator, ingest loop and BatchWriter (whose flush holds its lock) do.
+    """
+
+    __slots__ = ('name', 'total', 'calls', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.total = 0.0
+        self.calls = 0
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.total += time.perf_counter() - self.start
+        self.calls += 1
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+class SamplingProfiler:
+    """Sample every thread's Python stack at a fixed interval into collapsed-stack counts.
+
+    write() produces the 'frame;frame;frame count' format read by
+    flamegraph.pl, inferno and speedscope. Unlike cProfile it also sees the
+    BatchWriter flush thread and adds almost no per-call overhead.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)).replace(' ', '_'))
+                self.counts[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class StageProfiler:
+    """Per-stage wall-clock breakdown, optionally with a whole-run profile dump.
+
+    Hot paths wrap their stages in `with profiler.stage('execute'):`. With
+    output set, start() also begins a profile written by stop(): a *.prof
+    path gets cProfile stats (snakeviz, flameprof, gprof2dot), any other
+    path collapsed stacks from SamplingProfiler (flamegraph.pl, speedscope).
+    Code that is not being profiled uses NULL_PROFILER, whose stages do
+    nothing.
+    """
+
+    enabled = True
+
+    def __init__(self, output=None, sample_interval=0.005):
+        self.output = output
+        self.sample_interval = sample_interval
+        self.stages = {}
+        self.started_at = time.perf_counter()
+        self.stopped_at = None
+        self._profile = None
+
+    def stage(self, name):
+        """Return the timer for name, creating it on first use"""
+        timer = self.stages.get(name)
+        if timer is None:
+            timer = self.stages.setdefault(name, _Stage(name))
+        return timer
+
+    def iterate(self, name, iterable):
+        """Yield from iterable, timing each step under name (e.g. reading lines)"""
+        timer = self.stage(name)
+        iterator = iter(iterable)
+        while True:
+            with timer:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def start(self):
+        """Restart the wall clock and begin the profile dump, if any"""
+        self.started_at = time.perf_counter()
+        if not self.output:
+            return
+        if self.output.endswith('.prof'):
+            # cProfile only follows the thread that enabled it
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._profile = SamplingProfiler(self.sample_interval)
+            self._profile.start()
+
+    def stop(self):
+        """Stop the wall clock and write the profile dump, if any"""
+        self.stopped_at = time.perf_counter()
+        if self._profile is None:
+            return
+        if isinstance(self._profile, cProfile.Profile):
+            self._profile.disable()
+            self._profile.dump_stats(self.output)
+        else:
+            self._profile.stop()
+            self._profile.write(self.output)
+        self._profile = None
+        print(f"Profile written to {self.output}")
+
+    def breakdown(self):
+        """Return [(stage, calls, total seconds, share of wall time)] slowest first"""
+        wall = (self.stopped_at or time.perf_counter()) - self.started_at
+        return [(timer.name, timer.calls, timer.total, timer.total / wall if wall else 0.0)
+                for timer in sorted(self.stages.values(), key=lambda timer: -timer.total)]
+
+    def report(self):
+        """Per-stage breakdown as a printable table"""
+        wall = (self.stopped_at or time.perf_counter()) - self.started_at
+        lines = [f"Stage breakdown over {wall:.2f} s wall time:",
+                 f"  {'stage':<12} {'calls':>10} {'total s':>10} {'% wall':>8} {'avg us':>10}"]
+        for name, calls, total, share in self.breakdown():
+            average = total / calls * 1e6 if calls else 0.0
+            lines.append(f"  {name:<12} {calls:>10} {total:>10.3f} {share * 100:>7.1f}% {average:>10.1f}")
+        return '\n'.join(lines)
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off; every method is a no-op"""
+
+    enabled = False
+
+    def stage(self, name):
+        return NULL_STAGE
+
+    def iterate(self, name, iterable):
+        return iterable
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def breakdown(self):
+        return []
+
+    def report(self):
+        return ''
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def get_profiler(enabled=False, output=None):
+    """StageProfiler if enabled or a dump was requested, otherwise NULL_PROFILER"""
+    if enabled or output:
+        return StageProfiler(output)
+    return NULL_PROFILER
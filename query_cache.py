@@ -0,0 +1,169 @@
+import argparse
+import threading
+import time
+from collections import OrderedDict
+from metrics import counter
+
+CACHE_LOOKUPS = counter('auth_logs_query_cache_lookups_total', "Result cache lookups by outcome", ('result',))
+
+
+def id_watermark(connection, table='auth_logs', window=100000):
+    """Watermark of (MAX(id), rows among the last window ids), two primary-key probes.
+
+    Ids are assigned at insert but become visible at commit, so a batch can
+    commit below an id already seen and MAX(id) alone would not move. The
+    count over the recent id range catches such late commits, as long as
+    they land within window ids of the maximum.
+
+    Use an autocommit connection: under REPEATABLE READ a connection that
+    never commits keeps reading its first snapshot and never sees new rows.
+    """
+    def watermark():
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+            newest = cursor.fetchone()[0]
+            cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE id > {int(newest) - int(window)}")
+            return newest, cursor.fetchone()[0]
+        finally:
+            cursor.close()
+    return watermark
+
+
+class CommitWatermark:
+    """In-process watermark: a BatchWriter after_commit hook counting committed batches.
+
+    Pass its value method as the cache's watermark.
+    """
+
+    def __init__(self):
+        self.commits = 0
+
+    def __call__(self, rows):
+        self.commits += 1
+
+    def value(self):
+        return self.commits
+
+
+class QueryCache:
+    """Cache query results until new rows are ingested.
+
+    Each entry remembers the ingest watermark it was computed at (from
+    watermark(), e.g. id_watermark or a commit counter) and is served until the
+    watermark moves. The watermark itself is re-read at most every
+    watermark_interval seconds, so a burst of dashboard requests costs one
+    cheap probe instead of one aggregate query each. ttl_seconds bounds
+    staleness for changes the watermark cannot see, such as deletes or
+    retention drops, and max_entries bounds memory with LRU eviction.
+
+    Arguments are part of the key, so callers passing a moving `since`
+    should round it (e.g. to the minute) to get hits.
+    """
+
+    def __init__(self, watermark, ttl_seconds=60.0, max_entries=256, watermark_interval=1.0):
+        self.watermark = watermark
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.watermark_interval = watermark_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.current_mark = None
+        self.mark_read_at = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+    def _mark(self, now):
+        """Current watermark, re-read if the last read is older than watermark_interval"""
+        if self.mark_read_at is None or now - self.mark_read_at >= self.watermark_interval:
+            self.current_mark = self.watermark()
+            self.mark_read_at = now
+        return self.current_mark
+
+    def get(self, key, compute):
+        """Return the cached value for key, or compute() it and cache the result"""
+        now = time.monotonic()
+        with self.lock:
+            mark = self._mark(now)
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, entry_mark, computed_at, cost = entry
+                if entry_mark != mark:
+                    self.invalidations += 1
+                elif now - computed_at > self.ttl_seconds:
+                    self.expirations += 1
+                else:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    self.saved_seconds += cost
+                    CACHE_LOOKUPS.inc(result='hit')
+                    return value
+            self.misses += 1
+            CACHE_LOOKUPS.inc(result='miss')
+
+        start = time.monotonic()
+        value = compute()
+        cost = time.monotonic() - start
+        with self.lock:
+            self.entries[key] = (value, mark, start, cost)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def query(self, function, cursor, *args, **kwargs):
+        """Call function(cursor, *args, **kwargs) through the cache, keyed on everything but the cursor"""
+        key = (function.__module__, function.__qualname__, args, tuple(sorted(kwargs.items())))
+        return self.get(key, lambda: function(cursor, *args, **kwargs))
+
+    def clear(self):
+        """Drop every entry"""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the query time saved by hits"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'saved_query_seconds': round(self.saved_seconds, 3),
+        }
+
+
+if __name__ == "__main__":
+    from database import create_connection
+    from rollups import attempts_by_username, counts_by_status, top_failing_source_ips, total_count
+
+    parser = argparse.ArgumentParser(description="Poll the dashboard queries through the result cache")
+    parser.add_argument('--interval', type=float, default=2.0, help="seconds between dashboard refreshes")
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--ttl', type=float, default=60.0)
+    args = parser.parse_args()
+
+    connection = create_connection(autocommit=True)
+    cursor = connection.cursor()
+    cache = QueryCache(id_watermark(connection), ttl_seconds=args.ttl)
+    try:
+        for _ in range(args.iterations):
+            print(f"Total entries: {cache.query(total_count, cursor)}")
+            print(f"By status: {cache.query(counts_by_status, cursor)}")
+            print(f"Top failing source IPs: {cache.query(top_failing_source_ips, cursor, 5)}")
+            print(f"By username: {cache.query(attempts_by_username, cursor)}")
+            print(f"Cache: {cache.stats()}")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    cursor.close()
+    connection.close()
@@ -0,0 +1,215 @@
+import argparse
+import datetime
+from collections import Counter
+from metrics import histogram
+
+ROLLUP_TABLES = {
+    'source_ip': 'auth_logs_rollup_ip',
+    'username': 'auth_logs_rollup_user',
+}
+
+# Rows each rollup covers, as a condition on auth_logs (see RollupMaintainer)
+ROLLUP_FILTERS = {
+    'source_ip': " AND status = 'failed'",
+    'username': "",
+}
+
+QUERY_SECONDS = histogram('auth_logs_query_seconds', "Dashboard and browse query latency", ('query',))
+
+
+def minute_floor(moment):
+    """Truncate a datetime to the start of its minute"""
+    return moment.replace(second=0, microsecond=0)
+
+
+def minute_ceil(moment):
+    """Round a datetime up to the next minute boundary unless it already is one"""
+    floor = minute_floor(moment)
+    return floor if floor == moment else floor + datetime.timedelta(minutes=1)
+
+
+class RollupMaintainer:
+    """BatchWriter before_commit hook that folds each batch into the rollups.
+
+    Counts are upserted in the batch transaction, so rollups and raw rows
+    commit or roll back together. rollup_state.covered_until records the
+    newest timestamp rolled up so far. The IP rollup only counts failed
+    attempts: successful logins come from scattered client IPs and would
+    need about one rollup row per event, while failures concentrate on the
+    attackers the dashboard ranks.
+    """
+
+    def __call__(self, cursor, rows):
+        by_ip = Counter()
+        by_user = Counter()
+        newest = None
+        for timestamp, source_ip, username, _, status, *_ in rows:
+            minute = minute_floor(timestamp)
+            if status == 'failed':
+                by_ip[(minute, status, source_ip)] += 1
+            by_user[(minute, status, username)] += 1
+            if newest is None or timestamp > newest:
+                newest = timestamp
+
+        for column, counts in (('source_ip', by_ip), ('username', by_user)):
+            if not counts:
+                continue
+            table = ROLLUP_TABLES[column]
+            # Sorted keys keep lock order consistent between concurrent writers
+            keys = sorted(counts)
+            values = []
+            for key in keys:
+                values.extend(key)
+                values.append(counts[key])
+            cursor.execute(
+                f"INSERT INTO {table} (minute, status, {column}, attempts) VALUES "
+                + ', '.join(['(%s, %s, %s, %s)'] * len(keys))
+                + f" AS new ON DUPLICATE KEY UPDATE attempts = {table}.attempts + new.attempts",
+                values
+            )
+
+        if newest is not None:
+            cursor.execute("""
+                INSERT INTO rollup_state (id, covered_until) VALUES (1, %s) AS new
+                ON DUPLICATE KEY UPDATE covered_until = GREATEST(rollup_state.covered_until, new.covered_until)
+            """, (newest,))
+
+
+def rebuild_rollups(connection, start, end):
+    """Recompute rollups for [start, end) from auth_logs.
+
+    Needed after rows reach auth_logs without a RollupMaintainer, such as
+    LOAD DATA backfills or the compact-layout migration.
+    """
+    start, end = minute_floor(start), minute_ceil(end)
+    cursor = connection.cursor()
+    for column, table in ROLLUP_TABLES.items():
+        cursor.execute(f"DELETE FROM {table} WHERE minute >= %s AND minute < %s", (start, end))
+        cursor.execute(f"""
+            INSERT INTO {table} (minute, status, {column}, attempts)
+            SELECT timestamp - INTERVAL SECOND(timestamp) SECOND, status, {column}, COUNT(*)
+            FROM auth_logs WHERE timestamp >= %s AND timestamp < %s{ROLLUP_FILTERS[column]}
+            GROUP BY 1, status, {column}
+        """, (start, end))
+    cursor.execute("""
+        INSERT INTO rollup_state (id, covered_until) VALUES (1, %s) AS new
+        ON DUPLICATE KEY UPDATE covered_until = GREATEST(rollup_state.covered_until, new.covered_until)
+    """, (end - datetime.timedelta(seconds=1),))
+    connection.commit()
+    cursor.close()
+
+
+def prune_rollups(connection, before, chunk_size=10000, columns=None):
+    """Delete rollup buckets older than before, e.g. once retention dropped their rows.
+
+    columns limits pruning to the rollups of those columns (default all).
+    Deletes in chunks of chunk_size rows, each its own transaction, so a large
+    backlog does not hold locks for long. Returns the number of rows deleted.
+    """
+    cursor = connection.cursor()
+    deleted = 0
+    for column in columns or ROLLUP_TABLES:
+        table = ROLLUP_TABLES[column]
+        while True:
+            cursor.execute(f"DELETE FROM {table} WHERE minute < %s LIMIT {int(chunk_size)}", (before,))
+            count = cursor.rowcount
+            connection.commit()
+            deleted += count
+            if count < chunk_size:
+                break
+    cursor.close()
+    return deleted
+
+
+def rollup_boundary(cursor):
+    """Start of the minute holding covered_until; rollups are complete before it"""
+    cursor.execute("SELECT covered_until FROM rollup_state WHERE id = 1")
+    row = cursor.fetchone()
+    return minute_floor(row[0]) if row else None
+
+
+def _grouped_counts(cursor, column, since=None, limit=None):
+    """Counts per column value, from rollups up to the boundary and auth_logs after it.
+
+    Raw rows are only read for the tail at or after the boundary and, when
+    since is not on a minute boundary, for the partial first minute. Status
+    counts come from the username rollup, which covers every row; source_ip
+    counts only cover failed attempts, like their rollup.
+    """
+    boundary = rollup_boundary(cursor)
+    rollup_column = 'username' if column == 'status' else column
+    raw_filter = ROLLUP_FILTERS[rollup_column]
+    parts = []
+    params = []
+    if boundary is None:
+        parts.append(f"SELECT {column} AS k, COUNT(*) AS n FROM auth_logs WHERE 1 = 1{raw_filter}"
+                     + (" AND timestamp >= %s" if since else "") + f" GROUP BY {column}")
+        if since:
+            params.append(since)
+    else:
+        rollup_start = minute_ceil(since) if since else None
+        table = ROLLUP_TABLES[rollup_column]
+        where = "minute < %s" + (" AND minute >= %s" if rollup_start else "")
+        parts.append(f"SELECT {column} AS k, SUM(attempts) AS n FROM {table} WHERE {where} GROUP BY {column}")
+        params.append(boundary)
+        if rollup_start:
+            params.append(rollup_start)
+        if since and since < rollup_start:
+            parts.append(f"SELECT {column} AS k, COUNT(*) AS n FROM auth_logs "
+                         f"WHERE timestamp >= %s AND timestamp < %s{raw_filter} GROUP BY {column}")
+            params.extend([since, min(rollup_start, boundary)])
+        parts.append(f"SELECT {column} AS k, COUNT(*) AS n FROM auth_logs "
+                     f"WHERE timestamp >= %s{raw_filter} GROUP BY {column}")
+        params.append(max(boundary, since) if since else boundary)
+
+    query = (f"SELECT k, SUM(n) AS total FROM ({' UNION ALL '.join(parts)}) counts "
+             f"GROUP BY k ORDER BY total DESC, k")
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    with QUERY_SECONDS.time(query=f"{column}_counts"):
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    return [(key, int(total)) for key, total in rows]
+
+
+def counts_by_status(cursor, since=None):
+    """Return {'success': n, 'failed': n}"""
+    counts = {'success': 0, 'failed': 0}
+    counts.update(_grouped_counts(cursor, 'status', since))
+    return counts
+
+
+def total_count(cursor, since=None):
+    """Return the number of auth_logs rows"""
+    return sum(counts_by_status(cursor, since).values())
+
+
+def top_failing_source_ips(cursor, limit=5, since=None):
+    """Return [(source_ip, failed attempts)] for the IPs with the most failed logins"""
+    return _grouped_counts(cursor, 'source_ip', since, limit)
+
+
+def attempts_by_username(cursor, since=None, limit=None):
+    """Return [(username, attempts)] ordered by attempts"""
+    return _grouped_counts(cursor, 'username', since, limit)
+
+
+if __name__ == "__main__":
+    from database import create_connection
+
+    parser = argparse.ArgumentParser(description="Dashboard queries served from per-minute rollups")
+    parser.add_argument('--rebuild-days', type=float,
+                        help="recompute rollups for the last N days from auth_logs")
+    args = parser.parse_args()
+
+    connection = create_connection()
+    if args.rebuild_days:
+        now = datetime.datetime.now()
+        rebuild_rollups(connection, now - datetime.timedelta(days=args.rebuild_days), now)
+    cursor = connection.cursor()
+    print(f"Total entries: {total_count(cursor)}")
+    print(f"By status: {counts_by_status(cursor)}")
+    print(f"Top failing source IPs: {top_failing_source_ips(cursor)}")
+    print(f"By username: {attempts_by_username(cursor)}")
+    cursor.close()
+    connection.close()
@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import heapq
+import itertools
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash (Lamping and Veach): map a 64-bit key to one of buckets.
+
+    Growing from N to N + 1 shards moves only 1 / (N + 1) of the keys, all of
+    them onto the new shard.
+    """
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(source_ip, shard_count):
+    """Shard index for a source IP; stable across processes and restarts"""
+    key = int.from_bytes(hashlib.blake2b(source_ip.encode('utf-8'), digest_size=8).digest(), 'little')
+    return jump_hash(key, shard_count)
+
+
+def merge_top_k(partials, k, key=lambda item: item[1]):
+    """Merge per-shard top-k lists into the global top k.
+
+    Exact when every item lives on a single shard, as source IPs do because
+    they are the shard key: the global top k is then always among the
+    per-shard top k. Ties are broken on the item itself for a stable order.
+    """
+    return heapq.nsmallest(k, (item for partial in partials for item in partial),
+                           key=lambda item: (-key(item), item[0]))
+
+
+def merge_counts(partials):
+    """Sum per-shard [(key, count)] lists into one list ordered by count"""
+    totals = Counter()
+    for partial in partials:
+        for name, count in partial:
+            totals[name] += count
+    return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+
+class ShardedWriter:
+    """Route auth_logs rows to shards by a hash of source_ip, batching per shard.
+
+    Each shard gets its own writer from its storage backend, so every shard
+    commits its own batches (with its own rollups on MySQL) and a slow shard
+    only holds back its own rows. Has the BatchWriter add/add_many/flush/close
+    interface.
+    """
+
+    def __init__(self, backends, batch_size=500, max_latency=1.0, encrypt_passwords=False, dedup=True,
+                 rollups=True, table='auth_logs'):
+        from dedup import Deduplicator
+
+        self.backends = backends
+        self.writers = []
+        for backend in backends:
+            # Encryptors and deduplicators are per shard: an event always lands on the same shard
+            encryptor = None
+            if encrypt_passwords:
+                from encryption import EnvelopeEncryptor
+                encryptor = EnvelopeEncryptor()
+            writer = backend.writer(table=table, batch_size=batch_size, max_latency=max_latency,
+                                    encryptor=encryptor, deduplicator=Deduplicator() if dedup else None)
+            if rollups and backend.supports_rollups:
+                from rollups import RollupMaintainer
+                writer.before_commit.append(RollupMaintainer())
+            self.writers.append(writer)
+        self.executor = ThreadPoolExecutor(max_workers=len(backends))
+
+    def shard(self, row):
+        """Index of the shard that stores row"""
+        return shard_for(row[1], len(self.writers))
+
+    def add(self, row):
+        """Buffer a row on its shard, flushing that shard's batch if full"""
+        self.writers[shard_for(row[1], len(self.writers))].add(row)
+
+    def add_many(self, rows):
+        """Split rows by shard and buffer each group on its shard"""
+        shard_count = len(self.writers)
+        groups = [[] for _ in range(shard_count)]
+        for row in rows:
+            groups[shard_for(row[1], shard_count)].append(row)
+        for writer, group in zip(self.writers, groups):
+            if group:
+                writer.add_many(group)
+
+    def flush(self):
+        """Flush every shard in parallel, returning whether all succeeded"""
+        return all(self.executor.map(lambda writer: writer.flush(), self.writers))
+
+    def close(self):
+        """Flush and close every shard writer"""
+        flushed = all(self.executor.map(lambda writer: writer.close(), self.writers))
+        self.executor.shutdown()
+        return flushed
+
+    def stats(self):
+        """Totals over all shards, per-shard row counts and the row skew (largest / mean)"""
+        per_shard = [writer.stats() for writer in self.writers]
+        rows = [stats['rows_written'] for stats in per_shard]
+        mean = sum(rows) / len(rows)
+        return {
+            'rows_written': sum(rows),
+            'batches_written': sum(stats['batches_written'] for stats in per_shard),
+            'errors': sum(stats['errors'] for stats in per_shard),
+            'rows_per_shard': rows,
+            'skew': round(max(rows) / mean, 3) if mean else 0.0,
+        }
+
+
+class ShardedQueries:
+    """Run the standard auth_logs queries on every shard in parallel and merge the results.
+
+    Mirrors the StorageBackend query methods, so dashboards can use it in
+    place of a single backend.
+    """
+
+    def __init__(self, backends, max_workers=None):
+        self.backends = backends
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or len(backends))
+
+    def scatter(self, method, *args, **kwargs):
+        """Call a StorageBackend method on every shard concurrently and return the per-shard results"""
+        return list(self.executor.map(lambda backend: getattr(backend, method)(*args, **kwargs),
+                                      self.backends))
+
+    def total_count(self, table='auth_logs'):
+        return sum(self.scatter('total_count', table))
+
+    def counts_by_status(self, table='auth_logs'):
+        counts = Counter({'success': 0, 'failed': 0})
+        for partial in self.scatter('counts_by_status', table):
+            counts.update(partial)
+        return dict(counts)
+
+    def top_source_ips(self, limit=5, table='auth_logs'):
+        # Each IP is on one shard, so each shard's top `limit` is enough
+        return merge_top_k(self.scatter('top_source_ips', limit, table), limit)
+
+    def attempts_by_username(self, table='auth_logs'):
+        # Usernames are spread over every shard: their partial counts are summed
+        return merge_counts(self.scatter('attempts_by_username', table))
+
+    def recent_entries(self, limit=10, table='auth_logs'):
+        """Newest rows over all shards; ids are per shard, so the merge is on timestamp"""
+        partials = self.scatter('recent_entries', limit, table)
+        merged = heapq.merge(*partials, key=lambda row: row[1], reverse=True)
+        return list(itertools.islice(merged, limit))
+
+    def failed_since(self, since, table='auth_logs'):
+        partials = self.scatter('failed_since', since, table)
+        return list(heapq.merge(*partials, key=lambda row: row[0], reverse=True))
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def open_shards(hosts=None, sqlite_paths=None):
+    """Open one storage backend per shard.
+
+    hosts is a list of 'host' or 'host:port' MySQL servers sharing the
+    user, password and database from the environment (default
+    $MYSQL_SHARD_HOSTS, comma separated); sqlite_paths opens embedded
+    SQLite shards instead, e.g. for tests.
+    """
+    from storage import MySQLBackend, SQLiteBackend
+
+    if sqlite_paths:
+        return [SQLiteBackend(path) for path in sqlite_paths]
+    if hosts is None:
+        hosts = [host for host in os.getenv('MYSQL_SHARD_HOSTS', '').split(',') if host.strip()]
+    if not hosts:
+        raise ValueError("No shards configured: set MYSQL_SHARD_HOSTS=host1,host2:3307")
+    backends = []
+    for host in hosts:
+        name, _, port = host.strip().partition(':')
+        backends.append(MySQLBackend(host=name, port=int(port or 3306)))
+    return backends
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write to and query hash-sharded auth_logs")
+    parser.add_argument('--hosts', help="comma-separated MySQL shards (default $MYSQL_SHARD_HOSTS)")
+    parser.add_argument('--sqlite', nargs='+', metavar='PATH', help="use SQLite files as shards instead")
+    parser.add_argument('--create-schema', action='store_true')
+    parser.add_argument('--load', type=int, default=0, help="write N simulated rows across the shards")
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    shards = open_shards(args.hosts.split(',') if args.hosts else None, args.sqlite)
+    if args.create_schema:
+        for shard in shards:
+            shard.create_schema()
+    if args.load:
+        import datetime
+        from event_generator import EventGenerator
+        from ssh_log_simulator import PASSWORDS, USERNAMES
+
+        generator = EventGenerator(USERNAMES, PASSWORDS, attacker_share=0.3)
+        writer = ShardedWriter(shards, batch_size=args.batch_size, max_latency=None)
+        # Spread over the last hour; rows with identical content would be deduplicated
+        start = datetime.datetime.now() - datetime.timedelta(hours=1)
+        for offset in range(0, args.load, 100000):
+            count = min(100000, args.load - offset)
+            writer.add_many(generator.generate_batch(count, start if offset == 0 else None, args.load / 3600))
+        writer.close()
+        print(f"Wrote {writer.stats()}")
+
+    queries = ShardedQueries(shards)
+    print(f"Rows per shard: {queries.scatter('total_count')}")
+    print(f"Total entries: {queries.total_count()}")
+    print(f"By status: {queries.counts_by_status()}")
+    print(f"Top source IPs: {queries.top_source_ips(5)}")
+    print(f"By username: {queries.attempts_by_username()}")
+    queries.close()
+    for shard in shards:
+        shard.close()
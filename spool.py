@@ -0,0 +1,360 @@
+import argparse
+import base64
+import datetime
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from metrics import counter, gauge
+
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'spool')
+
+# Each record: payload length and CRC32, then the spool time and the JSON-encoded rows
+RECORD_HEADER = struct.Struct('<II')
+SPOOLED_AT = struct.Struct('<d')
+
+SPOOL_BYTES = gauge('auth_logs_spool_bytes', "Bytes waiting in the on-disk spool", ('spool',))
+SPOOL_LAG = gauge('auth_logs_spool_replay_lag_seconds', "Age of the oldest spooled batch not yet replayed",
+                  ('spool',))
+SPOOLED_ROWS = counter('auth_logs_spooled_rows_total', "Rows written to the spool instead of the database",
+                       ('spool',))
+REPLAYED_ROWS = counter('auth_logs_replayed_rows_total', "Spooled rows replayed into the database", ('spool',))
+
+
+def encode_rows(rows):
+    """Serialize AUTH_LOG_COLUMNS rows, optionally followed by their event_hash.
+
+    Passwords are already encrypted; they and event hashes are stored as base64.
+    """
+    return json.dumps([
+        [row[0].isoformat(), row[1], row[2], _b64encode(row[3]), row[4], row[5]]
+        + ([_b64encode(row[6])] if len(row) > 6 else [])
+        for row in rows
+    ], separators=(',', ':')).encode('utf-8')
+
+
+def decode_rows(payload):
+    return [
+        (datetime.datetime.fromisoformat(row[0]), row[1], row[2], _b64decode(row[3]), row[4], row[5])
+        + ((_b64decode(row[6]),) if len(row) > 6 else ())
+        for row in json.loads(payload)
+    ]
+
+
+def _b64encode(value):
+    return base64.b64encode(value).decode('ascii') if value is not None else None
+
+
+def _b64decode(value):
+    return base64.b64decode(value) if value is not None else None
+
+
+class Spool:
+    """Append-only, checksummed segment files holding batches the database could not take.
+
+    One producer side (append, from any number of writers in the process) and
+    one consumer (peek/ack, from a SpoolReplayer). Nothing is kept in memory:
+    batches go straight to disk and are read back one record at a time. The
+    replay position is saved atomically after each acknowledged batch, and
+    fully replayed segments are deleted. A process always appends to a new
+    segment, so a record torn by a crash is only ever in an older segment,
+    where the reader detects it by its checksum and skips the rest of that
+    segment. Use one spool directory per process.
+    """
+
+    def __init__(self, directory=SPOOL_DIR, segment_bytes=64 * 1024 * 1024, max_bytes=None, fsync=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.position_path = os.path.join(directory, 'position.json')
+
+        segments = self.segments()
+        self.segment = (segments[-1] + 1) if segments else 1
+        self.file = None
+        self.read_segment, self.read_offset = self._load_position(segments)
+
+        self.appended_rows = 0
+        self.dropped_rows = 0
+        self.corrupt_records = 0
+        self._corrupt_seen = set()
+        SPOOL_BYTES.set_function(self.size, spool=directory)
+        SPOOL_LAG.set_function(self.lag, spool=directory)
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"segment-{number:012d}.spool")
+
+    def segments(self):
+        """Numbers of the segment files on disk, oldest first"""
+        return sorted(int(name[8:20]) for name in os.listdir(self.directory)
+                      if name.startswith('segment-') and name.endswith('.spool'))
+
+    def _load_position(self, segments):
+        try:
+            with open(self.position_path) as f:
+                position = json.load(f)
+            return position['segment'], position['offset']
+        except (FileNotFoundError, ValueError, KeyError):
+            return (segments[0] if segments else self.segment), 0
+
+    def _save_position(self):
+        tmp_path = self.position_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment': self.read_segment, 'offset': self.read_offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.position_path)
+
+    def size(self):
+        """Bytes not yet replayed"""
+        total = 0
+        for number in self.segments():
+            if number < self.read_segment:
+                continue
+            try:
+                total += os.path.getsize(self._segment_path(number))
+            except FileNotFoundError:
+                continue
+            if number == self.read_segment:
+                total -= self.read_offset
+        return max(total, 0)
+
+    def append(self, rows):
+        """Durably append one batch, returning False if the spool is full"""
+        body = SPOOLED_AT.pack(time.time()) + encode_rows(rows)
+        record = RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+        with self.lock:
+            if self.max_bytes and self.size() + len(record) > self.max_bytes:
+                self.dropped_rows += len(rows)
+                print(f"Spool {self.directory} is full, dropping {len(rows)} log entries")
+                return False
+            if self.file is None or self.file.tell() >= self.segment_bytes:
+                if self.file is not None:
+                    self.file.close()
+                    self.segment += 1
+                self.file = open(self._segment_path(self.segment), 'ab')
+            self.file.write(record)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.appended_rows += len(rows)
+        SPOOLED_ROWS.inc(len(rows), spool=self.directory)
+        return True
+
+    def _records(self, max_rows):
+        """Yield (rows, spooled_at, segment, offset after the record) from the replay position"""
+        rows_read = 0
+        for number in self.segments():
+            if number < self.read_segment:
+                continue
+            offset = self.read_offset if number == self.read_segment else 0
+            active = number == self.segment
+            with open(self._segment_path(number), 'rb') as f:
+                f.seek(offset)
+                while rows_read < max_rows:
+                    header = f.read(RECORD_HEADER.size)
+                    if not header:
+                        break
+                    length, checksum = RECORD_HEADER.unpack(header) if len(header) == RECORD_HEADER.size else (0, 0)
+                    body = f.read(length) if length else b''
+                    if not length or len(body) < length or zlib.crc32(body) != checksum:
+                        if active:
+                            # The writer may still be appending this record
+                            return
+                        # A retried replay reads the same record again: report it once
+                        if (number, offset) not in self._corrupt_seen:
+                            self._corrupt_seen.add((number, offset))
+                            self.corrupt_records += 1
+                            print(f"Skipping corrupt spool record in segment {number} at offset {offset}")
+                        break
+                    offset += RECORD_HEADER.size + length
+                    rows = decode_rows(body[SPOOLED_AT.size:])
+                    rows_read += len(rows)
+                    yield rows, SPOOLED_AT.unpack(body[:SPOOLED_AT.size])[0], number, offset
+            if rows_read >= max_rows:
+                return
+            if not active:
+                # Everything in a finished segment has been read: continue at the next one
+                yield [], None, number + 1, 0
+
+    def peek(self, max_rows=10000):
+        """Return (rows, position) for the next whole batches up to about max_rows; ack(position) once stored"""
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+            rows = []
+            position = (self.read_segment, self.read_offset)
+            for batch, _, segment, offset in self._records(max_rows):
+                rows.extend(batch)
+                position = (segment, offset)
+            return rows, position
+
+    def ack(self, position):
+        """Mark everything before position as replayed and delete finished segments"""
+        with self.lock:
+            self.read_segment, self.read_offset = position
+            self._save_position()
+            for number in self.segments():
+                if number < self.read_segment and number != self.segment:
+                    os.remove(self._segment_path(number))
+
+    def lag(self):
+        """Seconds since the oldest batch not yet replayed was spooled, or 0 if there is none.
+
+        Reads only the spool time of the next record, without checking or
+        decoding it, so metrics scrapes stay cheap and leave corruption to replay.
+        """
+        now = time.time()
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+            for number in self.segments():
+                if number < self.read_segment:
+                    continue
+                offset = self.read_offset if number == self.read_segment else 0
+                with open(self._segment_path(number), 'rb') as f:
+                    f.seek(offset)
+                    start = f.read(RECORD_HEADER.size + SPOOLED_AT.size)
+                if len(start) == RECORD_HEADER.size + SPOOLED_AT.size:
+                    spooled_at = SPOOLED_AT.unpack_from(start, RECORD_HEADER.size)[0]
+                    # A damaged header can hold any value; replay will skip that record
+                    if 0 < spooled_at <= now:
+                        return now - spooled_at
+        return 0.0
+
+    def stats(self):
+        """Return spool size, replay lag and row counters"""
+        return {
+            'bytes': self.size(),
+            'segments': len(self.segments()),
+            'lag_seconds': round(self.lag(), 3),
+            'appended_rows': self.appended_rows,
+            'dropped_rows': self.dropped_rows,
+            'corrupt_records': self.corrupt_records,
+        }
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+class SpoolReplayer:
+    """Background thread draining a spool into the database in bulk.
+
+    writer is a BatchWriter with no spool and no encryptor (spooled passwords
+    are already encrypted), ideally with a deduplicator and a connect
+    factory so it can come back after an outage. Replay is throttled to
+    max_rows_per_second so catching up does not starve live ingest, and
+    backs off exponentially while the database is still down.
+    """
+
+    def __init__(self, spool, writer, batch_rows=10000, max_rows_per_second=50000, idle_interval=1.0,
+                 max_backoff=30.0):
+        self.spool = spool
+        self.writer = writer
+        self.batch_rows = batch_rows
+        self.max_rows_per_second = max_rows_per_second
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+        self.replayed_rows = 0
+        self.rejected_rows = 0
+        self.failures = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def replay_once(self):
+        """Replay one bulk batch; returns rows replayed, or None if the database is unavailable"""
+        rows, position = self.spool.peek(self.batch_rows)
+        if not rows:
+            if position != (self.spool.read_segment, self.spool.read_offset):
+                # Only skipped over finished or corrupt segments
+                self.spool.ack(position)
+            return 0
+        if not self.writer.write(rows):
+            if self.writer.broken:
+                self.failures += 1
+                return None
+            # The database is up but refused the batch itself: retrying it would stall the spool
+            print(f"Skipping {len(rows)} spooled log entries the database rejected")
+            self.rejected_rows += len(rows)
+            self.spool.ack(position)
+            return 0
+        self.spool.ack(position)
+        self.replayed_rows += len(rows)
+        REPLAYED_ROWS.inc(len(rows), spool=self.spool.directory)
+        return len(rows)
+
+    def run(self):
+        """Replay until stop() is called"""
+        backoff = self.idle_interval
+        while not self._stopped.is_set():
+            started = time.monotonic()
+            replayed = self.replay_once()
+            if replayed is None:
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = self.idle_interval
+            if not replayed:
+                self._stopped.wait(self.idle_interval)
+            elif self.max_rows_per_second:
+                self._stopped.wait(max(0.0, replayed / self.max_rows_per_second - (time.monotonic() - started)))
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+
+def start_replayer(spool, connect, rollups=True, detector=None, table='auth_logs', **options):
+    """Start a SpoolReplayer writing through its own connection from connect().
+
+    A BruteForceDetector shared with the live writer also sees replayed
+    events, in windows of their own since they are older than live ones.
+    """
+    from batch_writer import BatchWriter
+    from dedup import Deduplicator
+
+    writer = BatchWriter(None, batch_size=options.get('batch_rows', 10000) + 1, max_latency=None,
+                         table=table, deduplicator=Deduplicator(), connect=connect)
+    if rollups:
+        from rollups import RollupMaintainer
+        writer.before_commit.append(RollupMaintainer())
+    if detector:
+        detector.attach(writer, source='replay')
+    return SpoolReplayer(spool, writer, **options).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or drain an auth_logs spool")
+    parser.add_argument('--dir', default=SPOOL_DIR)
+    parser.add_argument('--drain', action='store_true', help="replay everything into MySQL and exit")
+    parser.add_argument('--rate', type=int, default=50000, help="max rows/s while draining")
+    args = parser.parse_args()
+
+    spool = Spool(args.dir)
+    print(f"Spool {args.dir}: {spool.stats()}")
+    if args.drain:
+        from database import create_connection
+        replayer = start_replayer(spool, create_connection, max_rows_per_second=args.rate)
+        try:
+            while spool.size():
+                time.sleep(1)
+                print(f"Replayed {replayer.replayed_rows} rows, {spool.size()} bytes left")
+        except KeyboardInterrupt:
+            pass
+        replayer.stop()
+        replayer.writer.close()
+        print(f"Spool {args.dir}: {spool.stats()}")
+    spool.close()
@@ -1,62 +1,157 @@
 import datetime
 import random
-from faker import Faker
 import time
-from database import create_connection
+from batch_writer import BatchWriter
+from rollups import RollupMaintainer
+from dedup import Deduplicator
+from metrics import LogLimiter, counter
+from profiling import NULL_PROFILER
 import ipaddress
 
-fake = Faker()
+USERNAMES = ['admin', 'root', 'user', 'jenkins', 'ubuntu', 'system']
+PASSWORDS = ['password123', 'admin123', 'root123', '123456', 'qwerty']
+
+ROWS_GENERATED = counter('auth_logs_simulated_rows_total', "Rows generated by the simulator", ('status',))
+
+
+def random_ip():
+    """Generate a random IP address"""
+    return str(ipaddress.IPv4Address(random.randint(0, 2**32 - 1)))
+
+
+def build_log_row(usernames=USERNAMES, passwords=PASSWORDS):
+    """Build a single auth_logs row from the word lists, without writing it"""
+    timestamp = datetime.datetime.now()
+    source_ip = random_ip()
+    username = random.choice(usernames)
+    password = random.choice(passwords)
+    # 70% success rate
+    status = 'success' if random.random() < 0.7 else 'failed'
+
+    # Encoded here, encrypted into the BLOB when the batch is written
+    password_blob = password.encode('utf-8')
+    attempt_details = f"SSH login attempt from {source_ip}"
+    return (timestamp, source_ip, username, password_blob, status, attempt_details)
+
 
 class SSHLogSimulator:
-    def __init__(self):
-        self.connection = create_connection()
-        self.cursor = self.connection.cursor()
-        self.usernames = ['admin', 'root', 'user', 'jenkins', 'ubuntu', 'system']
-        self.passwords = ['password123', 'admin123', 'root123', '123456', 'qwerty']
+    def __init__(self, batch_size=100, max_latency=1.0, pool=None, rollups=True, detector=None,
+                 encrypt_passwords=True, generator_options=None, backend=None, log_interval=1.0,
+                 profiler=None, dedup=True, spool_dir=None):
+        # With a shared pool the simulator borrows a connection instead of opening its own;
+        # with a storage backend (storage.get_backend) it writes wherever that points
+        self.pool = pool
+        self.backend = backend
+        # mysql.connector and cryptography are only imported by the simulators that use them
+        if backend:
+            self.connection = backend.connection
+        else:
+            from database import create_connection
+            self.connection = pool.checkout() if pool else create_connection()
+        # create_connection() returns None while MySQL is down; the writer keeps retrying
+        self.cursor = self.connection.cursor() if self.connection else None
+        # Passwords are envelope-encrypted per batch by the writer
+        encryptor = None
+        if encrypt_passwords:
+            from encryption import EnvelopeEncryptor
+            encryptor = EnvelopeEncryptor()
+        # Content-hash dedup makes a retried or replayed batch land exactly once
+        self.deduplicator = Deduplicator() if dedup else None
+        # With a spool directory, batches MySQL cannot take are kept on disk and replayed in the
+        # background; a SQLite backend is already a local buffer and needs none
+        self.spool = None
+        self.replayer = None
+        if backend:
+            self.writer = backend.writer(batch_size=batch_size, max_latency=max_latency,
+                                         encryptor=encryptor, deduplicator=self.deduplicator)
+        else:
+            if spool_dir:
+                from spool import Spool, start_replayer
+                self.spool = Spool(spool_dir)
+                self.replayer = start_replayer(self.spool, create_connection, rollups=rollups,
+                                               detector=detector)
+            self.writer = BatchWriter(self.connection, batch_size=batch_size, max_latency=max_latency,
+                                      encryptor=encryptor, deduplicator=self.deduplicator, spool=self.spool,
+                                      connect=None if pool else create_connection)
+        # A profiling.StageProfiler breaks run() down by stage; NULL_PROFILER costs next to nothing
+        self.profiler = profiler or NULL_PROFILER
+        self.writer.profiler = self.profiler
+        if rollups and (backend is None or backend.supports_rollups):
+            self.writer.before_commit.append(RollupMaintainer())
+        if detector:
+            detector.attach(self.writer)
+        self.usernames = list(USERNAMES)
+        self.passwords = list(PASSWORDS)
+        # Distribution settings for generate_batch, see event_generator.EventGenerator
+        self.generator_options = generator_options or {}
+        self.event_generator = None
+        # Printing every row costs more than generating it; log at most one line per interval
+        self.log_limiter = LogLimiter(log_interval)
         
     def generate_random_ip(self):
         """Generate a random IP address"""
-        return str(ipaddress.IPv4Address(random.randint(0, 2**32 - 1)))
+        return random_ip()
+
+    def build_log_row(self):
+        """Build a single auth_logs row without writing it"""
+        return build_log_row(self.usernames, self.passwords)
+
+    def generate_batch(self, count, start=None, rate=None):
+        """Build count rows at once with NumPy, spaced about 1 / rate seconds apart"""
+        if self.event_generator is None:
+            from event_generator import EventGenerator
+            self.event_generator = EventGenerator(self.usernames, self.passwords,
+                                                  **self.generator_options)
+        return self.event_generator.generate_batch(count, start, rate)
+
+    def build_attack_burst(self, attempts=20, interval_seconds=0.5, source_ip=None, username=None,
+                           start=None):
+        """Build failed login rows from one attacker hammering one account"""
+        source_ip = source_ip or self.generate_random_ip()
+        username = username or random.choice(self.usernames)
+        start = start or datetime.datetime.now()
+        rows = []
+        for i in range(attempts):
+            timestamp = start + datetime.timedelta(seconds=i * interval_seconds)
+            password = random.choice(self.passwords)
+            rows.append((timestamp, source_ip, username, password.encode('utf-8'), 'failed',
+                         f"SSH login attempt from {source_ip}"))
+        return rows
 
     def generate_log_entry(self):
         """Generate a single SSH log entry"""
-        timestamp = datetime.datetime.now()
-        source_ip = self.generate_random_ip()
-        username = random.choice(self.usernames)
-        password = random.choice(self.passwords)
-        # 70% success rate
-        status = 'success' if random.random() < 0.7 else 'failed'
-        
-        # Store password as BLOB (encoded bytes)
-        password_blob = password.encode('utf-8')
-        attempt_details = f"SSH login attempt from {source_ip}"
-        
-        query = """
-        INSERT INTO auth_logs 
-        (timestamp, source_ip, username, encrypted_password, status, attempt_details)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        """
-        values = (timestamp, source_ip, username, password_blob, status, attempt_details)
+        profiler = self.profiler
+        with profiler.stage('generate'):
+            values = self.build_log_row()
+        timestamp, source_ip, username, _, status, _ = values
         
-        try:
-            self.cursor.execute(query, values)
-            self.connection.commit()
-            print(f"[{timestamp}] {status.upper()}: Login attempt from {source_ip} for user {username}")
-        except Exception as e:
-            print(f"Error inserting log entry: {e}")
-            self.connection.rollback()
+        # Rows are buffered and committed once per batch by the writer
+        self.writer.add(values)
+        ROWS_GENERATED.inc(status=status)
+        with profiler.stage('log'):
+            if self.log_limiter.allow():
+                skipped = self.log_limiter.last_skipped
+                print(f"[{timestamp}] {status.upper()}: Login attempt from {source_ip} for user {username}"
+                      + (f" (+{skipped} not shown)" if skipped else ""))
 
     def run(self, duration_seconds=None, entries_per_second=1):
         """Run the simulator"""
         print("Starting SSH log simulation...")
-        start_time = time.time()
+        self.profiler.start()
+        start_time = time.monotonic()
+        next_entry = start_time
         
         try:
             while True:
                 self.generate_log_entry()
-                time.sleep(1 / entries_per_second)
+                # Sleep until an absolute deadline so time spent writing does not slow the rate
+                next_entry += 1 / entries_per_second
+                delay = next_entry - time.monotonic()
+                if delay > 0:
+                    with self.profiler.stage('sleep'):
+                        time.sleep(delay)
                 
-                if duration_seconds and (time.time() - start_time) >= duration_seconds:
+                if duration_seconds and (time.monotonic() - start_time) >= duration_seconds:
                     break
                     
         except KeyboardInterrupt:
@@ -66,13 +161,60 @@ class SSHLogSimulator:
 
     def cleanup(self):
         """Clean up database connections"""
+        if self.writer:
+            self.writer.close()
+            stats = self.writer.stats()
+            print(f"\nWrote {stats['rows_written']} entries in {stats['batches_written']} batches "
+                  f"({stats['rows_per_second']:.1f} rows/s, avg flush {stats['avg_flush_ms']:.1f} ms)")
+        if self.replayer:
+            # Whatever is still spooled stays on disk and is replayed on the next start
+            self.replayer.stop()
+            self.replayer.writer.close()
+            print(f"Spool: {self.spool.stats()}, replayed {self.replayer.replayed_rows} entries")
+            self.spool.close()
+        if self.deduplicator:
+            print(f"Dedup: {self.deduplicator.stats()}")
+        if self.profiler.enabled:
+            self.profiler.stop()
+            print(self.profiler.report())
         if self.cursor:
             self.cursor.close()
         if self.connection:
-            self.connection.close()
+            if self.backend:
+                self.backend.close()
+            elif self.pool:
+                self.pool.checkin(self.connection)
+            else:
+                self.connection.close()
         print("\nSimulation ended. Database connections closed.")
 
 if __name__ == "__main__":
-    simulator = SSHLogSimulator()
-    # Run simulation for 1 hour (3600 seconds) with 2 entries per second
-    simulator.run(duration_seconds=3600, entries_per_second=2) 
\ No newline at end of file
+    import argparse
+    import os
+    from metrics import start_http_server_from_env
+    from profiling import get_profiler
+
+    parser = argparse.ArgumentParser(description="Simulate SSH login attempts into auth_logs")
+    parser.add_argument('--duration', type=float, default=3600, help="seconds to run, 0 for until interrupted")
+    parser.add_argument('--rate', type=float, default=2, help="entries per second")
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--no-encrypt', action='store_true', help="store passwords unencrypted")
+    parser.add_argument('--profile', action='store_true', help="print a per-stage time breakdown at exit")
+    parser.add_argument('--profile-output', help="also write a profile: *.prof for cProfile, "
+                                                 "anything else for collapsed stacks")
+    parser.add_argument('--spool', default=os.getenv('SPOOL_DIR'), metavar='DIR',
+                        help="keep batches on disk while MySQL is down and replay them (default $SPOOL_DIR)")
+    args = parser.parse_args()
+
+    start_http_server_from_env()
+    backend = None
+    if os.getenv('STORAGE_BACKEND') == 'sqlite':
+        # Edge collectors buffer into local SQLite; storage.py --forward ships rows to MySQL
+        from storage import get_backend
+        backend = get_backend('sqlite')
+        backend.create_schema()
+    simulator = SSHLogSimulator(batch_size=args.batch_size, backend=backend, spool_dir=args.spool,
+                                encrypt_passwords=not args.no_encrypt,
+                                profiler=get_profiler(args.profile, args.profile_output))
+    # By default, run for 1 hour (3600 seconds) with 2 entries per second
+    simulator.run(duration_seconds=args.duration or None, entries_per_second=args.rate) 
\ No newline at end of file
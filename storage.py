@@ -0,0 +1,314 @@
+import abc
+import argparse
+import datetime
+import os
+import sqlite3
+import time
+from batch_writer import AUTH_LOG_COLUMNS, BatchWriter
+
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'auth_logs.db')
+
+
+def format_timestamp(moment):
+    """Fixed-width text timestamp, so SQLite compares and sorts it correctly"""
+    return moment.isoformat(' ', 'microseconds')
+
+
+class StorageBackend(abc.ABC):
+    """Where auth_logs rows go: schema creation, batched writes and the standard queries.
+
+    Subclasses provide a DB-API connection, a placeholder style (param) and
+    a writer() returning a BatchWriter for a table. The standard queries are
+    plain SQL that runs unchanged on every backend.
+    """
+
+    name = None
+    param = '%s'
+    supports_rollups = False
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    @abc.abstractmethod
+    def create_schema(self):
+        """Create auth_logs and anything else the backend needs"""
+
+    @abc.abstractmethod
+    def create_table(self, table):
+        """Create an empty table with the auth_logs layout and indexes"""
+
+    @abc.abstractmethod
+    def writer(self, table='auth_logs', batch_size=500, max_latency=1.0, encryptor=None,
+               deduplicator=None, spool=None):
+        """Return a BatchWriter for table on this backend"""
+
+    def drop_table(self, table):
+        """Drop table if it exists"""
+        cursor = self.connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        self.connection.commit()
+        cursor.close()
+
+    def truncate(self, table):
+        """Delete every row of table"""
+        self.execute(f"DELETE FROM {table}")
+        self.connection.commit()
+
+    def analyze(self, table):
+        """Refresh optimizer statistics for table"""
+        self.execute(f"ANALYZE {table}")
+
+    def execute(self, query, params=None):
+        """Run a query written with %s placeholders and return all rows"""
+        if self.param != '%s':
+            query = query.replace('%s', self.param)
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query, params or ())
+            return cursor.fetchall() if cursor.description else []
+        finally:
+            cursor.close()
+
+    def total_count(self, table='auth_logs'):
+        """Return the number of rows"""
+        return self.execute(f"SELECT COUNT(*) FROM {table}")[0][0]
+
+    def counts_by_status(self, table='auth_logs'):
+        """Return {'success': n, 'failed': n}"""
+        counts = {'success': 0, 'failed': 0}
+        counts.update(self.execute(f"SELECT status, COUNT(*) FROM {table} GROUP BY status"))
+        return counts
+
+    def recent_entries(self, limit=10, table='auth_logs'):
+        """Return the newest rows as (id, timestamp, source_ip, username, status)"""
+        return self.execute(f"SELECT id, timestamp, source_ip, username, status FROM {table} "
+                            f"ORDER BY timestamp DESC LIMIT {int(limit)}")
+
+    def failed_since(self, since, table='auth_logs'):
+        """Return failed attempts after since, newest first"""
+        return self.execute(f"SELECT timestamp, source_ip, username FROM {table} "
+                            f"WHERE status = 'failed' AND timestamp > %s ORDER BY timestamp DESC",
+                            (self.adapt_timestamp(since),))
+
+    def top_source_ips(self, limit=5, table='auth_logs'):
+        """Return [(source_ip, attempts)] for the most active IPs"""
+        return self.execute(f"SELECT source_ip, COUNT(*) AS attempts FROM {table} "
+                            f"GROUP BY source_ip ORDER BY attempts DESC LIMIT {int(limit)}")
+
+    def attempts_by_username(self, table='auth_logs'):
+        """Return [(username, attempts)] ordered by attempts"""
+        return self.execute(f"SELECT username, COUNT(*) AS attempts FROM {table} "
+                            f"GROUP BY username ORDER BY attempts DESC")
+
+    def adapt_timestamp(self, moment):
+        """Convert a datetime to the form this backend stores"""
+        return moment
+
+    def version(self):
+        """Server or library version string"""
+        return self.execute("SELECT VERSION()")[0][0]
+
+    def close(self):
+        """Close the underlying connection"""
+        self.connection.close()
+
+
+class MySQLBackend(StorageBackend):
+    """The MySQL server configured by database.get_connection_config()"""
+
+    name = 'mysql'
+    supports_rollups = True
+
+    def __init__(self, connection=None, **options):
+        from database import create_connection
+        # options (e.g. host, port) override the environment, so one process can reach several servers
+        self.options = options
+        super().__init__(connection or create_connection(**options))
+
+    def create_schema(self):
+        from database import create_database
+        create_database(**self.options)
+
+    def create_table(self, table):
+        from database import create_auth_logs_table
+        cursor = self.connection.cursor()
+        create_auth_logs_table(cursor, table)
+        self.connection.commit()
+        cursor.close()
+
+    def writer(self, table='auth_logs', batch_size=500, max_latency=1.0, encryptor=None,
+               deduplicator=None, spool=None):
+        return BatchWriter(self.connection, batch_size=batch_size, max_latency=max_latency,
+                           table=table, encryptor=encryptor, deduplicator=deduplicator, spool=spool)
+
+    def truncate(self, table):
+        self.execute(f"TRUNCATE TABLE {table}")
+
+    def analyze(self, table):
+        self.execute(f"ANALYZE TABLE {table}")
+
+
+class SQLiteBatchWriter(BatchWriter):
+    """BatchWriter for SQLite: one prepared INSERT reused for every row of a transaction"""
+
+    def __init__(self, connection, table='auth_logs', **options):
+        super().__init__(connection, table=table, **options)
+        self.insert_query = (f"INSERT INTO {table} ({', '.join(self.columns)}) "
+                             f"VALUES ({', '.join(['?'] * len(self.columns))})")
+        if self.deduplicator:
+            # Unlike INSERT OR IGNORE this only skips event_hash conflicts, not NOT NULL or CHECK failures
+            self.insert_query += " ON CONFLICT (event_hash) DO NOTHING"
+
+    def _write(self, rows):
+        # executemany compiles the statement once; SQLite has no multi-row INSERT advantage
+        self.cursor.executemany(self.insert_query,
+                                [(format_timestamp(row[0]),) + tuple(row[1:]) for row in rows])
+        return self.cursor.rowcount
+
+    def _existing_hashes(self, hashes):
+        self.cursor.execute(f"SELECT event_hash FROM {self.table} WHERE event_hash IN "
+                            f"({', '.join(['?'] * len(hashes))})", list(hashes))
+        return {bytes(row[0]) for row in self.cursor.fetchall()}
+
+
+class SQLiteBackend(StorageBackend):
+    """Embedded SQLite database tuned for ingest on edge collectors and in tests.
+
+    WAL mode lets readers run alongside the writer and turns each commit into
+    a sequential log append; synchronous=NORMAL syncs at checkpoints rather
+    than every commit, so a power loss can lose the last transactions but
+    never corrupts the file. Rows are written in batched transactions with a
+    single prepared statement. Timestamps are stored as fixed-width text.
+    """
+
+    name = 'sqlite'
+    param = '?'
+
+    def __init__(self, path=None, cache_mb=64):
+        # The BatchWriter flush timer commits from its own thread
+        connection = sqlite3.connect(path or SQLITE_PATH, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA temp_store=MEMORY")
+        connection.execute(f"PRAGMA cache_size=-{int(cache_mb * 1024)}")
+        connection.execute("PRAGMA busy_timeout=5000")
+        super().__init__(connection)
+
+    def create_schema(self):
+        self.create_table('auth_logs')
+
+    def create_table(self, table):
+        self.connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                source_ip TEXT NOT NULL,
+                username TEXT NOT NULL,
+                encrypted_password BLOB,
+                status TEXT NOT NULL CHECK (status IN ('success', 'failed')),
+                attempt_details TEXT,
+                event_hash BLOB,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp);
+            CREATE INDEX IF NOT EXISTS idx_{table}_status_timestamp ON {table} (status, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_{table}_source_ip_timestamp ON {table} (source_ip, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_{table}_username_timestamp ON {table} (username, timestamp);
+        """)
+        # Files created before deduplication lack event_hash
+        columns = [row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")]
+        if 'event_hash' not in columns:
+            self.connection.execute(f"ALTER TABLE {table} ADD COLUMN event_hash BLOB")
+        self.connection.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uk_{table}_event_hash ON {table} (event_hash)")
+        self.connection.commit()
+
+    def writer(self, table='auth_logs', batch_size=5000, max_latency=1.0, encryptor=None,
+               deduplicator=None, spool=None):
+        return SQLiteBatchWriter(self.connection, table=table, batch_size=batch_size,
+                                 max_latency=max_latency, encryptor=encryptor, deduplicator=deduplicator,
+                                 spool=spool)
+
+    def adapt_timestamp(self, moment):
+        return format_timestamp(moment)
+
+    def version(self):
+        return f"SQLite {sqlite3.sqlite_version}"
+
+    def forward(self, target, batch_size=10000, table='auth_logs', target_writer=None):
+        """Move buffered rows to another backend in id order, deleting each batch once the target committed it.
+
+        Rows keep their already-encrypted passwords and event hashes. A batch
+        the target fails to write stays here and is retried on the next call.
+        The target writer should have a deduplicator, so a batch committed
+        there but not yet deleted here (after a crash) is not stored twice.
+        Returns the number of rows forwarded.
+        """
+        if target_writer is None:
+            from dedup import Deduplicator
+            writer = target.writer(batch_size=batch_size, max_latency=None, deduplicator=Deduplicator())
+        else:
+            writer = target_writer
+        columns = ', '.join(AUTH_LOG_COLUMNS)
+        forwarded = 0
+        while True:
+            rows = self.execute(f"SELECT id, {columns}, event_hash FROM {table} "
+                                f"ORDER BY id LIMIT {int(batch_size)}")
+            if not rows:
+                break
+            # Rows stored without deduplication have no hash; the target's deduplicator hashes them
+            batch = [(datetime.datetime.fromisoformat(row[1]),) + tuple(row[2:7])
+                     + ((bytes(row[7]),) if row[7] is not None else ()) for row in rows]
+            if not writer.write(batch):
+                break
+            self.connection.execute(f"DELETE FROM {table} WHERE id <= ?", (rows[-1][0],))
+            self.connection.commit()
+            forwarded += len(rows)
+        if target_writer is None:
+            writer.close()
+        return forwarded
+
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def get_backend(name=None, **options):
+    """Open the backend named by name or $STORAGE_BACKEND (default mysql)"""
+    name = name or os.getenv('STORAGE_BACKEND', 'mysql')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](**options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Buffer auth_logs locally in SQLite and forward to MySQL")
+    parser.add_argument('--path', default=SQLITE_PATH, help="SQLite database file")
+    parser.add_argument('--forward', action='store_true', help="move buffered rows to MySQL")
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--interval', type=float, help="keep forwarding every INTERVAL seconds")
+    args = parser.parse_args()
+
+    local = SQLiteBackend(args.path)
+    local.create_schema()
+    if args.forward:
+        remote = MySQLBackend()
+        from dedup import Deduplicator
+        writer = remote.writer(batch_size=args.batch_size, max_latency=None, deduplicator=Deduplicator())
+        from rollups import RollupMaintainer
+        writer.before_commit.append(RollupMaintainer())
+        try:
+            while True:
+                forwarded = local.forward(remote, args.batch_size, target_writer=writer)
+                print(f"Forwarded {forwarded} rows to MySQL")
+                if not args.interval:
+                    break
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            writer.close()
+            remote.close()
+    print(f"{local.total_count()} rows buffered in {args.path}: {local.counts_by_status()}")
+    local.close()
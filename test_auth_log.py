@@ -9,8 +9,9 @@ import time
 import sys
 import os
 from datetime import datetime, timedelta
-from database import create_connection, create_database
+from database import create_connection, create_database, ConnectionPool
 from ssh_log_simulator import SSHLogSimulator
+from batch_writer import BatchWriter
 
 def test_database_connection():
     """Test database connection and basic functionality"""
@@ -171,6 +172,446 @@ def test_simulator_integration():
         print(f"SSH log simulator integration test failed: {e}")
         return False
 
+def test_batch_writer():
+    """Test batched inserts through the BatchWriter"""
+    print("\nTesting batch writer...")
+    
+    try:
+        connection = create_connection()
+        cursor = connection.cursor()
+        
+        cursor.execute("SELECT COUNT(*) FROM auth_logs WHERE username = 'batch_test_user'")
+        before = cursor.fetchone()[0]
+        
+        writer = BatchWriter(connection, batch_size=10, max_latency=0.5)
+        for i in range(25):
+            writer.add((
+                datetime.now(), f"10.0.0.{i}", "batch_test_user",
+                b"batch_password", "failed", "Batch writer test"
+            ))
+        
+        # Two full batches are flushed immediately, the rest after max_latency
+        time.sleep(1)
+        stats = writer.stats()
+        print(f"Batches written before close: {stats['batches_written']}")
+        writer.close()
+        
+        cursor.execute("SELECT COUNT(*) FROM auth_logs WHERE username = 'batch_test_user'")
+        after = cursor.fetchone()[0]
+        connection.commit()
+        
+        stats = writer.stats()
+        print(f"Rows written: {stats['rows_written']} in {stats['batches_written']} batches")
+        print(f"Average flush latency: {stats['avg_flush_ms']:.2f} ms")
+        
+        cursor.close()
+        connection.close()
+        return after - before == 25 and stats['batches_written'] == 3
+        
+    except Exception as e:
+        print(f"Batch writer test failed: {e}")
+        return False
+
+def test_connection_pool():
+    """Test pooled connections are reused and health-checked"""
+    print("\nTesting connection pool...")
+    
+    try:
+        pool = ConnectionPool(max_size=2, ping_interval=0)
+        
+        with pool.connection() as connection:
+            first_id = id(connection)
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+        
+        # The same connection should come back instead of a new handshake
+        with pool.connection() as connection:
+            reused = id(connection) == first_id
+        
+        # A dead connection is replaced transparently on checkout
+        connection = pool.checkout()
+        connection.close()
+        pool.checkin(connection)
+        connection = pool.checkout()
+        alive = connection.is_connected()
+        pool.checkin(connection)
+        
+        stats = pool.stats()
+        print(f"Pool stats: {stats}")
+        pool.close()
+        return reused and alive and stats['reconnects'] == 1
+        
+    except Exception as e:
+        print(f"Connection pool test failed: {e}")
+        return False
+
+def test_bulk_load():
+    """Test LOAD DATA LOCAL INFILE bulk loading (or its INSERT fallback)"""
+    print("\nTesting bulk load...")
+    
+    try:
+        from bulk_load import BulkLoader
+        
+        connection = create_connection(allow_local_infile=True)
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM auth_logs WHERE username = 'bulk_test_user'")
+        before = cursor.fetchone()[0]
+        
+        loader = BulkLoader(connection, spool_rows=50)
+        for i in range(120):
+            # Tabs, newlines and backslashes must survive the TSV spool
+            loader.add((
+                datetime.now(), f"172.16.0.{i % 256}", "bulk_test_user",
+                b"pass\tword\n\\" + bytes([i]), "failed", f"Bulk load test {i}\twith tab"
+            ))
+        loader.close()
+        
+        cursor.execute("SELECT COUNT(*) FROM auth_logs WHERE username = 'bulk_test_user'")
+        after = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT encrypted_password FROM auth_logs
+            WHERE username = 'bulk_test_user' ORDER BY id DESC LIMIT 1
+        """)
+        last_password = cursor.fetchone()[0]
+        # LOAD DATA bypasses the rollup maintainer; close() rebuilds the loaded range
+        cursor.execute("SELECT SUM(attempts) FROM auth_logs_rollup_user WHERE username = 'bulk_test_user'")
+        rolled_up = int(cursor.fetchone()[0] or 0)
+        print(f"Bulk loaded {after - before} rows ({loader.stats()}), rollups count {rolled_up}")
+        
+        cursor.close()
+        connection.close()
+        return (after - before == 120 and rolled_up >= 120
+                and bytes(last_password) == b"pass\tword\n\\" + bytes([119]))
+        
+    except Exception as e:
+        print(f"Bulk load test failed: {e}")
+        return False
+
+def test_compact_schema():
+    """Test writing through the compact layout and reading it back via the view"""
+    print("\nTesting compact schema...")
+    
+    try:
+        from compact_schema import CompactBatchWriter
+        
+        connection = create_connection()
+        writer = CompactBatchWriter(connection, batch_size=10, max_latency=None)
+        rows = [
+            (datetime.now(), "203.0.113.9", "compact_test_user", b"pw", "failed", "Compact test"),
+            (datetime.now(), "2001:db8::42", "Compact_Test_User", b"pw", "success", "Compact test"),
+            (datetime.now(), "not-an-ip", "compact_test_user", b"pw", "failed", "Compact test"),
+        ]
+        writer.add_many(rows)
+        writer.close()
+        
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT source_ip, username, status FROM auth_logs_compact_view
+            WHERE username IN ('compact_test_user', 'Compact_Test_User')
+            ORDER BY id DESC LIMIT 3
+        """)
+        stored = sorted(cursor.fetchall(), key=str)
+        expected = sorted([("2001:db8::42", "Compact_Test_User", "success"),
+                           ("203.0.113.9", "compact_test_user", "failed"),
+                           (None, "compact_test_user", "failed")], key=str)
+        print(f"Decoded rows: {stored}, invalid IPs: {writer.invalid_ips}")
+        
+        cursor.close()
+        connection.close()
+        return stored == expected and writer.invalid_ips == 1
+        
+    except Exception as e:
+        print(f"Compact schema test failed: {e}")
+        return False
+
+def test_partition_maintenance():
+    """Test partition pre-creation, retention drops and pruning on a scratch table"""
+    print("\nTesting partition maintenance...")
+    
+    try:
+        from database import create_auth_logs_table
+        from partition_maintenance import (
+            create_future_partitions, drop_expired_partitions, list_partitions, pruned_partitions
+        )
+        
+        connection = create_connection()
+        cursor = connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS auth_logs_partition_test")
+        create_auth_logs_table(cursor, 'auth_logs_partition_test', partitioning='hourly')
+        
+        # Pretend maintenance runs a day later: new hours appear, old ones expire
+        later = datetime.now() + timedelta(days=1)
+        created = create_future_partitions(cursor, 'hourly', ahead=3,
+                                           table='auth_logs_partition_test', now=later)
+        dropped = drop_expired_partitions(cursor, timedelta(hours=12),
+                                          table='auth_logs_partition_test', now=later)
+        names = [name for name, _ in list_partitions(cursor, 'auth_logs_partition_test')]
+        print(f"Created {created} partitions, dropped {len(dropped)}; {len(names)} remain")
+        
+        # The "failed in the last hour" query must only touch recent partitions
+        partitions = pruned_partitions(cursor, """
+            SELECT timestamp, source_ip, username FROM auth_logs_partition_test
+            WHERE status = 'failed' AND timestamp > %s ORDER BY timestamp DESC
+        """, (later - timedelta(hours=1),))
+        print(f"Partitions read by last-hour query: {sorted(partitions)}")
+        
+        cursor.execute("DROP TABLE auth_logs_partition_test")
+        
+        # Rollup buckets of expired rows are pruned with them
+        from rollups import prune_rollups
+        cursor.execute("INSERT IGNORE INTO auth_logs_rollup_user (minute, status, username, attempts) "
+                       "VALUES ('2000-01-01 00:00:00', 'failed', 'prune_test_user', 1)")
+        connection.commit()
+        prune_rollups(connection, datetime(2001, 1, 1))
+        cursor.execute("SELECT COUNT(*) FROM auth_logs_rollup_user WHERE username = 'prune_test_user'")
+        stale = cursor.fetchone()[0]
+        cursor.close()
+        connection.close()
+        return (created > 0 and 'p_history' in dropped and stale == 0
+                and 0 < len(partitions) <= 3 and 'p_history' not in partitions)
+        
+    except Exception as e:
+        print(f"Partition maintenance test failed: {e}")
+        return False
+
+def test_rollup_queries():
+    """Test that rollup-backed dashboard queries match the raw table"""
+    print("\nTesting rollup queries...")
+    
+    try:
+        from rollups import (
+            RollupMaintainer, rebuild_rollups, counts_by_status, top_failing_source_ips, attempts_by_username
+        )
+        
+        connection = create_connection()
+        since = datetime.now() - timedelta(hours=1)
+        
+        # Rows written earlier without the hook are folded in first
+        rebuild_rollups(connection, since, datetime.now())
+        
+        writer = BatchWriter(connection, batch_size=20, max_latency=None)
+        writer.before_commit.append(RollupMaintainer())
+        for i in range(50):
+            writer.add((
+                datetime.now() - timedelta(minutes=i % 5), f"198.18.0.{i % 3}", f"rollup_user{i % 4}",
+                b"pw", "failed" if i % 2 else "success", "Rollup test"
+            ))
+        writer.close()
+        
+        cursor = connection.cursor()
+        cursor.execute("SELECT status, COUNT(*) FROM auth_logs WHERE timestamp >= %s GROUP BY status", (since,))
+        raw_status = {'success': 0, 'failed': 0}
+        raw_status.update(cursor.fetchall())
+        cursor.execute("""
+            SELECT username, COUNT(*) AS attempts FROM auth_logs WHERE timestamp >= %s
+            GROUP BY username ORDER BY attempts DESC, username
+        """, (since,))
+        raw_users = cursor.fetchall()
+        cursor.execute("""
+            SELECT source_ip, COUNT(*) AS attempts FROM auth_logs WHERE timestamp >= %s AND status = 'failed'
+            GROUP BY source_ip ORDER BY attempts DESC, source_ip LIMIT 3
+        """, (since,))
+        raw_ips = cursor.fetchall()
+        
+        rollup_status = counts_by_status(cursor, since)
+        rollup_users = attempts_by_username(cursor, since)
+        top_ips = top_failing_source_ips(cursor, 3, since)
+        print(f"Status from rollups: {rollup_status}, raw: {raw_status}")
+        print(f"Top failing source IPs from rollups: {top_ips}")
+        
+        cursor.close()
+        connection.close()
+        return (rollup_status == raw_status and rollup_users == [tuple(row) for row in raw_users]
+                and top_ips == [tuple(row) for row in raw_ips])
+        
+    except Exception as e:
+        print(f"Rollup query test failed: {e}")
+        return False
+
+def test_brute_force_detection():
+    """Test that simulated attack bursts raise alerts and background noise does not"""
+    print("\nTesting brute-force detection...")
+    
+    try:
+        from brute_force_detector import BruteForceDetector
+        
+        alerts = []
+        detector = BruteForceDetector(failures=5, window_seconds=30, max_keys=1000,
+                                      callback=alerts.append)
+        simulator = SSHLogSimulator(batch_size=100, max_latency=None, rollups=False, detector=detector)
+        
+        # Background traffic from random IPs, plus one fast and one slow burst
+        rows = [simulator.build_log_row() for _ in range(2000)]
+        rows += simulator.build_attack_burst(attempts=10, interval_seconds=1, source_ip="192.0.2.66",
+                                             username="burst_user_fast")
+        rows += simulator.build_attack_burst(attempts=10, interval_seconds=60, source_ip="192.0.2.67",
+                                             username="burst_user_slow")
+        rows.sort(key=lambda row: row[0])
+        simulator.writer.add_many(rows)
+        simulator.cleanup()
+        
+        flagged = {(alert['key_type'], alert['key_value']) for alert in alerts}
+        print(f"Alerts: {sorted(flagged)}; detector stats: {detector.stats()}")
+        
+        connection = create_connection()
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM brute_force_alerts WHERE key_value = '192.0.2.66'")
+        stored = cursor.fetchone()[0]
+        cursor.close()
+        connection.close()
+        
+        # Memory stays bounded no matter how many distinct attackers appear
+        capped = BruteForceDetector(failures=5, window_seconds=30, max_keys=100, store_alerts=False)
+        capped.observe_many((datetime.now(), f"10.1.{i // 256}.{i % 256}", f"u{i}", None, "failed", "")
+                            for i in range(10000))
+        
+        return (('source_ip', '192.0.2.66') in flagged
+                and ('username', 'burst_user_fast') in flagged
+                and ('source_ip', '192.0.2.67') not in flagged
+                and stored >= 1 and len(capped.windows) <= 100)
+        
+    except Exception as e:
+        print(f"Brute-force detection test failed: {e}")
+        return False
+
+def test_keyset_pagination():
+    """Test that keyset pages cover every row once and EXPLAIN shows index range scans without filesort"""
+    print("\nTesting keyset pagination and composite indexes...")
+    
+    try:
+        from database import create_auth_logs_table
+        from log_queries import (attempts_from_ip, attempts_for_username, explain, failed_attempts,
+                                 recent_entries, source_ip_counts)
+        
+        table = 'auth_logs_keyset_test'
+        connection = create_connection()
+        cursor = connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        create_auth_logs_table(cursor, table)
+        
+        simulator = SSHLogSimulator(batch_size=1000, max_latency=None, rollups=False, encrypt_passwords=False,
+                                    generator_options={'attacker_share': 0.5, 'seed': 3})
+        # DATETIME keeps whole seconds, so at 2 rows/s pages have to break ties on id
+        start = datetime.now() - timedelta(hours=2)
+        rows = simulator.generate_batch(5000, start=start, rate=2)
+        writer = BatchWriter(connection, batch_size=1000, max_latency=None, table=table)
+        writer.add_many(rows)
+        writer.close()
+        simulator.cleanup()
+        cursor.execute(f"ANALYZE TABLE {table}")
+        cursor.fetchall()
+        
+        # Walk every failed attempt page by page
+        seen = []
+        token = None
+        while True:
+            page, token = failed_attempts(cursor, limit=333, after=token, table=table)
+            seen.extend(row[0] for row in page)
+            if not token:
+                break
+        failed_total = sum(row[4] == 'failed' for row in rows)
+        print(f"Paged through {len(seen)} failed attempts ({failed_total} inserted)")
+        if len(seen) != failed_total or len(set(seen)) != len(seen):
+            print("Keyset pages skipped or repeated rows")
+            return False
+        
+        # Second pages of each browse query, plus the per-IP count page
+        token = (start + timedelta(minutes=30), 10 ** 9)
+        since = start + timedelta(minutes=10)
+        cursor.execute(f"SELECT source_ip, username FROM {table} LIMIT 1")
+        source_ip, username = cursor.fetchone()
+        plans = {
+            'idx_timestamp': ("SELECT id FROM {t} WHERE (timestamp < %s OR (timestamp = %s AND id < %s)) "
+                              "ORDER BY timestamp DESC, id DESC LIMIT 50", (token[0], token[0], token[1])),
+            'idx_status_timestamp': ("SELECT id FROM {t} WHERE status = 'failed' AND timestamp > %s AND "
+                                     "(timestamp < %s OR (timestamp = %s AND id < %s)) "
+                                     "ORDER BY timestamp DESC, id DESC LIMIT 50",
+                                     (since, token[0], token[0], token[1])),
+            'idx_source_ip_timestamp': ("SELECT id FROM {t} WHERE source_ip = %s AND "
+                                        "(timestamp < %s OR (timestamp = %s AND id < %s)) "
+                                        "ORDER BY timestamp DESC, id DESC LIMIT 50",
+                                        (source_ip, token[0], token[0], token[1])),
+            'idx_username_timestamp': ("SELECT id FROM {t} WHERE username = %s AND "
+                                       "(timestamp < %s OR (timestamp = %s AND id < %s)) "
+                                       "ORDER BY timestamp DESC, id DESC LIMIT 50",
+                                       (username, token[0], token[0], token[1])),
+        }
+        ok = True
+        for index, (query, params) in plans.items():
+            plan = explain(cursor, query.format(t=table), params)[0]
+            extra = plan['Extra'] or ''
+            print(f"{index}: type={plan['type']} key={plan['key']} extra={extra}")
+            if plan['key'] != index or plan['type'] != 'range' or 'filesort' in extra:
+                ok = False
+        
+        plan = explain(cursor, f"SELECT source_ip, COUNT(*) FROM {table} WHERE source_ip > %s "
+                               f"GROUP BY source_ip ORDER BY source_ip LIMIT 100", ('0',))[0]
+        extra = plan['Extra'] or ''
+        print(f"source_ip counts: type={plan['type']} key={plan['key']} extra={extra}")
+        if plan['key'] != 'idx_source_ip_timestamp' or 'filesort' in extra or 'temporary' in extra:
+            ok = False
+        
+        # The remaining browse functions run against the same table
+        recent_entries(cursor, 10, token, table)
+        attempts_from_ip(cursor, source_ip, 10, table=table)
+        attempts_for_username(cursor, username, 10, table=table)
+        source_ip_counts(cursor, 10, table=table)
+        
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.close()
+        connection.close()
+        return ok
+        
+    except Exception as e:
+        print(f"Keyset pagination test failed: {e}")
+        return False
+
+def test_exactly_once_writes():
+    """Test that replayed batches are stored and rolled up exactly once"""
+    print("\nTesting exactly-once writes...")
+    
+    try:
+        from dedup import Deduplicator
+        from rollups import RollupMaintainer
+        
+        # Fixed timestamps: rerunning the test replays the same events again
+        start = datetime(2024, 1, 1, 12, 0)
+        rows = [(start + timedelta(seconds=i), f"198.18.1.{i % 4}", "dedup_user", b"pw",
+                 "failed" if i % 3 else "success", f"Dedup test {i}") for i in range(30)]
+        connection = create_connection()
+        
+        deduplicator = Deduplicator()
+        writer = BatchWriter(connection, batch_size=10, max_latency=None, deduplicator=deduplicator)
+        writer.before_commit.append(RollupMaintainer())
+        writer.add_many(rows)
+        writer.add_many(rows[:10])
+        writer.flush()
+        writer.close()
+        
+        # A restarted writer has an empty prefilter; the unique index catches the replay
+        restarted = Deduplicator()
+        writer = BatchWriter(connection, batch_size=100, max_latency=None, deduplicator=restarted)
+        writer.before_commit.append(RollupMaintainer())
+        writer.add_many(rows)
+        writer.close()
+        print(f"Dedup stats: {deduplicator.stats()}, after restart: {restarted.stats()}")
+        
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM auth_logs WHERE username = 'dedup_user'")
+        stored = cursor.fetchone()[0]
+        cursor.execute("SELECT SUM(attempts) FROM auth_logs_rollup_user WHERE username = 'dedup_user'")
+        rolled_up = int(cursor.fetchone()[0] or 0)
+        print(f"Stored {stored} rows, rollups count {rolled_up}")
+        cursor.close()
+        connection.close()
+        return stored == rolled_up == len(rows) and restarted.stats()['duplicates'] == len(rows)
+        
+    except Exception as e:
+        print(f"Exactly-once write test failed: {e}")
+        return False
+
 def test_docker_environment():
     """Test Docker environment variables"""
     print("\n🔍 Testing Docker environment...")
@@ -201,6 +642,15 @@ def run_comprehensive_test():
         ("Auth Log Insertion", test_auth_log_insertion),
         ("Auth Log Queries", test_auth_log_queries),
         ("Simulator Integration", test_simulator_integration),
+        ("Batch Writer", test_batch_writer),
+        ("Connection Pool", test_connection_pool),
+        ("Bulk Load", test_bulk_load),
+        ("Compact Schema", test_compact_schema),
+        ("Partition Maintenance", test_partition_maintenance),
+        ("Rollup Queries", test_rollup_queries),
+        ("Brute-Force Detection", test_brute_force_detection),
+        ("Keyset Pagination", test_keyset_pagination),
+        ("Exactly-Once Writes", test_exactly_once_writes),
         ("Docker Environment", test_docker_environment)
     ]
     
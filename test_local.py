@@ -8,6 +8,7 @@ import sys
 import os
 import time
 from datetime import datetime
+from unittest import SkipTest
 
 # Add current directory to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -21,23 +22,21 @@ def test_imports():
         print("Database module imported successfully")
     except ImportError as e:
         print(f"Failed to import database module: {e}")
-        return False
+        raise
     
     try:
         from encryption import encrypt_data, decrypt_data
         print("Encryption module imported successfully")
     except ImportError as e:
         print(f"Failed to import encryption module: {e}")
-        return False
+        raise
     
     try:
         from ssh_log_simulator import SSHLogSimulator
         print("SSH log simulator imported successfully")
     except ImportError as e:
         print(f"Failed to import SSH log simulator: {e}")
-        return False
-    
-    return True
+        raise
 
 def test_encryption():
     """Test encryption/decryption functionality"""
@@ -50,32 +49,93 @@ def test_encryption():
         encrypted = encrypt_data(test_password)
         decrypted = decrypt_data(encrypted)
         
-        if decrypted == test_password:
-            print("Encryption/decryption working correctly")
-            return True
-        else:
-            print("Encryption/decryption failed")
-            return False
-            
+        assert decrypted == test_password, "Encryption/decryption failed"
+        print("Encryption/decryption working correctly")
+        
     except Exception as e:
         print(f"Encryption test failed: {e}")
-        return False
+        raise
+
+def test_envelope_encryption():
+    """Test that a batch shares one wrapped data key and rotation starts a new one"""
+    print("\nTesting envelope encryption batches...")
+    
+    try:
+        from encryption import EnvelopeEncryptor, EnvelopeDecryptor, split_blob
+        
+        encryptor = EnvelopeEncryptor(rotate_rows=100)
+        rows = [(datetime.now(), "10.0.0.1", "root", f"password{i}".encode(), "failed", "")
+                for i in range(50)]
+        first = encryptor.encrypt_rows(rows)
+        encryptor.rotate()
+        second = encryptor.encrypt_rows(rows)
+        
+        wrapped_keys = {split_blob(row[3])[1] for row in first}
+        assert len(wrapped_keys) == 1 and split_blob(second[0][3])[1] not in wrapped_keys, \
+            "Data keys were not shared per epoch"
+        
+        decryptor = EnvelopeDecryptor()
+        decrypted = decryptor.decrypt_batch([row[3] for row in first + second])
+        assert decrypted == [row[3] for row in rows + rows], "Batch decryption failed"
+        
+        print(f"Encrypted 2 epochs; decryptor unwrapped {len(decryptor.data_keys)} data keys")
+        assert len(decryptor.data_keys) == 2
+        
+        # Result-set decryption unwraps each data key once and respects the cache bound
+        bounded = EnvelopeDecryptor(max_keys=1)
+        decrypted_rows = bounded.decrypt_rows(first + second)
+        assert [row[3] for row in decrypted_rows] == [row[3].decode() for row in rows + rows], \
+            "Result-set decryption failed"
+        stats = bounded.stats()
+        print(f"Result-set decryption cache: {stats}")
+        assert stats['misses'] == 2 and stats['cached_keys'] == 1
+        
+        # Unencrypted and pre-envelope values pass through instead of failing the whole result set
+        mixed = [first[0], rows[1], rows[2][:3] + (b"E1short",) + rows[2][4:], rows[3][:3] + (None,) + rows[3][4:]]
+        decrypted_rows = decryptor.decrypt_rows(mixed)
+        expected = [rows[0][3].decode(), rows[1][3].decode(), "E1short", None]
+        assert [row[3] for row in decrypted_rows] == expected, \
+            f"Mixed result set decrypted to {[row[3] for row in decrypted_rows]}"
+        assert decryptor.decrypt(b"pw") == b"pw"
+        assert decryptor.stats()['plaintext'] == 3
+        
+        # An envelope from a key we do not hold is an error, not plaintext
+        foreign = first[0][3][:2] + b"\x00" * 8 + first[0][3][10:]
+        try:
+            EnvelopeDecryptor().decrypt(foreign)
+        except KeyError as e:
+            print(f"Unknown key reported: {e}")
+        else:
+            raise AssertionError("Envelope from an unknown key was returned as plaintext")
+        
+    except Exception as e:
+        print(f"Envelope encryption test failed: {e}")
+        raise
 
 def test_database_schema():
     """Test database schema creation"""
     print("\nTesting database schema...")
     
     try:
-        from database import create_database
+        import socket
+        from database import create_database, get_connection_config
+        
+        # Needs a running MySQL server; skipped rather than failed without one
+        config = get_connection_config()
+        try:
+            socket.create_connection((config['host'], config.get('port', 3306)), timeout=2).close()
+        except OSError as e:
+            raise SkipTest(f"MySQL is not reachable at {config['host']}: {e}")
         
         # This will create the database and tables if they don't exist
-        create_database()
+        assert create_database(), "Database schema creation failed"
         print("Database schema creation completed")
-        return True
         
+    except SkipTest:
+        raise
     except Exception as e:
         print(f"Database schema test failed: {e}")
-        return False
+        raise
 
 def test_connection_without_db():
     """Test database connection without requiring MySQL to be running"""
@@ -99,12 +159,10 @@ def test_connection_without_db():
             os.environ['MYSQL_HOST'] = original_host
         else:
             os.environ.pop('MYSQL_HOST', None)
-            
-        return True
         
     except Exception as e:
         print(f"Database connection test failed: {e}")
-        return False
+        raise
 
 def test_ssh_simulator_logic():
     """Test SSH simulator logic without database connection"""
@@ -118,11 +176,8 @@ def test_ssh_simulator_logic():
         simulator = SSHLogSimulator()
         test_ip = simulator.generate_random_ip()
         
-        if test_ip and '.' in test_ip:
-            print(f"IP generation working: {test_ip}")
-        else:
-            print("IP generation failed")
-            return False
+        assert test_ip and '.' in test_ip, "IP generation failed"
+        print(f"IP generation working: {test_ip}")
         
         # Test log entry generation logic
         timestamp = datetime.now()
@@ -137,11 +192,892 @@ def test_ssh_simulator_logic():
         print(f"   - Username: {username}")
         print(f"   - Status: {status}")
         
-        return True
-        
     except Exception as e:
         print(f"SSH simulator logic test failed: {e}")
-        return False
+        raise
+
+def test_auth_log_parser():
+    """Test parsing sshd lines from a real auth.log format"""
+    print("\nTesting auth.log parser...")
+    
+    try:
+        from auth_log_parser import AuthLogParser
+        
+        parser = AuthLogParser(year=2025)
+        lines = [
+            "Jun 18 06:40:40 host sshd[1234]: Accepted password for ubuntu from 203.0.113.5 port 51514 ssh2",
+            "Jun 18 06:40:41 host sshd[1235]: Failed password for invalid user admin from 198.51.100.7 port 40022 ssh2",
+            "Jun 18 06:40:42 host sshd[1236]: Invalid user oracle from 198.51.100.8 port 40100",
+            "Jun 18 06:40:43 host CRON[999]: pam_unix(cron:session): session opened for user root",
+            "2025-06-18T06:40:44.123456+00:00 host sshd[1237]: Failed password for root from 192.0.2.1 port 22 ssh2",
+        ]
+        rows = list(parser.parse_lines(lines))
+        
+        assert len(rows) == 4, f"Expected 4 events, parsed {len(rows)}"
+        
+        timestamp, source_ip, username, password, status, details = rows[1]
+        assert (timestamp == datetime(2025, 6, 18, 6, 40, 41) and source_ip == '198.51.100.7'
+                and username == 'admin' and status == 'failed'), f"Unexpected parse result: {rows[1]}"
+        
+        assert rows[0][4] == 'success' and rows[3][1] == '192.0.2.1', f"Unexpected parse results: {rows}"
+        
+        # The year rolls over at New Year and a line is never dated after the file was written
+        line = "{} host sshd[1]: Failed password for root from 192.0.2.9 port 22 ssh2"
+        parser = AuthLogParser(latest=datetime(2025, 1, 2))
+        years = [row[0].year for row in parser.parse_lines(
+            [line.format("Dec 31 23:59:59"), line.format("Jan  1 00:00:01")])]
+        assert years == [2024, 2025], f"Year not inferred across New Year: {years}"
+        
+        from datetime import timedelta
+        ahead = datetime.now() + timedelta(days=40)
+        row = AuthLogParser().parse_line(line.format(ahead.strftime("%b %d %H:%M:%S")))
+        assert row[0] <= datetime.now() and row[0].year == ahead.year - 1, \
+            f"Line dated in the future: {row[0]}"
+        
+        print(f"Parsed {len(rows)} sshd events from {len(lines)} lines")
+        
+    except Exception as e:
+        print(f"Auth log parser test failed: {e}")
+        raise
+
+def test_bulk_import_ranges():
+    """Test that newline-aligned byte ranges cover every line exactly once"""
+    print("\nTesting bulk import byte ranges...")
+    
+    try:
+        import tempfile
+        from bulk_import import file_latest, plan_tasks, parse_range
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'auth.log.1')
+            with open(path, 'w') as f:
+                for i in range(500):
+                    f.write(f"Jun 18 06:{i // 60 % 60:02d}:{i % 60:02d} host sshd[{i}]: "
+                            f"Failed password for user{i} from 10.0.{i // 256}.{i % 256} port 22 ssh2\n")
+            
+            # Small ranges force most boundaries into the middle of a line
+            tasks = plan_tasks([path], chunk_size=997)
+            usernames = []
+            hashes = []
+            for task in tasks:
+                _, rows, _ = parse_range(task, hashes=True)
+                usernames.extend(row[2] for row in rows)
+                hashes.extend(row[6] for row in rows)
+            
+            # Hashes must match the live ingester's, so lines it already stored are dropped
+            from auth_log_ingest import follow
+            from auth_log_parser import AuthLogParser
+            from dedup import event_hash
+            parser = AuthLogParser(latest=file_latest(path))
+            ingested = []
+            for line, inode, offset in follow(path, stop_at_eof=True):
+                row = parser.parse_line(line)
+                ingested.append(event_hash(row, f"{inode}:{offset}"))
+        
+        assert sorted(usernames) == sorted(f"user{i}" for i in range(500)), \
+            f"Ranges produced {len(usernames)} rows, {len(set(usernames))} unique"
+        assert sorted(hashes) == sorted(ingested) and len(set(hashes)) == 500, \
+            "Bulk import hashes differ from the ingester's"
+        
+        print(f"{len(tasks)} ranges parsed 500 lines exactly once, with the ingester's hashes")
+        
+    except Exception as e:
+        print(f"Bulk import range test failed: {e}")
+        raise
+
+def test_async_pipeline_backpressure():
+    """Test that a stalled writer bounds the pipeline queues instead of buffering everything"""
+    print("\nTesting async pipeline backpressure...")
+    
+    try:
+        import asyncio
+        from async_pipeline import AsyncIngestPipeline
+        
+        class SlowWriter:
+            """Stands in for a BatchWriter whose database has stalled"""
+            def __init__(self):
+                self.written = 0
+            def write(self, rows):
+                time.sleep(0.05)
+                self.written += len(rows)
+                return True
+        
+        async def fast_source():
+            for i in range(200):
+                yield [f"Jun 18 06:40:{i % 60:02d} host sshd[{i}]: "
+                       f"Failed password for root from 10.0.0.{i % 256} port 22 ssh2"] * 50
+        
+        from auth_log_parser import AuthLogParser
+        writer = SlowWriter()
+        pipeline = AsyncIngestPipeline(fast_source(), writer, parse=AuthLogParser(2025).parse_line,
+                                       queue_size=4, batch_size=500)
+        asyncio.run(pipeline.run())
+        stats = pipeline.stats()
+        print(f"Pipeline stats: {stats}")
+        
+        stages = stats['stages']
+        assert writer.written == 10000 and stages['source']['blocked_s'] > 0
+        assert stages['source']['max_queue_depth'] <= 4 and stages['parse']['max_queue_depth'] <= 4
+        
+        # A failed write fails the run instead of being counted as written, even when the
+        # writer's own batches are smaller than the pipeline's and it flushes them itself
+        import tempfile
+        from storage import SQLiteBackend
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteBackend(os.path.join(tmp, 'failing.db'))
+            writers = [backend.writer(table='missing', batch_size=100, max_latency=None) for _ in range(2)]
+            failing = AsyncIngestPipeline(fast_source(), writers, parse=AuthLogParser(2025).parse_line,
+                                          queue_size=4, batch_size=500)
+            try:
+                asyncio.run(failing.run())
+            except RuntimeError as e:
+                print(f"Failed write surfaced: {e}")
+            else:
+                raise AssertionError("Pipeline reported success after failed writes")
+            backend.close()
+        assert failing.stats()['stages']['write']['rows'] == 0
+        
+    except Exception as e:
+        print(f"Async pipeline test failed: {e}")
+        raise
+
+def test_brute_force_ordering():
+    """Test that late and replayed failures neither raise false alerts nor hide real ones"""
+    print("\nTesting brute-force detection with out-of-order events...")
+    
+    try:
+        import random
+        from datetime import timedelta
+        from brute_force_detector import BruteForceDetector
+        
+        start = datetime(2024, 1, 1)
+        
+        def failure(seconds, ip):
+            return (start + timedelta(seconds=seconds), ip, "root", None, "failed", "")
+        
+        # Within one source, shuffled failures alert as if they had arrived in order
+        detector = BruteForceDetector(failures=3, window_seconds=60, store_alerts=False, keys=('source_ip',))
+        fast = [failure(i * 10, "192.0.2.1") for i in range(6)]
+        slow = [failure(i * 100, "192.0.2.2") for i in range(6)]
+        shuffled = fast + slow
+        random.Random(3).shuffle(shuffled)
+        alerts = detector.observe_many(shuffled)
+        assert {alert['key_value'] for alert in alerts} == {"192.0.2.1"}, \
+            f"Shuffled failures alerted on {alerts}"
+        
+        # Old failures replayed from a spool interleave with live ones without forming a window
+        detector = BruteForceDetector(failures=3, window_seconds=60, store_alerts=False, keys=('source_ip',))
+        alerts = []
+        for i in range(3):
+            alerts += detector.observe_many([failure(3600 + i * 100, "192.0.2.3")])
+            alerts += detector.observe_many([failure(i * 100, "192.0.2.3")], source='replay')
+        assert not alerts, f"Interleaved live and replayed failures alerted: {alerts}"
+        
+        # A burst that only arrives through the replay still alerts
+        alerts = detector.observe_many([failure(7200 + i, "192.0.2.4") for i in range(3)], source='replay')
+        print(f"Detector stats: {detector.stats()}")
+        assert len(alerts) == 1 and alerts[0]['window_start'] == start + timedelta(seconds=7200)
+        
+    except Exception as e:
+        print(f"Brute-force ordering test failed: {e}")
+        raise
+
+def test_load_generator_pacing():
+    """Test that deadline pacing hits the target rate despite slow event generation"""
+    print("\nTesting load generator pacing...")
+    
+    try:
+        from load_generator import DeadlinePacer, percentile
+        
+        rate = 20000
+        pacer = DeadlinePacer(rate, max_burst=500)
+        sent = 0
+        start = time.monotonic()
+        while time.monotonic() - start < 0.5:
+            count = pacer.due()
+            if count:
+                sent += count
+                # Simulate per-event generation cost
+                sum(i * i for i in range(count * 20))
+            else:
+                pacer.wait()
+        achieved = sent / (time.monotonic() - start)
+        print(f"Target {rate} events/s, achieved {achieved:.0f} events/s")
+        
+        assert abs(achieved - rate) <= rate * 0.05, "Achieved rate drifted from the target"
+        
+        # A worker that dies without reporting is reported as failed instead of hanging the run
+        import multiprocessing
+        from load_generator import collect_reports, failed_report
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=results.put, args=(failed_report(0) | {'errors': 0},)),
+                     multiprocessing.Process(target=os._exit, args=(3,))]
+        for process in processes:
+            process.start()
+        reports, failed = collect_reports(processes, results, timeout=10)
+        assert failed == [1] and [report['errors'] for report in reports] == [0, 1], \
+            f"Crashed worker not reported: {failed}"
+        assert percentile(list(range(1, 101)), 0.99) == 99 and percentile([], 0.5) == 0.0
+        
+    except Exception as e:
+        print(f"Load generator pacing test failed: {e}")
+        raise
+
+def test_event_generator():
+    """Test vectorized batch generation: ratios, ordering and Zipfian attackers"""
+    print("\nTesting vectorized event generation...")
+    
+    try:
+        from collections import Counter
+        from event_generator import EventGenerator
+        
+        usernames = ['admin', 'root', 'user']
+        passwords = ['password123', 'qwerty']
+        start = datetime(2024, 1, 1)
+        generator = EventGenerator(usernames, passwords, seed=42)
+        rows = generator.generate_batch(50000, start=start, rate=1000)
+        
+        success_rate = sum(row[4] == 'success' for row in rows) / len(rows)
+        timestamps = [row[0] for row in rows]
+        print(f"Generated {len(rows)} rows, success rate {success_rate:.3f}")
+        assert abs(success_rate - 0.7) <= 0.01, "Success ratio is not 70%"
+        assert timestamps == sorted(timestamps) and timestamps[0] >= start, "Timestamps are not monotonic"
+        assert {row[2] for row in rows} == set(usernames) and {row[3] for row in rows} == {b'password123', b'qwerty'}, \
+            "Usernames or passwords outside the configured lists"
+        assert rows[0][5] == f"SSH login attempt from {rows[0][1]}", "attempt_details does not match source_ip"
+        
+        skewed = EventGenerator(usernames, passwords, attacker_share=1.0, burst_share=0.1, seed=42)
+        attack_rows = skewed.generate_batch(50000, start=start, rate=1000)
+        top_ip, top_count = Counter(row[1] for row in attack_rows).most_common(1)[0]
+        print(f"Top attacker {top_ip} sent {top_count} of {len(attack_rows)} events")
+        assert top_count > len(attack_rows) * 0.05
+        
+    except Exception as e:
+        print(f"Event generator test failed: {e}")
+        raise
+
+def test_benchmark_compare():
+    """Test that benchmark comparison flags slower inserts and queries only beyond the threshold"""
+    print("\nTesting benchmark regression comparison...")
+    
+    try:
+        from benchmark import compare
+        
+        baseline = {
+            'insert_rows_per_second': {'multi_row_insert': 50000.0, 'executemany': 20000.0},
+            'queries': {'top_source_ips': {'p50_ms': 10.0, 'p99_ms': 20.0}},
+        }
+        current = {
+            'insert_rows_per_second': {'multi_row_insert': 40000.0, 'executemany': 19500.0,
+                                       'load_data_infile': 90000.0},
+            'queries': {'top_source_ips': {'p50_ms': 10.5, 'p99_ms': 30.0}},
+        }
+        regressions = compare(baseline, current, threshold=0.10)
+        for regression in regressions:
+            print(f"Flagged: {regression}")
+        
+        assert len(regressions) == 2
+        assert regressions[0].startswith('insert multi_row_insert')
+        assert regressions[1].startswith('query top_source_ips p99_ms')
+        assert compare(baseline, baseline) == []
+        
+    except Exception as e:
+        print(f"Benchmark compare test failed: {e}")
+        raise
+
+def test_sqlite_backend():
+    """Test the embedded SQLite backend: WAL mode, batched writes, queries and forwarding"""
+    print("\nTesting SQLite storage backend...")
+    
+    try:
+        import tempfile
+        from datetime import timedelta
+        from ssh_log_simulator import SSHLogSimulator
+        from dedup import Deduplicator
+        from storage import SQLiteBackend, StorageBackend
+        
+        class IncompleteBackend(StorageBackend):
+            def create_schema(self):
+                pass
+        try:
+            IncompleteBackend(None)
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("A backend without create_table and writer could be created")
+        
+        with tempfile.TemporaryDirectory() as directory:
+            edge = SQLiteBackend(os.path.join(directory, 'edge.db'))
+            edge.create_schema()
+            assert edge.execute("PRAGMA journal_mode")[0][0] == 'wal', "SQLite backend is not in WAL mode"
+            
+            simulator = SSHLogSimulator(backend=edge, batch_size=1000, max_latency=None)
+            start = datetime(2024, 1, 1)
+            rows = simulator.generate_batch(5000, start=start, rate=0.5)
+            simulator.writer.add_many(rows)
+            simulator.writer.flush()
+            
+            failed = sum(row[4] == 'failed' for row in rows)
+            counts = edge.counts_by_status()
+            recent_failures = edge.failed_since(rows[-1][0] - timedelta(hours=1))
+            print(f"Buffered {edge.total_count()} rows locally: {counts}")
+            assert counts['failed'] == failed and edge.total_count() == 5000, \
+                "SQLite counts do not match the rows written"
+            assert recent_failures and len(recent_failures) < failed, "failed_since did not filter by timestamp"
+            
+            central = SQLiteBackend(os.path.join(directory, 'central.db'))
+            central.create_schema()
+            forwarded = edge.forward(central, batch_size=2000)
+            print(f"Forwarded {forwarded} rows; {edge.total_count()} left at the edge")
+            assert forwarded == 5000 and edge.total_count() == 0
+            assert central.counts_by_status() == counts and central.top_source_ips(1)[0][1] >= 1
+            
+            # A target that rejects every batch leaves the local rows in place, however it batches
+            edge.writer(max_latency=None).write(rows[:250])
+            failing = central.writer(table='missing', batch_size=100, max_latency=None)
+            assert not edge.forward(central, batch_size=100, target_writer=failing) and edge.total_count() == 250, \
+                "Rows the target rejected were deleted locally"
+            
+            # Rows forwarded again, as after a crash before the local DELETE, are stored once
+            edge.truncate('auth_logs')
+            later = [(row[0] + timedelta(days=365),) + row[1:] for row in rows[:100]]
+            for _ in range(2):
+                edge.writer(max_latency=None, deduplicator=Deduplicator()).write(later)
+                edge.forward(central)
+            assert central.total_count() == 5100, f"Forwarded rows were stored twice: {central.total_count()}"
+            simulator.cleanup()
+            central.close()
+        
+    except Exception as e:
+        print(f"SQLite backend test failed: {e}")
+        raise
+
+def test_parquet_archive():
+    """Test archiving aged rows to Parquet and querying them back with filters"""
+    print("\nTesting Parquet archival...")
+    
+    try:
+        import tempfile
+        from datetime import timedelta
+        from event_generator import EventGenerator
+        from storage import SQLiteBackend
+        import pyarrow.parquet as pq
+        from parquet_archive import (archive, archived_counts_by_status, archived_failed_count,
+                                     archived_top_source_ips, query_archive, write_day)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            backend = SQLiteBackend(os.path.join(directory, 'logs.db'))
+            backend.create_schema()
+            end = datetime(2024, 3, 1)
+            generator = EventGenerator(['admin', 'root'], ['123456'], attacker_share=0.5, seed=7)
+            rows = generator.generate_batch(20000, start=end - timedelta(days=10), rate=20000 / (10 * 86400))
+            writer = backend.writer(batch_size=5000, max_latency=None)
+            writer.add_many(rows)
+            writer.close()
+            
+            cutoff = end - timedelta(days=4)
+            old_rows = [row for row in rows if row[0] < cutoff]
+            archive_dir = os.path.join(directory, 'archive')
+            archived, files = archive(backend, cutoff, archive_dir, chunk_size=3000)
+            print(f"Archived {archived} rows into {files} files; {backend.total_count()} rows left")
+            assert archived == len(old_rows) and backend.total_count() == len(rows) - len(old_rows), \
+                "Archived and remaining row counts do not add up"
+            
+            counts = archived_counts_by_status(archive_dir)
+            assert counts['failed'] == sum(row[4] == 'failed' for row in old_rows), \
+                "Archived status counts do not match"
+            
+            window_start = cutoff - timedelta(days=1)
+            expected = sum(row[4] == 'failed' and row[0] >= window_start for row in old_rows)
+            assert archived_failed_count(archive_dir, start=window_start) == expected, \
+                "Time-range filter returned the wrong rows"
+            
+            top_ip, attempts = archived_top_source_ips(1, archive_dir)[0]
+            matching = query_archive(['source_ip'], archive_dir, source_ip=top_ip)
+            print(f"Top archived IP {top_ip} with {attempts} attempts")
+            backend.close()
+            assert matching.num_rows == attempts == sum(row[1] == top_ip for row in old_rows)
+            
+            # Row groups cover disjoint source IP ranges, so an IP lookup reads at most a few
+            day_rows = [(i + 1,) + row for i, row in enumerate(rows) if row[0].date() == old_rows[0][0].date()]
+            path = write_day(day_rows, old_rows[0][0].date(), os.path.join(directory, 'stats'), row_group_size=200)
+            metadata = pq.ParquetFile(path).metadata
+            ranges = [(metadata.row_group(i).column(2).statistics.min, metadata.row_group(i).column(2).statistics.max)
+                      for i in range(metadata.num_row_groups)]
+            assert all(ranges[i][1] <= ranges[i + 1][0] for i in range(len(ranges) - 1)), \
+                f"Row-group source_ip ranges overlap: {ranges[:3]}..."
+            
+            # A row committed into an archived id range after its chunk was read must survive
+            late = SQLiteBackend(os.path.join(directory, 'late.db'))
+            late.create_schema()
+            writer = late.writer(max_latency=None)
+            writer.add_many(old_rows[:10])
+            writer.close()
+            late.execute("DELETE FROM auth_logs WHERE id = 5")
+            execute = late.execute
+            
+            def execute_with_late_commit(query, params=None):
+                if query.startswith('DELETE') and not execute("SELECT id FROM auth_logs WHERE id = 5"):
+                    execute("INSERT INTO auth_logs (id, timestamp, source_ip, username, status) "
+                            "VALUES (5, %s, '10.0.0.5', 'late', 'failed')", (late.adapt_timestamp(old_rows[0][0]),))
+                return execute(query, params)
+            late.execute = execute_with_late_commit
+            archive(late, cutoff, os.path.join(directory, 'late_archive'))
+            remaining = late.execute("SELECT username FROM auth_logs")
+            late.close()
+            assert remaining == [('late',)]
+        
+    except Exception as e:
+        print(f"Parquet archive test failed: {e}")
+        raise
+
+def test_query_cache():
+    """Test that cached results are reused until the ingest watermark moves"""
+    print("\nTesting watermark-keyed query cache...")
+    
+    try:
+        from query_cache import CommitWatermark, QueryCache
+        
+        watermark = CommitWatermark()
+        cache = QueryCache(watermark.value, ttl_seconds=60, max_entries=2, watermark_interval=0)
+        calls = []
+        
+        def top_source_ips(cursor, limit=5):
+            calls.append(limit)
+            return [('10.0.0.1', 100 + len(calls))][:limit]
+        
+        first = cache.query(top_source_ips, None, 5)
+        second = cache.query(top_source_ips, None, 5)
+        assert first == second and len(calls) == 1, "Repeated query was not served from the cache"
+        
+        # A committed batch moves the watermark and invalidates the entry
+        watermark([('row',)])
+        third = cache.query(top_source_ips, None, 5)
+        assert third != first and len(calls) == 2, "Cache entry survived a new commit"
+        
+        # Different arguments are separate entries, bounded by max_entries
+        cache.query(top_source_ips, None, 1)
+        cache.query(top_source_ips, None, 2)
+        stats = cache.stats()
+        print(f"Cache stats: {stats}")
+        assert stats['hits'] == 1 and stats['misses'] == 4 and stats['invalidations'] == 1
+        assert stats['entries'] == 2 and stats['evictions'] == 1
+        
+        # A batch committing below MAX(id) must still move the id watermark
+        import sqlite3
+        from query_cache import id_watermark
+        connection = sqlite3.connect(':memory:')
+        connection.execute("CREATE TABLE auth_logs (id INTEGER PRIMARY KEY)")
+        connection.executemany("INSERT INTO auth_logs (id) VALUES (?)", [(i,) for i in (1, 2, 4, 5)])
+        mark = id_watermark(connection, window=10)
+        before = mark()
+        connection.execute("INSERT INTO auth_logs (id) VALUES (3)")
+        after = mark()
+        connection.close()
+        print(f"Id watermark before and after a late commit: {before}, {after}")
+        assert before != after and before[0] == after[0] == 5
+        
+    except Exception as e:
+        print(f"Query cache test failed: {e}")
+        raise
+
+def test_metrics_endpoint():
+    """Test Prometheus text rendering, the /metrics endpoint and rate-limited logging"""
+    print("\nTesting metrics endpoint...")
+    
+    try:
+        import urllib.request
+        from metrics import LogLimiter, Registry, start_http_server
+        
+        registry = Registry()
+        rows = registry.counter('test_rows_total', "Rows", ('table',))
+        depth = registry.gauge('test_queue_depth', "Depth")
+        latency = registry.histogram('test_flush_seconds', "Flush latency", buckets=(0.1, 1.0))
+        rows.inc(3, table='auth_logs')
+        rows.inc(table='auth_logs')
+        depth.set_function(lambda: 7)
+        latency.observe(0.05)
+        latency.observe(0.5)
+        
+        server = start_http_server(0, '127.0.0.1', registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                body = response.read().decode('utf-8')
+        finally:
+            server.shutdown()
+            server.server_close()
+        
+        expected = [
+            '# TYPE test_rows_total counter',
+            'test_rows_total{table="auth_logs"} 4',
+            'test_queue_depth 7',
+            'test_flush_seconds_bucket{le="0.1"} 1',
+            'test_flush_seconds_bucket{le="+Inf"} 2',
+            'test_flush_seconds_count 2',
+        ]
+        missing = [line for line in expected if line not in body.splitlines()]
+        assert not missing, f"Missing from /metrics: {missing}"
+        
+        # Within one interval only the first line is logged; the rest are counted
+        limiter = LogLimiter(interval=60)
+        allowed = [limiter.allow() for _ in range(100)]
+        print(f"Logged {sum(allowed)} of 100 lines, {limiter.skipped} skipped")
+        assert allowed[0] and sum(allowed) == 1 and limiter.skipped == 99
+        
+    except Exception as e:
+        print(f"Metrics endpoint test failed: {e}")
+        raise
+
+def test_stage_profiler():
+    """Test per-stage timing, the disabled profiler and both profile dump formats"""
+    print("\nTesting stage profiler...")
+    
+    try:
+        import pstats
+        import tempfile
+        import time
+        from profiling import NULL_PROFILER, StageProfiler
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            for output in ('run.prof', 'run.folded'):
+                profiler = StageProfiler(os.path.join(tmp, output), sample_interval=0.001)
+                profiler.start()
+                for value in profiler.iterate('read', range(5)):
+                    with profiler.stage('parse'):
+                        time.sleep(0.01)
+                    with profiler.stage('execute'):
+                        str(value)
+                profiler.stop()
+                print(profiler.report())
+                
+                stages = {name: (calls, total) for name, calls, total, _ in profiler.breakdown()}
+                assert stages['parse'][0] == 5 and stages['parse'][1] >= 0.05 and stages['read'][0] == 6, \
+                    f"Unexpected stage timings: {stages}"
+                assert profiler.breakdown()[0][0] == 'parse', "Slowest stage is not listed first"
+                
+                path = os.path.join(tmp, output)
+                if output.endswith('.prof'):
+                    pstats.Stats(path)
+                else:
+                    with open(path) as f:
+                        lines = f.read().splitlines()
+                    assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines), \
+                        "Collapsed stack output is malformed"
+        
+        # Disabled: stages are shared no-ops and iterables pass through untouched
+        items = [1, 2, 3]
+        with NULL_PROFILER.stage('parse'):
+            pass
+        assert NULL_PROFILER.iterate('read', items) is items and NULL_PROFILER.report() == ''
+        
+    except Exception as e:
+        print(f"Stage profiler test failed: {e}")
+        raise
+
+def test_deduplication():
+    """Test content-hash dedup: prefilter drops, unique index backstop and bounded memory"""
+    print("\nTesting deduplication...")
+    
+    try:
+        import datetime
+        import tempfile
+        from dedup import BloomFilter, Deduplicator, event_hash
+        from storage import SQLiteBackend
+        
+        start = datetime.datetime(2024, 1, 1)
+        rows = [(start + datetime.timedelta(seconds=i), f"10.1.0.{i % 50}", f"user{i % 7}", b"pw",
+                 "failed" if i % 3 else "success", "Dedup test") for i in range(2000)]
+        assert event_hash(rows[0]) == event_hash(rows[0][:3] + (b"other password",) + rows[0][4:]), \
+            "Event hash depends on the password"
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteBackend(os.path.join(tmp, 'dedup.db'))
+            backend.create_schema()
+            
+            deduplicator = Deduplicator(recent_size=500, capacity=1000)
+            writer = backend.writer(max_latency=None, deduplicator=deduplicator)
+            writer.add_many(rows)
+            writer.flush()
+            writer.add_many(rows[-100:])   # recent: dropped without a lookup
+            writer.add_many(rows[:100])    # older: Bloom hit confirmed by one lookup
+            writer.flush()
+            stats = deduplicator.stats()
+            print(f"Dedup stats: {stats}")
+            assert stats['recent_duplicates'] == 100 and stats['confirmed_duplicates'] == 100
+            
+            # A fresh deduplicator knows nothing; the unique index still keeps the table exact
+            restarted = Deduplicator()
+            writer = backend.writer(max_latency=None, deduplicator=restarted)
+            writer.add_many(rows[1000:1100] + [(start, "10.9.9.9", "new", b"pw", "failed", "New")])
+            assert writer.flush() and writer.rows_written == 1, "Replayed rows were written again"
+            total = backend.total_count()
+            backend.close()
+            
+            # Identical lines at different log offsets are distinct events; re-reading an offset is not
+            lines = SQLiteBackend(os.path.join(tmp, 'lines.db'))
+            lines.create_schema()
+            writer = lines.writer(max_latency=None, deduplicator=Deduplicator())
+            writer.add_many([rows[0] + (event_hash(rows[0], f"7:{offset}"),) for offset in (120, 240, 120)])
+            writer.flush()
+            assert lines.total_count() == 2, \
+                f"Expected 2 rows from identical lines, stored {lines.total_count()}"
+            
+            # Rows skipped for any reason other than a stored duplicate fail the batch
+            class ShortWriter(type(writer)):
+                def _write(self, rows):
+                    return super()._write(rows) - 1
+            writer = ShortWriter(lines.connection, max_latency=None, deduplicator=Deduplicator())
+            writer.add_many(rows[1:4])
+            assert not writer.flush() and lines.total_count() == 2, \
+                "A batch with skipped rows was reported as written"
+            lines.close()
+        
+        # Filled to capacity, the Bloom filter stays near its target false positive rate
+        bloom = BloomFilter(capacity=10000, error_rate=0.01)
+        for i in range(10000):
+            bloom.add(event_hash((start, str(i), 'u', None, 'failed', '')))
+        false_positives = sum(event_hash((start, str(i), 'other', None, 'failed', '')) in bloom
+                              for i in range(10000))
+        print(f"Stored {total} rows, Bloom false positive rate {false_positives / 10000:.4f}")
+        assert total == len(rows) + 1 and false_positives / 10000 < 0.03
+        
+    except Exception as e:
+        print(f"Deduplication test failed: {e}")
+        raise
+
+def test_sharding():
+    """Test hash-sharded writes and merged scatter-gather queries against SQLite shards"""
+    print("\nTesting sharding...")
+    
+    try:
+        import datetime
+        import tempfile
+        from event_generator import EventGenerator
+        from sharding import ShardedQueries, ShardedWriter, shard_for
+        from storage import SQLiteBackend
+        
+        ips = [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(20000)]
+        moved = sum(shard_for(ip, 4) != shard_for(ip, 5) for ip in ips) / len(ips)
+        assert 0.15 < moved < 0.25, f"Adding a fifth shard moved {moved:.1%} of IPs, expected about 20%"
+        
+        generator = EventGenerator(['admin', 'root', 'ubuntu'], ['pw'], attacker_share=0.5,
+                                   attacker_count=200, seed=7)
+        rows = generator.generate_batch(20000, start=datetime.datetime(2024, 1, 1), rate=100)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            shards = [SQLiteBackend(os.path.join(tmp, f'shard{i}.db')) for i in range(3)]
+            single = SQLiteBackend(os.path.join(tmp, 'single.db'))
+            for backend in shards + [single]:
+                backend.create_schema()
+            
+            writer = ShardedWriter(shards, batch_size=1000, max_latency=None)
+            writer.add_many(rows)
+            writer.close()
+            reference = single.writer(max_latency=None)
+            reference.add_many(rows)
+            reference.close()
+            print(f"Writer stats: {writer.stats()}")
+            
+            # Every IP lives on exactly one shard
+            owners = {}
+            for index, shard in enumerate(shards):
+                for (ip,) in shard.execute("SELECT DISTINCT source_ip FROM auth_logs"):
+                    owners.setdefault(ip, set()).add(index)
+            assert all(len(owner) == 1 for owner in owners.values()), "An IP was written to more than one shard"
+            
+            queries = ShardedQueries(shards)
+            checks = {
+                'total_count': (queries.total_count(), single.total_count()),
+                'counts_by_status': (queries.counts_by_status(), single.counts_by_status()),
+                'top_source_ips': ([count for _, count in queries.top_source_ips(10)],
+                                   [count for _, count in single.top_source_ips(10)]),
+                'attempts_by_username': (queries.attempts_by_username(),
+                                         sorted(single.attempts_by_username(), key=lambda item: (-item[1], item[0]))),
+                'recent_entries': ([row[1] for row in queries.recent_entries(20)],
+                                   [row[1] for row in single.recent_entries(20)]),
+            }
+            queries.close()
+            for backend in shards + [single]:
+                backend.close()
+        
+        for name, (merged, expected) in checks.items():
+            assert merged == expected, f"{name}: merged {merged} != single database {expected}"
+        print(f"Merged top IP counts: {checks['top_source_ips'][0]}")
+        
+    except Exception as e:
+        print(f"Sharding test failed: {e}")
+        raise
+
+def test_spool_replay():
+    """Test the write-ahead spool: batches survive an outage, corrupt records are skipped, replay is exact"""
+    print("\nTesting spool and replay...")
+    
+    try:
+        import datetime
+        import tempfile
+        from dedup import Deduplicator
+        from spool import Spool, SpoolReplayer
+        from storage import SQLiteBackend, SQLiteBatchWriter
+        
+        start = datetime.datetime(2024, 1, 1)
+        rows = [(start + datetime.timedelta(seconds=i), f"10.2.0.{i % 40}", f"user{i % 5}", b"pw",
+                 "failed" if i % 4 else "success", "Spool test") for i in range(300)]
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteBackend(os.path.join(tmp, 'spool.db'))
+            backend.create_schema()
+            spool = Spool(os.path.join(tmp, 'spool'), fsync=False)
+            
+            # The database is down: batches go to disk and the writer keeps trying to reconnect
+            available = []
+            writer = SQLiteBatchWriter(None, max_latency=None, deduplicator=Deduplicator(), spool=spool,
+                                       connect=lambda: available[0] if available else None,
+                                       reconnect_interval=0)
+            for offset in range(0, 200, 50):
+                writer.add_many(rows[offset:offset + 50])
+                assert writer.flush(), "Batch was lost during the outage"
+            
+            replay_writer = SQLiteBatchWriter(None, max_latency=None, deduplicator=Deduplicator(),
+                                              connect=lambda: available[0] if available else None)
+            replayer = SpoolReplayer(spool, replay_writer, batch_rows=120)
+            assert replayer.replay_once() is None and spool.size() > 0, \
+                "Replay acknowledged rows while the database was down"
+            
+            # Recovery: live writes go straight in, the spool drains in bulk
+            available.append(backend.connection)
+            writer.add_many(rows[200:])
+            writer.flush()
+            replay_writer.connect = lambda: SQLiteBackend(os.path.join(tmp, 'spool.db')).connection
+            while replayer.replay_once():
+                pass
+            stats = spool.stats()
+            print(f"Spool stats: {stats}, writer spooled {writer.spooled_rows}, replayed {replayer.replayed_rows}")
+            assert writer.spooled_rows == 200 and replayer.replayed_rows == 200
+            assert not stats['bytes'] and not stats['lag_seconds']
+            assert backend.total_count() == len(rows), f"Expected {len(rows)} rows, found {backend.total_count()}"
+            replay_writer.close()
+            spool.close()
+            
+            # The brute-force detector sees a batch that failed to commit once, when it is replayed
+            from brute_force_detector import BruteForceDetector
+            
+            class OperationalError(Exception):
+                pass
+            
+            class LostOnCommit:
+                def __init__(self, connection):
+                    self.connection = connection
+                def cursor(self):
+                    return self.connection.cursor()
+                def commit(self):
+                    raise OperationalError("Lost connection during commit")
+                def rollback(self):
+                    self.connection.rollback()
+            
+            detector = BruteForceDetector(failures=3, window_seconds=60, store_alerts=False,
+                                          keys=('source_ip',))
+            retry_spool = Spool(os.path.join(tmp, 'retry'), fsync=False)
+            live = SQLiteBatchWriter(LostOnCommit(backend.connection), max_latency=None,
+                                     deduplicator=Deduplicator(), spool=retry_spool, connect=lambda: None)
+            detector.attach(live)
+            burst = [(start + datetime.timedelta(days=1, seconds=i), "10.3.0.1", "victim", b"pw", "failed",
+                      f"Burst {i}") for i in range(3)]
+            live.add_many(burst)
+            assert live.flush() and not detector.events_seen, "Detector counted a batch that did not commit"
+            replay = SQLiteBatchWriter(backend.connection, max_latency=None, deduplicator=Deduplicator())
+            detector.attach(replay, source='replay')
+            SpoolReplayer(retry_spool, replay).replay_once()
+            print(f"Detector after replay: {detector.stats()}")
+            assert detector.events_seen == 3 and detector.alerts_raised == 1
+            retry_spool.close()
+            
+            # A damaged record fails its checksum: it and the rest of its segment are skipped
+            path = os.path.join(tmp, 'damaged')
+            damaged = Spool(path, fsync=False)
+            for offset in range(0, 90, 30):
+                damaged.append(rows[offset:offset + 30])
+            damaged.close()
+            segment = os.path.join(path, os.listdir(path)[0])
+            with open(segment, 'r+b') as f:
+                f.seek(os.path.getsize(segment) // 2)
+                f.write(b'\xff\xff\xff\xff')
+            reopened = Spool(path, fsync=False)
+            for _ in range(3):
+                reopened.lag()
+                reopened.peek()
+            recovered, position = reopened.peek()
+            reopened.ack(position)
+            print(f"Recovered {len(recovered)} of 90 rows, {reopened.corrupt_records} corrupt record(s)")
+            assert len(recovered) == 30 and reopened.corrupt_records == 1 and not reopened.size()
+            reopened.close()
+            
+            # The replay position survives a restart
+            assert not Spool(os.path.join(tmp, 'spool'), fsync=False).peek()[0], \
+                "Replayed batches were read again after a restart"
+            writer.close()
+        
+    except Exception as e:
+        print(f"Spool test failed: {e}")
+        raise
+
+def test_cli_startup():
+    """Test the CLI import-time budget: --help and simple queries load no heavy dependencies"""
+    print("\nTesting CLI startup time...")
+    
+    try:
+        import subprocess
+        import tempfile
+        import time
+        from storage import SQLiteBackend
+        
+        budget_ms = 100
+        heavy = ('mysql', 'dotenv', 'faker', 'numpy', 'cryptography', 'pyarrow', 'http.server')
+        here = os.path.dirname(os.path.abspath(__file__))
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cli.db')
+            backend = SQLiteBackend(path)
+            backend.create_schema()
+            backend.close()
+            
+            commands = [
+                [os.path.join(here, 'cli.py'), '--help'],
+                [os.path.join(here, 'cli.py'), 'query', 'count', '--backend', 'sqlite', '--sqlite-path', path],
+                ['-c', 'import ssh_log_simulator, auth_log_ingest'],
+            ]
+            for command in commands:
+                start = time.perf_counter()
+                result = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=here,
+                                        capture_output=True, text=True)
+                wall_ms = (time.perf_counter() - start) * 1000
+                # -X importtime lines: "import time: self | cumulative | name", nesting shown by indent
+                imported = []
+                total_us = 0
+                for line in result.stderr.splitlines():
+                    if not line.startswith('import time:') or 'cumulative' in line:
+                        continue
+                    _, cumulative, name = line[len('import time:'):].split('|')
+                    imported.append(name.strip())
+                    if not name.startswith('  '):
+                        total_us += int(cumulative)
+                loaded = sorted({name for name in imported if name.split('.')[0] in heavy or name in heavy})
+                label = ' '.join(command[1:]) if command[0] != '-c' else command[1]
+                print(f"{label}: imports {total_us / 1000:.1f} ms, wall {wall_ms:.1f} ms, exit {result.returncode}")
+                assert result.returncode == 0 and not loaded and total_us / 1000 <= budget_ms, \
+                    f"Over budget or loaded heavy modules: {loaded}"
+        
+        # --help only prints usage; it must never run the maintenance task itself
+        from cli import MAINTENANCE_TASKS
+        for task in MAINTENANCE_TASKS:
+            result = subprocess.run([sys.executable, 'cli.py', 'maintenance', task, '--help'], cwd=here,
+                                    capture_output=True, text=True)
+            assert result.returncode == 0 and result.stdout.startswith('usage:'), \
+                f"maintenance {task} --help did not print usage: {result.stdout[:200]}"
+        
+    except Exception as e:
+        print(f"CLI startup test failed: {e}")
+        raise
 
 def test_docker_configuration():
     """Test Docker configuration files"""
@@ -163,26 +1099,20 @@ def test_docker_configuration():
             print(f"{file} missing")
             missing_files.append(file)
     
-    if missing_files:
-        print(f"Missing files: {missing_files}")
-        return False
+    assert not missing_files, f"Missing files: {missing_files}"
     
     # Test Dockerfile syntax
     try:
         with open('Dockerfile', 'r') as f:
             dockerfile_content = f.read()
         
-        if 'FROM python:' in dockerfile_content and 'WORKDIR /app' in dockerfile_content:
-            print("Dockerfile syntax looks correct")
-        else:
-            print("Dockerfile syntax issues detected")
-            return False
+        assert 'FROM python:' in dockerfile_content and 'WORKDIR /app' in dockerfile_content, \
+            "Dockerfile syntax issues detected"
+        print("Dockerfile syntax looks correct")
             
     except Exception as e:
         print(f"Error reading Dockerfile: {e}")
-        return False
-    
-    return True
+        raise
 
 def test_requirements():
     """Test requirements.txt"""
@@ -196,7 +1126,8 @@ def test_requirements():
             'mysql-connector-python',
             'cryptography',
             'python-dotenv',
-            'faker'
+            'faker',
+            'numpy'
         ]
         
         missing_packages = []
@@ -208,15 +1139,11 @@ def test_requirements():
                 print(f"{package} missing from requirements")
                 missing_packages.append(package)
         
-        if missing_packages:
-            print(f"Missing packages: {missing_packages}")
-            return False
-        
-        return True
+        assert not missing_packages, f"Missing packages: {missing_packages}"
         
     except Exception as e:
         print(f"Requirements test failed: {e}")
-        return False
+        raise
 
 def run_local_tests():
     """Run all local tests"""
@@ -226,14 +1153,32 @@ def run_local_tests():
     tests = [
         ("Module Imports", test_imports),
         ("Encryption", test_encryption),
+        ("Envelope Encryption", test_envelope_encryption),
         ("Database Schema", test_database_schema),
         ("Database Connection Logic", test_connection_without_db),
         ("SSH Simulator Logic", test_ssh_simulator_logic),
+        ("Auth Log Parser", test_auth_log_parser),
+        ("Bulk Import Ranges", test_bulk_import_ranges),
+        ("Async Pipeline Backpressure", test_async_pipeline_backpressure),
+        ("Brute-Force Ordering", test_brute_force_ordering),
+        ("Load Generator Pacing", test_load_generator_pacing),
+        ("Event Generator", test_event_generator),
+        ("Benchmark Compare", test_benchmark_compare),
+        ("SQLite Backend", test_sqlite_backend),
+        ("Parquet Archive", test_parquet_archive),
+        ("Query Cache", test_query_cache),
+        ("Metrics Endpoint", test_metrics_endpoint),
+        ("Stage Profiler", test_stage_profiler),
+        ("Deduplication", test_deduplication),
+        ("Sharding", test_sharding),
+        ("Spool Replay", test_spool_replay),
+        ("CLI Startup", test_cli_startup),
         ("Docker Configuration", test_docker_configuration),
         ("Requirements", test_requirements)
     ]
     
     passed = 0
+    skipped = 0
     total = len(tests)
     
     for test_name, test_func in tests:
@@ -241,18 +1186,21 @@ def run_local_tests():
         print("-" * 40)
         
         try:
-            if test_func():
-                passed += 1
-                print(f"{test_name}: PASSED")
-            else:
-                print(f"{test_name}: FAILED")
+            test_func()
+            passed += 1
+            print(f"{test_name}: PASSED")
+        except SkipTest as e:
+            skipped += 1
+            print(f"{test_name}: SKIPPED - {e}")
+        except AssertionError as e:
+            print(f"{test_name}: FAILED - {e}")
         except Exception as e:
             print(f"{test_name}: ERROR - {e}")
     
     print("\n" + "=" * 60)
-    print(f"Test Results: {passed}/{total} tests passed")
+    print(f"Test Results: {passed}/{total} tests passed" + (f", {skipped} skipped" if skipped else ""))
     
-    if passed == total:
+    if passed + skipped == total:
         print("All local tests passed!")
         print("\n Next steps:")
         print("   1. Start Docker Desktop")